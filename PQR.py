@@ -1,5 +1,3 @@
-from lxml import etree
-from docx import Document
 from docx.shared import RGBColor
 from docx.enum.text import WD_BREAK
 from docx.oxml import OxmlElement
@@ -9,139 +7,114 @@ import re
 import os
 from docx.shared import Inches
 from docx.shared import RGBColor
-from html import unescape
+from pqr_loops import ParagraphTemplate, expansion_rows
+from pqr_progress import count_content
+from pqr_stream import StreamingDocxWriter
+from pqr_template import new_document
+from pqr_toc import TOC_INDENT, TOC_TITLE, TableOfContents, add_internal_link
+from pqr_survey import (
+    QUESTION_TYPES, ENTER, EXIT, Survey, traverse, local, safe, clean_html, split_list_items,
+    title_html, question_is_yellow, is_hidden, extract_tooltip_from_xml,
+    resolve_definition_text, strip_hides_define_cond, get_display_cond,
+    resolve_uses_question_name, is_optional_shown, get_numeric_range, get_row_text,
+    parse_groups, get_any_cond, get_attr, is_noanswer,
+    group_rows_by_group, format_option, get_shuffle_logic, options_in_order, OmittedOptions,
+    reference_text,
+)
 
 LOGIC_RED = RGBColor(255, 0, 0)
 INFO_BLUE = RGBColor(68, 114, 196)
 GRAY_TEXT = RGBColor(128, 128, 128)
 YELLOW_TEXT = RGBColor(255, 192, 0)
 
-# =========================
-# GLOBAL CONSTANTS
-# =========================
-
-
-EXPORT_START_LABEL = "te1"
-EXPORT_END_LABEL = "b3"
-
-EXPORT_ENABLED = False
-
 # =========================
 # ENTRY POINT (FILE BASED)
 # =========================
-def generate_word_from_xml_file(xml_path, output_path):
-    parser = etree.XMLParser(recover=True)
-    tree = etree.parse(xml_path, parser)
-    root = tree.getroot()
-
-    doc = Document()
-
-    # =========================
-    # HELPERS
-    # =========================
-    def local(tag):
-        return etree.QName(tag).localname.lower()
-
-    def safe(text):
-        return text.strip() if text else ""
-
-    # =========================
-    # SURVEY NAME DETECTION (ALT FIX)
-    # =========================
-    def get_survey_name(root, default="Survey Specification Document"):
-        # 1. Root <survey alt="...">
-        if root.get("alt"):
-            return root.get("alt").strip()
-
-        # 2. <survey alt="..."> anywhere
-        survey_node = root.xpath('.//*[local-name()="survey"]')
-        if survey_node and survey_node[0].get("alt"):
-            return survey_node[0].get("alt").strip()
-
-        # 3. title / name / label attributes
-        for attr in ("title", "name", "label"):
-            if root.get(attr):
-                return root.get(attr).strip()
-
-        # 4. <title> node
-        title_node = root.xpath('./*[local-name()="title"]')
-        if title_node and title_node[0].text:
-            return title_node[0].text.strip()
-
-        return default
-
+def generate_word_from_xml_file(xml_path, output_path, selection=None, cancel=None, expand_loops=False,
+                                progress=None, reference_report=False, toc=False):
+    """
+    Renders xml_path to a .docx written to output_path.
+    output_path may be a file path or a writable file object (stream).
+    selection is an ExportSelection (default: the te1 ... b3 range).
+    cancel is an optional CancelToken checked between elements; a
+    cancelled render raises ExportCancelled and leaves no file behind.
+    expand_loops repeats looprow loop content once per iteration with the
+    [loopvar: x] values filled in.
+    progress (ExportProgress) receives the phase, blocks / questions done
+    and bytes written as the render goes.
+    reference_report appends the dangling references and the questions
+    nobody references (whole survey).
+    toc adds a static table of contents after the legend, linked to
+    bookmarks at the loop, block and question headings.
+    """
+    if progress is not None:
+        progress.update(phase="parsing")
+    generate_word_from_survey(Survey.from_file(xml_path), output_path, selection, cancel, expand_loops,
+                              progress, reference_report, toc)
+
+def generate_word_from_survey(survey, output_path, selection=None, cancel=None, expand_loops=False,
+                              progress=None, reference_report=False, toc=False):
+    """
+    Same as generate_word_from_xml_file for an already parsed Survey
+    """
+    root = survey.root
+
+    def check_cancelled():
+        if cancel is not None:
+            cancel.check()
+
+    # Clone of the cached base document (legend + resolved style ids)
+    doc, STYLE_IDS = new_document()
 
     INFO_BLUE = RGBColor(68, 114, 196)  # same blue as question header
 
+    def add_paragraph(text="", style=None):
+        """
+        doc.add_paragraph with the style id looked up once per process
+        instead of by name for every paragraph
+        """
+        p = doc.add_paragraph(text)
+        if style is not None:
+            p._p.style = STYLE_IDS[style]
+        return p
 
-    doc = Document()
+    def add_heading(text="", level=1):
+        return add_paragraph(text, "Title" if level == 0 else f"Heading {level}")
 
-    SURVEY_NAME = get_survey_name(root)
-    heading = doc.add_heading(SURVEY_NAME, level=1)
+    # Title goes above the legend that is already in the base document
+    SURVEY_NAME = survey.name
+    heading = add_heading(SURVEY_NAME, level=1)
     heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    doc.element.body.insert(0, heading._p)
 
 
     def red_text(text, style=None, bold_flag=False):
-        p = doc.add_paragraph(style=style) if style else doc.add_paragraph()
+        p = add_paragraph(style=style) if style else add_paragraph()
         r = p.add_run(text)
         r.font.color.rgb = RGBColor(255, 0, 0)
         r.bold = bold_flag
         return p
 
     def blue_text(text, style=None, bold_flag=False):
-        p = doc.add_paragraph(style=style) if style else doc.add_paragraph()
+        p = add_paragraph(style=style) if style else add_paragraph()
         r = p.add_run(text)
         r.font.color.rgb = RGBColor(0, 0, 255)
         r.bold = bold_flag
         return p
     
     def yellow_text(text, style=None, bold_flag=False):
-        p = doc.add_paragraph(style=style) if style else doc.add_paragraph()
+        p = add_paragraph(style=style) if style else add_paragraph()
         r = p.add_run(text)
         r.font.color.rgb = RGBColor(255, 192, 0)
         r.bold = bold_flag
         return p
 
-    # =========================
-    # LEGEND / INSTRUCTIONS
-    # =========================
-
-    # Red bullet – Programming Logic
-    p1 = doc.add_paragraph(style="List Bullet")
-    r1 = p1.add_run("Red highlighted for Programming Logic")
-    r1.bold = True
-    r1.font.color.rgb = RGBColor(255, 0, 0)
-
-    # Blue bullet – Instructions
-    p2 = doc.add_paragraph(style="List Bullet")
-    r2 = p2.add_run("Blue highlighted for Instructions")
-    r2.bold = True
-    r2.font.color.rgb = RGBColor(68, 114, 196)
-    
-    # Yellow bullet – Hidden Questions
-    p3 = doc.add_paragraph(style="List Bullet")
-    r3 = p3.add_run("All hidden question label will be highlighted in yellow")
-    r3.bold = True
-    r3.font.color.rgb = RGBColor(255, 192, 0)
-
-    # =========================
-    # QUESTION_TYPES
-    # =========================
-    QUESTION_TYPES = {"radio", "checkbox", "select", "text", "textarea", "number", "float"}
-
     # =========================
     # HELPERS
     # =========================
 
     LAST_ELEMENT_WAS_SUSPEND = False
     
-    def clean_html(text):
-        # Remove span and br tags
-        text = re.sub(r"</?span[^>]*>", "", text, flags=re.IGNORECASE)
-        text = re.sub(r"<br\s*/?>", "\n", text, flags=re.IGNORECASE)
-        return text.strip()
-
-
     def add_html_with_lists(doc, parent_paragraph, html_text):
         """
         Converts <ul><li />Text into real Word bullet points
@@ -150,39 +123,16 @@ def generate_word_from_xml_file(xml_path, output_path):
         if not html_text:
             return
 
-        html_text = unescape(html_text)
-
-        # Remove <ul> tags
-        html_text = re.sub(r"</?ul[^>]*>", "", html_text, flags=re.IGNORECASE)
-
-        # Split on <li /> or <li/>
-        items = re.split(r"<li\s*/\s*>", html_text, flags=re.IGNORECASE)
-
-        # First item = text before first <li />
-        first = items.pop(0).strip()
+        first, items = split_list_items(html_text)
         if first:
             add_text_with_inline_html(parent_paragraph, clean_html(first))
 
         # Remaining items = bullets
-        for item in items:
-            text = clean_html(item).strip()
-            if not text:
-                continue
-
-            bp = doc.add_paragraph(style="List Bullet")
+        for text in items:
+            bp = add_paragraph(style="List Bullet")
             add_text_with_inline_html(bp, text)
 
 
-    def question_is_yellow(q):
-        where = q.get("where", "")
-        if not where:
-            return False
-
-        where_parts = {w.strip().lower() for w in where.split(",")}
-        trigger_values = {"survey", "notdp", "execute", "report", "none"}
-
-        return bool(where_parts & trigger_values)
-
     def shade_question_block(paragraphs, fill="FFF2CC"):
         """
         Applies background shading to a list of paragraphs
@@ -213,97 +163,14 @@ def generate_word_from_xml_file(xml_path, output_path):
 
         pPr.append(shd)
 
-    def extract_tooltip_from_text(text):
-
-        if not text:
-            return text, None, None
-
-        text = unescape(text)
-
-        pattern = re.compile(
-            r'<span\s+class="tooltip">\s*(.*?)\s*'
-            r'<span\s+class="tooltiptext">\s*(.*?)\s*</span>\s*</span>',
-            flags=re.IGNORECASE | re.DOTALL
-        )
-
-        m = pattern.search(text)
-        if not m:
-            return text, None, None
-
-        label = m.group(1).strip()
-        definition = m.group(2).strip()
-
-        clean_text = pattern.sub(label, text)
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-
-        return clean_text, label, definition
-
     def add_prefixed_rich_text(prefix, html_text):
 
-        p = doc.add_paragraph()
+        p = add_paragraph()
         r = p.add_run(f"{prefix}: ")
         r.bold = True
 
         add_text_with_inline_html(p, html_text)
 
-    def extract_tooltip_from_xml(title_elem):
-        """
-        Supports:
-        1) Real XML tooltip spans
-        2) Escaped HTML tooltip spans
-        """
-
-        # ---------- CASE 1: REAL XML TOOLTIP ----------
-        tooltip = title_elem.xpath(
-            './/*[local-name()="span" and @class="tooltip"]'
-        )
-
-        if tooltip:
-            tooltip = tooltip[0]
-            label = (tooltip.text or "").strip()
-
-            tooltiptext = tooltip.xpath(
-                './/*[local-name()="span" and @class="tooltiptext"]'
-            )
-
-            definition = (
-                ''.join(tooltiptext[0].itertext()).strip()
-                if tooltiptext else None
-            )
-
-            parts = []
-            for node in title_elem.iter():
-                if node is tooltip:
-                    parts.append(label)
-                elif node.getparent() is tooltip:
-                    continue
-                elif node.text:
-                    parts.append(node.text)
-
-            clean_text = ' '.join(' '.join(parts).split())
-            return clean_text, label, definition
-
-        # ---------- CASE 2: ESCAPED HTML TOOLTIP ----------
-        raw_text = ''.join(title_elem.itertext()).strip()
-        return extract_tooltip_from_text(raw_text)
-
-    def resolve_definition_text(text, q):
-        """
-        Resolves ${res.X} → resource text
-        """
-        if not text:
-            return None
-
-        m = re.match(r'\$\{res\.(\w+)\}', text)
-        if m:
-            return get_resource_text(q, m.group(1))  # your existing function
-
-        return text
-
-    def get_resource_text(q, resource_name):
-        # example implementation
-        return q.get("resources", {}).get(resource_name, "")
-
     def hex_to_rgb(hex_color):
         hex_color = hex_color.lstrip("#")
         if len(hex_color) == 6:
@@ -377,43 +244,6 @@ def generate_word_from_xml_file(xml_path, output_path):
             if c.tail:
                 add_text_with_inline_html(p, c.tail)
 '''
-    def should_export(elem):
-        """
-        Controls export range between te1 and b3
-        """
-        global EXPORT_ENABLED
-
-        label = elem.get("label")
-
-        # Start marker (do NOT export te1)
-        if label == EXPORT_START_LABEL:
-            EXPORT_ENABLED = True
-            return False
-
-        # End marker (do NOT export b3)
-        if label == EXPORT_END_LABEL:
-            EXPORT_ENABLED = False
-            return False
-
-        return EXPORT_ENABLED
-
-
-    def strip_hides_define_cond(q):
-        """
-        If question has strip="cond", suppress define-level condition display
-        """
-        return q is not None and q.get("strip", "").lower() == "cond"
-
-
-    def get_display_cond(elem):
-        """
-        Returns display condition for both XML elements and define dicts
-        """
-        if isinstance(elem, dict):
-            return elem.get("cond")
-        return elem.get("cond")
-
-
     def add_layout_logic(q):
         """
         Displays keepWith / rightOf layout rules in Word export
@@ -424,7 +254,7 @@ def generate_word_from_xml_file(xml_path, output_path):
         if not keep_with and not right_of:
             return
 
-        p = doc.add_paragraph()
+        p = add_paragraph()
 
         if keep_with:
             r = p.add_run(f"Layout Logic: Keep with {keep_with} (Same Page)")
@@ -437,121 +267,23 @@ def generate_word_from_xml_file(xml_path, output_path):
             r.font.color.rgb = LOGIC_RED
 
 
-    RES_VAR_PATTERN = re.compile(r"\$\{res\.([A-Za-z0-9_]+)\}")
-
-    def resolve_res_value(text):
-        """
-        Replaces ${res.X} with actual <res label="X">value</res>
-        """
-        if not text:
-            return text
-
-        def replacer(match):
-            var = match.group(1)
-            return RES_VALUES.get(var, var)  # fallback to var name if missing
-
-        return RES_VAR_PATTERN.sub(replacer, text)
-
-
-    def resolve_uses_question_name(q):
-        """
-        Returns human-readable question name based on uses / atleast attributes
-        """
-        uses = q.get("uses", "")
-        atleast = q.get("atleast")
-
-        if not uses:
-            return None
-
-        uses = uses.lower()
-
-        # Date
-        if uses.startswith("fvdatepicker"):
-            return "Date Question"
-
-        # Card Rating
-        if uses.startswith("cardrating"):
-            return "Card Rating Question"
-
-        # Slider variants
-        if uses.startswith("sliderpoints"):
-            return "Slider Rating Question"
-
-        if uses.startswith("slidernumber"):
-            return "Slider Question"
-
-        if uses.startswith("sliderdecimal"):
-            return "Slider Decimal Question"
-
-        # Card Sort
-        if uses.startswith("cardsort"):
-            if atleast and atleast.isdigit() and int(atleast) > 1:
-                return "Card Sort Multi Select Question"
-            return "Card Sort Single Select Question"
-
-        # Autosum
-        if uses.startswith("autosum"):
-            return "Autosum Question"
-
-        # Rank Sort (multiple versions)
-        if uses.startswith("ranksort"):
-            return "Ranksort Question"
-
-        # This That
-        if uses.startswith("leftright"):
-            return "This-That Question"
-
-        if uses.startswith("imgmap"):
-            return "Image highlighter Question"
-
-        if uses.startswith("hottext"):
-            return "Text highlighter Question"
-
-        if uses.startswith("autosuggest"):
-            return "Autosuggest Question"
-
-        return None
-
-
-    def local(tag):
-        return etree.QName(tag).localname.lower()
-
     def show_optional_if_needed(q):
-        qtype = local(q.tag)
-        optional = q.get("optional")
-
-        if qtype in {"number", "text", "textarea"}:
-            # Explicit optional
-            if optional == "1":
-                show = True
-            # Default optional for text / textarea
-            elif qtype in {"text", "textarea"} and optional is None:
-                show = True
-            else:
-                show = False
-
-            if show:
-                p = doc.add_paragraph()
-                r = p.add_run("Optional Question")
-                r.bold = True
-                r.font.color.rgb = RGBColor(255, 0, 0)
+        if is_optional_shown(q):
+            p = add_paragraph()
+            r = p.add_run("Optional Question")
+            r.bold = True
+            r.font.color.rgb = RGBColor(255, 0, 0)
 
 
     '''
     def add_separator_line():
-        p = doc.add_paragraph()
+        p = add_paragraph()
         r = p.add_run("—" * 35)
         r.bold = True
     '''
 
-    def get_row_text(row):
-        if isinstance(row, dict):
-            return safe(row.get("text"))
-        return safe(row.text)
-
-
     def add_horizontal_line():
-        p = doc.add_paragraph()
+        p = add_paragraph()
 
         p_pr = p._p.get_or_add_pPr()
 
@@ -567,92 +299,16 @@ def generate_word_from_xml_file(xml_path, output_path):
         p_pr.append(p_bdr)
 
 
-    from html import unescape
-
-    def parse_groups(q):
-        """
-        Returns:
-        groups: {group_label: clean_group_text}
-        """
-        groups = {}
-
-        for g in q.xpath('./*[local-name()="group"]'):
-            label = g.get("label")
-            if not label:
-                continue
-
-            # Convert XML to HTML string
-            text = etree.tostring(g, encoding="unicode", method="html")
-
-            # Remove opening and closing <group> tags
-            text = re.sub(r'</?group[^>]*>', '', text, flags=re.IGNORECASE)
-
-            # Decode HTML entities (&lt;b&gt; → <b>)
-            text = unescape(text)
-
-            # Final safety cleanup (JUST IN CASE)
-            text = text.replace('</group>', '').strip()
-
-            groups[label] = text
-
-        return groups
-
-
-    ZERO_TOKEN = re.compile(r'(?<![\w.])0(?![\w.])')
-    def is_hidden(elem):
-        if elem is None:
-            return False
-
-        cond = elem.get("cond")
-        if not cond:
-            return False
-
-        cond_clean = cond.strip().lower()
-
-        # 1️⃣ Exact hidden
-        if cond_clean == "0":
-            return True
-
-        # 2️⃣ Starts with "0 and ..."
-        if re.match(r'^0\s*(and|&&)\b', cond_clean):
-            return True
-
-        # 3️⃣ Contains "... and 0 ..." (standalone zero)
-        if re.search(r'\b(and|&&)\s*0\b', cond_clean):
-            return True
-
-        if re.search(r'(and|&&)\s*(?<![\w.])0(?![\w.])', cond_clean):
-            return True
-
-        return False
-
-
-    def safe(text):
-        return text.strip() if text else ""
-
-    def get_any_cond(elem, cond_type):
-        for k, v in elem.attrib.items():
-            if k.lower() == cond_type.lower():
-                return v
-        return None
-
     def bold(text):
-        p = doc.add_paragraph()
+        p = add_paragraph()
         r = p.add_run(text)
         r.bold = True
         return p
 
-    def parse_exclude(exclude_value):
-
-        if not exclude_value:
-            return set()
-        return {x.strip().lower() for x in exclude_value.split(",")}
-
-
     #from docx.shared import RGBColor
 
     def add_info_rich_text(elem):
-        p = doc.add_paragraph()
+        p = add_paragraph()
 
         def walk(node):
             if node.text:
@@ -682,24 +338,9 @@ def generate_word_from_xml_file(xml_path, output_path):
 
         walk(elem)
 
-    def get_attr(elem, *names):
-
-        for k, v in elem.attrib.items():
-            if "}" in k:
-                lname = k.split("}", 1)[1]
-            elif ":" in k:
-                lname = k.split(":", 1)[1]
-            else:
-                lname = k
-
-            if lname in names:
-                return v
-        return None
-
-
     def add_option_rich_text(elem, label_prefix, flags, cond_type=None, parent_q=None):
 
-        p = doc.add_paragraph(style="List Continue")
+        p = add_paragraph(style="List Continue")
 
         # Label
         r = p.add_run(f"{label_prefix}: ")
@@ -742,7 +383,7 @@ def generate_word_from_xml_file(xml_path, output_path):
 
 
             # Shuffle / Order logic (OPTION LEVEL)
-            shuffle_logic = get_shuffle_logic(elem)
+            shuffle_logic = get_shuffle_logic(elem) if profile.logic else []
             for s in shuffle_logic:
                 sr = p.add_run(f" ({s})")
                 sr.bold = True
@@ -753,6 +394,10 @@ def generate_word_from_xml_file(xml_path, output_path):
         else:
             add_text_with_inline_html(p, elem.get("text", ""))
 
+        # Respondent view: the option text only
+        if not profile.logic:
+            return
+
 
         # Flags
         for f in flags:
@@ -795,114 +440,22 @@ def generate_word_from_xml_file(xml_path, output_path):
             nr.font.color.rgb = LOGIC_RED
 
 
-    # =========================
-    # ANCHOR DETECTION
-    # =========================
-    ANCHOR_KEYWORDS = (
-        "other", "none", "dk", "don't know",
-        "dont know", "na", "n/a", "not applicable"
-    )
-
-    def is_anchor_text(text):
-        t = text.lower().strip()
-        return any(t.startswith(k) for k in ANCHOR_KEYWORDS)
-
-    # =========================
-    # NO ANSWER DETECTION (NEW)
-    # =========================
-    def is_noanswer(elem):
-        if isinstance(elem, dict):
-            return elem.get("noanswer") == "1"
-        return local(elem.tag) == "noanswer" or elem.get("noanswer") in {"1", "true", "yes"}
-
-
-    # =========================
-    # GROUPS
-    # =========================
-    from collections import OrderedDict
-
-    def group_rows(rows):
-        """
-        Returns:
-        grouped_rows: OrderedDict {group_label: [rows]}
-        ungrouped_rows: [rows]
-        """
-        grouped = OrderedDict()
-        ungrouped = []
-
-        for r in rows:
-            grp = r.get("groups") if not isinstance(r, dict) else r.get("groups")
-            if grp:
-                for g in grp.split(","):
-                    grouped.setdefault(g.strip(), []).append(r)
-            else:
-                ungrouped.append(r)
-
-        return grouped, ungrouped
-
-    def group_rows_by_group(rows):
-        grouped = {}
-        ungrouped = []
-
-        for r in rows:
-            grp = r.get("groups") if not isinstance(r, dict) else r.get("groups")
-            if grp:
-                for g in grp.split(","):
-                    grouped.setdefault(g.strip(), []).append(r)
-            else:
-                ungrouped.append(r)
+    # Selected subtrees and the path down to them; the walk never visits
+    # anything else
+    visible = survey.select(selection)
 
-        return grouped, ungrouped
+    # Content categories to render (full / logic-only / respondent-view /
+    # no-hidden); where= questions are already left out by traverse()
+    profile = visible.profile
 
-    def get_row_text(r):
-        return r.get("text") if isinstance(r, dict) else safe(r.text)
-    # =========================
-    # DEFINES
-    # =========================
-    DEFINES = {}
-
-    for d in root.xpath('.//*[local-name()="define"]'):
-        label = d.get("label")
-        if not label:
-            continue
-
-        items = []
-        for r in d.xpath(
-            './/*[local-name()="row" or local-name()="col" '
-            'or local-name()="choice" or local-name()="value" '
-            'or local-name()="noanswer"]'
-        ):
-            items.append({
-                "tag": local(r.tag),
-                "label": r.get("label", ""),
-                "text": safe(r.text),
-                "randomize": r.get("randomize"),
-                "exclusive": r.get("exclusive"),
-                "cond": r.get("cond"),
-                "rowCond": r.get("rowCond"),
-                "colCond": r.get("colCond"),
-                "choiceCond": r.get("choiceCond"),
-                "noanswer": "1" if local(r.tag) == "noanswer" else r.get("exclusive")
-            })
-
-        DEFINES[label] = items
-
-    # =========================
-    # RES VALUES (res resolver)
-    # =========================
-    RES_VALUES = {}
-
-    for r in root.xpath('.//*[local-name()="res"]'):
-        label = r.get("label")
-        value = safe("".join(r.itertext()))
-        if label:
-            RES_VALUES[label] = value
+    # (first, last) options kept per list in a sampled export, else None
+    sample = visible.sample
 
     # =========================
     # RICH TEXT
     # =========================
     def add_rich_text(elem, prefix=None):
-        p = doc.add_paragraph()
+        p = add_paragraph()
         if prefix:
             r = p.add_run(prefix)
             r.bold = True
@@ -940,16 +493,14 @@ def generate_word_from_xml_file(xml_path, output_path):
     # TERM / EXEC
     # =========================
     def add_flow(elem):
-        if not should_export(elem):
-            return
-        if is_hidden(elem):
+        if is_hidden(elem) or not profile.logic:
             return    
 
         tag = local(elem.tag)
         if tag == "term":
             cond = elem.get("cond", "").strip()
 
-            p = doc.add_paragraph()
+            p = add_paragraph()
             text = "🚫 Terminate Logic"
             if cond:
                 text += f" : {cond}"
@@ -963,7 +514,7 @@ def generate_word_from_xml_file(xml_path, output_path):
     def add_flow(elem):
         tag = local(elem.tag)
         if tag == "term":
-            p = doc.add_paragraph()
+            p = add_paragraph()
             r = p.add_run("🚫 Terminate Logic")
             r.bold = True
             r.font.color.rgb = RGBColor(255, 0, 0)
@@ -994,9 +545,6 @@ def generate_word_from_xml_file(xml_path, output_path):
             LAST_ELEMENT_WAS_SUSPEND = False
             return
 
-        if not should_export(elem):
-            return
-
         tag = local(elem.tag)
 
         # =========================
@@ -1006,21 +554,24 @@ def generate_word_from_xml_file(xml_path, output_path):
             LAST_ELEMENT_WAS_SUSPEND = False
 
             label = elem.get("label", "").strip()
-            cond = elem.get("cond")
+            cond = elem.get("cond") if profile.logic else None
+            if not (profile.text or cond):
+                return
 
             if label:
-                p = doc.add_paragraph()
+                p = add_paragraph()
                 r = p.add_run(f"{label} (🅘 Information)")
                 r.bold = True
                 r.font.color.rgb = INFO_BLUE
 
             if cond:
-                p = doc.add_paragraph()
+                p = add_paragraph()
                 r = p.add_run(f"Display Condition: {cond}")
                 r.bold = True
                 r.font.color.rgb = LOGIC_RED
 
-            add_info_rich_text(elem)
+            if profile.text:
+                add_info_rich_text(elem)
 
         # =========================
         # SUSPEND (PAGE BREAK LOGIC)
@@ -1034,72 +585,29 @@ def generate_word_from_xml_file(xml_path, output_path):
 
             LAST_ELEMENT_WAS_SUSPEND = True
 
-            p = doc.add_paragraph()
+            p = add_paragraph()
             r = p.add_run("—" * 35)
             r.bold = True
             #r.font.color.rgb = LOGIC_RED
 
-            cond = elem.get("cond")
+            cond = elem.get("cond") if profile.logic else None
             if cond:
-                pr = doc.add_paragraph()
+                pr = add_paragraph()
                 rr = pr.add_run(f"Display Condition: {cond}")
                 rr.bold = True
                 rr.font.color.rgb = LOGIC_RED
 
-    # =========================
-    # INSERT
-    # =========================
-    #def resolve_insert(elem):
-        #return DEFINES.get(elem.get("source"), [])
-
-    def resolve_insert(elem):
-        source = elem.get("source")
-        items = DEFINES.get(source, [])
-
-        exclude_set = parse_exclude(elem.get("exclude"))
-
-        if not exclude_set:
-            return items
-
-        filtered = []
-        for item in items:
-            label = item.get("label", "").lower()
-            tag = item.get("tag")
-
-            # Match r / c / ch prefixes
-            if label and any(
-                label == ex or label.startswith(ex)
-                for ex in exclude_set
-            ):
-                continue
-
-            filtered.append(item)
-
-        return filtered
-
     # =========================
     # OPTION FORMAT
     # =========================
-    def format_option(elem, text):
-        flags = []
-        anchor = is_anchor_text(text)
-
-        randomize = elem.get("randomize") if not isinstance(elem, dict) else elem.get("randomize")
-        exclusive = elem.get("exclusive") if not isinstance(elem, dict) else elem.get("exclusive")
-        open_flag = elem.get("open") if not isinstance(elem, dict) else elem.get("open")
-
-        if open_flag == "1" or randomize == "0" or is_anchor_text(text):
-            flags.append("anchor")
-
-        # Exclusive
-        if exclusive == "1":
-            flags.append("exclusive")
-
-        return text, flags, False
-
+    def add_omitted(marker):
+        p = add_paragraph(style="List Continue")
+        r = p.add_run(f"… {marker.count} more ({marker.total} in total)")
+        r.italic = True
+        r.font.color.rgb = GRAY_TEXT
 
     def write_option(elem, text, flags, cond_type=None):
-        p = doc.add_paragraph(style="List Continue")
+        p = add_paragraph(style="List Continue")
 
         # Option text (normal)
         p.add_run(text)
@@ -1129,82 +637,6 @@ def generate_word_from_xml_file(xml_path, output_path):
             r.bold = True
             r.font.color.rgb = LOGIC_RED
 
-    def get_shuffle_logic(elem):
-        """
-        Reads shuffle / order attributes and returns readable logic text
-        """
-        logic = []
-
-        shuffle = elem.get("shuffle")
-        sortRows = elem.get("sortRows")
-        rowShuffle = elem.get("rowShuffle")
-        colShuffle = elem.get("colShuffle")
-
-
-        if shuffle:
-            shuffle = shuffle.lower()
-
-            if shuffle == "rows":
-                logic.append("Randomize Rows")
-            elif shuffle == "cols":
-                logic.append("Randomize Columns")
-            elif shuffle == "choice":
-                logic.append("Randomize Choices")
-            elif shuffle == "rows,groups":
-                logic.append("Randomize Rows and Groups")
-
-        if rowShuffle:
-            rowShuffle = rowShuffle.lower()
-
-            if rowShuffle == "flip" and shuffle == "rows":
-                logic.append("Flip Rows")
-            elif rowShuffle == "rflip" and shuffle == "rows":
-                logic.append("Reverse Flip Rows")
-            elif rowShuffle == "rotate" and shuffle == "rows":
-                logic.append("Rotate Options")
-            elif rowShuffle == "rrotate" and shuffle == "rows":
-                logic.append("Reverse Rotate Options")
-
-        if colShuffle:
-            colShuffle = colShuffle.lower()
-
-            if colShuffle == "flip" and shuffle == "cols":
-                logic.append("Flip Column")
-            elif colShuffle == "rflip" and shuffle == "cols":
-                logic.append("Reverse Flip Column")
-            elif colShuffle == "rotate" and shuffle == "cols":
-                logic.append("Rotate Options")
-            elif colShuffle == "rrotate" and shuffle == "cols":
-                logic.append("Reverse Rotate Options")
-
-        if sortRows:
-            sortRows = sortRows.lower()
-        if sortRows == "asc":
-            logic.append("Alphabatic Order")
-        elif sortRows == "dsc":
-            logic.append("Reverse Alphabatic Order")
-
-
-        return logic
-    # =========================
-    # SORT OPTIONS (UPDATED)
-    # =========================
-    def sort_options(items):
-        normal, anchor, noanswer = [], [], []
-
-        for o in items:
-            text = o["text"] if isinstance(o, dict) else safe(o.text)
-
-            if is_noanswer(o):
-                noanswer.append(o)
-            elif is_anchor_text(text):
-                anchor.append(o)
-            else:
-                normal.append(o)
-
-        return normal + anchor + noanswer
-
-
     # ✅ Add page break ONLY if suspend was shown before this question
     if LAST_ELEMENT_WAS_SUSPEND:
         doc.add_page_break()
@@ -1214,8 +646,6 @@ def generate_word_from_xml_file(xml_path, output_path):
     # QUESTION
     # =========================
     def render_question(q):
-        if not should_export(q):
-            return
         if is_hidden(q):
             return
         has_term = False
@@ -1232,7 +662,8 @@ def generate_word_from_xml_file(xml_path, output_path):
         qtype = local(q.tag).upper()
 
         uses_name = resolve_uses_question_name(q)
-        p = doc.add_heading("", level=4)
+        p = add_heading("", level=4)
+        mark(p, "question", label)
 
         is_yellow = question_is_yellow(q)
 
@@ -1263,27 +694,25 @@ def generate_word_from_xml_file(xml_path, output_path):
             doc.add_heading(f"{label} ({qtype})", level=4)
         '''
         # Display condition
-        if q.get("cond"):
+        if profile.logic and q.get("cond"):
             red_text(f"Display Condition: {q.get('cond')}")
 
         # Render question text
         #add_rich_text(title_elem, "Question: ")
-        p = doc.add_paragraph()
-        r = p.add_run("Question: ")
-        r.bold = True
-
-        html_text = etree.tostring(title_elem, encoding="unicode", method="html")
-        html_text = re.sub(r"</?title[^>]*>", "", html_text)
+        if profile.text:
+            p = add_paragraph()
+            r = p.add_run("Question: ")
+            r.bold = True
 
-        add_html_with_lists(doc, p, html_text)
+            add_html_with_lists(doc, p, title_html(title_elem))
 
 
     
         # Add tooltip definition directly below question
-        if label and definition:
+        if profile.text and label and definition:
             resolved_def = resolve_definition_text(definition, q)
 
-            dp = doc.add_paragraph()
+            dp = add_paragraph()
             dp.add_run("Definition: ").bold = True
             dp.add_run(resolved_def)
 
@@ -1292,75 +721,51 @@ def generate_word_from_xml_file(xml_path, output_path):
         # Resolve uses-based question name
     
     
-        # Numeric (number / float) metadata
-        add_numeric_metadata(q)
+        if profile.logic:
+            # Numeric (number / float) metadata
+            add_numeric_metadata(q)
 
-        # Optional flag
-        show_optional_if_needed(q)
+            # Optional flag
+            show_optional_if_needed(q)
 
-        # Layout logic (keepWith / rightOf)
-        add_layout_logic(q)
+            # Layout logic (keepWith / rightOf)
+            add_layout_logic(q)
 
         # Render comments / instructions
-        comment = q.xpath('.//*[local-name()="comment"]')
+        comment = q.xpath('.//*[local-name()="comment"]') if profile.text else None
         if comment:
             add_rich_text(comment[0], "Respondent Instruction: ")
 
-        # Question-level row / col / choice conditions
-        for cond_type, label in [
-            ("rowCond", "Row Condition"),
-            ("colCond", "Column Condition"),
-            ("choiceCond", "Choice Condition"),
-        ]:
-            q_cond = get_any_cond(q, cond_type)
-            if q_cond:
-                p = doc.add_paragraph()
-                r = p.add_run(f"{label}: {q_cond}")
+        if profile.logic:
+            # Question-level row / col / choice conditions
+            for cond_type, label in [
+                ("rowCond", "Row Condition"),
+                ("colCond", "Column Condition"),
+                ("choiceCond", "Choice Condition"),
+            ]:
+                q_cond = get_any_cond(q, cond_type)
+                if q_cond:
+                    p = add_paragraph()
+                    r = p.add_run(f"{label}: {q_cond}")
+                    r.bold = True
+                    r.font.color.rgb = RGBColor(255, 0, 0)
+
+            # Shuffle / Order logic
+            shuffle_logic = get_shuffle_logic(q)
+            for s in shuffle_logic:
+                p = add_paragraph()
+                r = p.add_run(s)
                 r.bold = True
-                r.font.color.rgb = RGBColor(255, 0, 0)
-
-        # Shuffle / Order logic
-        shuffle_logic = get_shuffle_logic(q)
-        for s in shuffle_logic:
-            p = doc.add_paragraph()
-            r = p.add_run(s)
-            r.bold = True
-            r.font.color.rgb = LOGIC_RED
-
-        # Process rows, columns, choices
-        rows, cols, choices = [], [], []
-
-        for e in q.xpath(
-            './/*[local-name()="row" or local-name()="col" '
-            'or local-name()="choice" or local-name()="value" '
-            'or local-name()="noanswer"]'
-        ):
-            if is_hidden(e):
-                continue
-            tag = local(e.tag)
-            if tag == "row":
-                rows.append(e)
-            elif tag == "col":
-                cols.append(e)
-            else:
-                choices.append(e)
+                r.font.color.rgb = LOGIC_RED
 
-        # Process <insert> elements
-        for ins in q.xpath('./*[local-name()="insert"]'):
-            resolved = resolve_insert(ins)
-            for i in resolved:
-                if i.get("cond") == "0":
-                    continue
-                tag = i.get("tag")
-                if tag == "row":
-                    rows.append(i)
-                elif tag == "col":
-                    cols.append(i)
-                else:
-                    choices.append(i)
+        # Process rows, columns, choices (+ resolved <insert> items)
+        if profile.options:
+            rows, cols, choices = survey.collect_options(q)
+        else:
+            rows, cols, choices = [], [], []
 
         # Grouped rows
-        groups = parse_groups(q)
+        groups = parse_groups(q) if profile.options else {}
         grouped_rows, ungrouped_rows = group_rows_by_group(rows)
 
         if groups:
@@ -1368,7 +773,10 @@ def generate_word_from_xml_file(xml_path, output_path):
             for g_label, g_title in groups.items():
                 add_prefixed_rich_text("Group", g_title)
                 g_rows = grouped_rows.get(g_label, [])
-                for r_item in sort_options(g_rows):
+                for r_item in options_in_order(g_rows, sample):
+                    if isinstance(r_item, OmittedOptions):
+                        add_omitted(r_item)
+                        continue
                     label = r_item.get("label") if isinstance(r_item, dict) else r_item.get("label", "")
                     text = get_row_text(r_item)
                     _, flags, _ = format_option(r_item, text)
@@ -1377,7 +785,10 @@ def generate_word_from_xml_file(xml_path, output_path):
             # Ungrouped rows
             if ungrouped_rows:
                 bold("Other Rows:")
-                for r_item in sort_options(ungrouped_rows):
+                for r_item in options_in_order(ungrouped_rows, sample):
+                    if isinstance(r_item, OmittedOptions):
+                        add_omitted(r_item)
+                        continue
                     label = r_item.get("label") if isinstance(r_item, dict) else r_item.get("label", "")
                     text = get_row_text(r_item)
                     _, flags, _ = format_option(r_item, text)
@@ -1386,7 +797,10 @@ def generate_word_from_xml_file(xml_path, output_path):
         else:
             if rows:
                 bold("Rows:")
-                for r_item in sort_options(rows):
+                for r_item in options_in_order(rows, sample):
+                    if isinstance(r_item, OmittedOptions):
+                        add_omitted(r_item)
+                        continue
                     label = r_item.get("label") if isinstance(r_item, dict) else r_item.get("label", "")
                     text = get_row_text(r_item)
                     _, flags, _ = format_option(r_item, text)
@@ -1394,20 +808,26 @@ def generate_word_from_xml_file(xml_path, output_path):
 
         if cols:
             bold("Columns:")
-            for c in sort_options(cols):
+            for c in options_in_order(cols, sample):
+                if isinstance(c, OmittedOptions):
+                    add_omitted(c)
+                    continue
                 label = c.get("label") if isinstance(c, dict) else c.get("label", "")
                 _, flags, _ = format_option(c, c.get("text") if isinstance(c, dict) else safe(c.text))
                 add_option_rich_text(c, label, flags)
 
         if choices:
             bold("Answer Options:")
-            for o in sort_options(choices):
+            for o in options_in_order(choices, sample):
+                if isinstance(o, OmittedOptions):
+                    add_omitted(o)
+                    continue
                 label = o.get("label") if isinstance(o, dict) else o.get("label", "")
                 _, flags, _ = format_option(o, o.get("text") if isinstance(o, dict) else safe(o.text))
                 add_option_rich_text(o, label, flags)
 
         # Process flow and info elements
-        for child in q:
+        for child in visible.children(q):
             tag = local(child.tag)
             if tag == "term":
                 has_term = True
@@ -1424,39 +844,27 @@ def generate_word_from_xml_file(xml_path, output_path):
             return
 
         def red_bold(text):
-            p = doc.add_paragraph()
+            p = add_paragraph()
             r = p.add_run(text)
             r.bold = True
             r.font.color.rgb = RGBColor(255, 0, 0)
 
 
         # Range from range="" OR verify="range(x,y)"
-        range_value = None
-
-        # 1️⃣ Direct range attribute
-        if "range" in q.attrib and q.get("range"):
-            range_value = q.get("range")
-
-        # 2️⃣ Verify range(x,y)
-        verify = q.get("verify")
-        if not range_value and verify:
-            m = re.search(r"range\s*\(\s*([^)]+)\s*\)", verify)
-            if m:
-                range_value = m.group(1)
-
+        range_value = get_numeric_range(q)
         if range_value:
             red_bold(f"Range - ({range_value})")
 
         # Post Text
         post_text = get_attr(q, "postText")
         if post_text is not None:
-            resolved_post = resolve_res_value(post_text)
+            resolved_post = survey.resolve_res_value(post_text)
             red_bold(f"Post Text: {resolved_post}")
 
         # Pre Text
         pre_text = get_attr(q, "preText")
         if pre_text is not None:
-            resolved_pre = resolve_res_value(pre_text)
+            resolved_pre = survey.resolve_res_value(pre_text)
             red_bold(f"Pre Text: {resolved_pre}")
 
 
@@ -1467,84 +875,20 @@ def generate_word_from_xml_file(xml_path, output_path):
 
 
 
-    # =========================
-    # LOOP ITERATION RESOLVER
-    # =========================
-    def get_loop_iterations(loop):
-        """
-        Returns list of tuples:
-        (display_text, cond)
-        Supports MULTIPLE loopvar per looprow
-        """
-        iterations = []
-
-        looprows = loop.xpath('./*[local-name()="looprow"]')
-        if looprows:
-            for lr in looprows:
-                cond = lr.get("cond")
-
-                vars_text = []
-                for lv in lr.xpath('./*[local-name()="loopvar"]'):
-                    name = lv.get("name", "").strip()
-                    value = safe(lv.text)
-                    if name and value:
-                        vars_text.append(f"{name} = {value}")
-                    elif value:
-                        vars_text.append(value)
-
-                combined_text = " | ".join(vars_text) if vars_text else ""
-
-                label = lr.get("label")
-                display = f"{label}. {combined_text}" if label else combined_text
-
-                iterations.append((display, cond))
-
-            return iterations
-
-        # Fallback (define-based loops)
-        source = loop.get("source")
-        if source in DEFINES:
-            for item in DEFINES[source]:
-                display = f"{item['label']}: {item['text']}"
-                iterations.append((display, item.get("cond")))
-            return iterations
-
-        iterations.append(("⚠ Dynamic loop (resolved at runtime)", None))
-        return iterations
-
-
-        # Case 2: define-based loops
-        source = loop.get("source")
-        if source in DEFINES:
-            for item in DEFINES[source]:
-                display = f"{item['label']}: {item['text']}"
-                iterations.append((display, item.get("cond")))
-            return iterations
-
-        # Fallback
-        iterations.append(("⚠ Dynamic loop (resolved at runtime)", None))
-        return iterations
-
-
     # =========================
     # LOOP
     # =========================
-    def render_loop(loop):
-        if not should_export(loop):
-            return
-        if is_hidden(loop):
-            return
-
+    def start_loop(loop):
         label = loop.get("label", "LOOP")
-        doc.add_heading(f"🔁 Loop: {label}", level=2)
+        mark(add_heading(f"🔁 Loop: {label}", level=2), "loop", label)
 
         # Loop display condition
-        loop_cond = loop.get("cond")
+        loop_cond = loop.get("cond") if profile.logic else None
         if loop_cond:
             red_text(f"Loop Display Condition: {loop_cond}")
 
         # Loop title
-        title = loop.xpath('./*[local-name()="title"]')
+        title = loop.xpath('./*[local-name()="title"]') if profile.text else None
         if title:
             add_rich_text(title[0], "Loop Title: ")
 
@@ -1552,9 +896,9 @@ def generate_word_from_xml_file(xml_path, output_path):
         # LOOP ITERATIONS (FIRST)
         # =========================
         bold("Loop Iterations:")
-        for i, (text, cond) in enumerate(get_loop_iterations(loop), 1):
-            p = doc.add_paragraph(f"{i}. {text}", style="List Continue")
-            if cond:
+        for i, (text, cond) in enumerate(survey.get_loop_iterations(loop), 1):
+            p = add_paragraph(f"{i}. {text}", style="List Continue")
+            if cond and profile.logic:
                 r = p.add_run(f" (Condition: {cond})")
                 r.bold = True
                 r.font.color.rgb = LOGIC_RED
@@ -1562,27 +906,56 @@ def generate_word_from_xml_file(xml_path, output_path):
         # =========================
         # LOOP CONTENT (SECOND)
         # =========================
+        # The content follows as its own traversal events
         bold("Loop Content:")
 
-        for child in loop:
-            tag = local(child.tag)
+        if expand_loops:
+            rows = expansion_rows(survey, loop)
+            if rows is not None:
+                expanding.append((loop, rows, body_length()))
 
-            if tag == "block":
-                render_block(child, in_loop=True)
+    def end_loop(loop):
+        if expanding and expanding[-1][0] is loop:
+            expand_loop(*expanding.pop())
 
-            elif tag == "loop":
-                render_loop(child)   # 🔁 RECURSION (NESTED LOOP)
+        label = loop.get("label", "LOOP")
+        bold(f"🔚 END LOOP: {label}")
 
-            elif tag in QUESTION_TYPES:
-                render_question(child)
+    # =========================
+    # LOOP EXPANSION
+    # =========================
+    # Loops whose content is being captured: (loop, rows, body index where
+    # the content starts). The body is not flushed while one is open.
+    expanding = []
 
-            elif tag in {"term", "exec"}:
-                add_flow(child)
+    def body_length():
+        body = doc.element.body
+        return len(body) - (body.sectPr is not None)
 
-            elif tag in {"html", "suspend"}:
-                add_info(child)
+    def expand_loop(loop, rows, start):
+        """
+        The content was rendered once with the placeholders in it; it is
+        compiled into a template and stamped out for every iteration
+        """
+        body = doc.element.body
+        content = list(body)[start:body_length()]
+        for elem in content:
+            body.remove(elem)
+        template = ParagraphTemplate(content)
+
+        for i, row in enumerate(rows, 1):
+            p = bold(f"🔁 Iteration {row['label'] or i}: {row['text']}")
+            if row["cond"]:
+                r = p.add_run(f" (Condition: {row['cond']})")
+                r.bold = True
+                r.font.color.rgb = LOGIC_RED
 
-        bold(f"🔚 END LOOP: {label}")
+            for elem in template.stamp(row["vars"]):
+                if body.sectPr is not None:
+                    body.sectPr.addprevious(elem)
+                else:
+                    body.append(elem)
+            check_cancelled()
 
 
     '''
@@ -1597,13 +970,7 @@ def generate_word_from_xml_file(xml_path, output_path):
     # =========================
     # BLOCK
     # =========================
-    def render_block(b, in_loop=False):
-        if not should_export(b):
-            return
-
-        if is_hidden(b):
-            return
-
+    def start_block(b, in_loop=False):
         label = b.get("label", "BLOCK")
         if in_loop:
             bold(f"📦 START LOOP BLOCK: {label}")
@@ -1611,47 +978,135 @@ def generate_word_from_xml_file(xml_path, output_path):
             bold(f"📦 START BLOCK: {label}")
 
 
-        block_cond = b.get("cond")
+        block_cond = b.get("cond") if profile.logic else None
         if block_cond:
             if in_loop:
                 red_text(f"Loop iteration logic: {block_cond}")
             else:
                 red_text(f"Block Display Condition: {block_cond}")
 
-        doc.add_heading(f"Block: {label}", level=3)
-
-        for child in b:
-            tag = local(child.tag)
-            if tag == "block":
-                render_block(child)
-            if tag == "loop":
-                render_loop(child)
-            elif tag in QUESTION_TYPES:
-                render_question(child)
-            elif tag in {"term", "exec"}:
-                add_flow(child)
-            elif tag in {"html", "suspend"}:
-                add_info(child)
-
+        mark(add_heading(f"Block: {label}", level=3), "block", label)
 
+    def end_block(b, in_loop=False):
+        label = b.get("label", "BLOCK")
         if in_loop:
             bold(f"📦 END LOOP BLOCK: {label}")
         else:
             bold(f"📦 END BLOCK: {label}")
 
-    for elem in root:
-        tag = local(elem.tag)
-        if tag == "block":
-            render_block(elem)
-        elif tag == "loop":
-            render_loop(elem)
-        elif tag in QUESTION_TYPES:
-            render_question(elem)
-        elif tag in {"term", "exec"}:
-            add_flow(elem)
-        elif tag in {"html", "suspend"}:
-            add_info(elem)
+    # =========================
+    # REFERENCE REPORT
+    # =========================
+    def add_reference_report(report):
+        add_heading("Reference report", level=1)
+
+        add_heading("Dangling references", level=2)
+        for ref in report["dangling"]:
+            red_text(reference_text(ref), style="List Bullet")
+        if not report["dangling"]:
+            add_paragraph("None")
 
+        add_heading("Unreferenced questions", level=2)
+        add_paragraph(", ".join(report["unreferenced"]) or "None")
+
+    # =========================
+    # TABLE OF CONTENTS
+    # =========================
+    # Plain paragraphs with internal links rather than a TOC field, so Word
+    # has nothing to update or repaginate when the document is opened
+    contents = TableOfContents(survey, visible, expand_loops) if toc else None
+
+    def mark(p, kind, label):
+        # Stamped loop content would repeat the bookmark
+        if contents is not None and not expanding:
+            contents.bookmark(p, kind, label)
+
+    def add_table_of_contents():
+        add_heading(TOC_TITLE, level=1)
+        for level, text, anchor in contents.entries:
+            p = add_paragraph()
+            p.paragraph_format.left_indent = TOC_INDENT * (level - 2)
+            p.paragraph_format.space_after = 0
+            add_internal_link(p, text, anchor)
+        doc.add_page_break()
 
-    doc.save(output_path)
+    if contents is not None:
+        add_table_of_contents()
 
+    # =========================
+    # STREAMED OUTPUT
+    # =========================
+    # document.xml is written while rendering, finished paragraphs are
+    # dropped from memory at every checkpoint
+    out = open(output_path, "wb") if isinstance(output_path, (str, os.PathLike)) else output_path
+    writer = StreamingDocxWriter(doc, out)
+
+    def checkpoint():
+        check_cancelled()
+        if not expanding:
+            writer.flush()
+
+    blocks_done = questions_done = 0
+    if progress is not None:
+        blocks_total, questions_total = count_content(visible)
+        progress.update(phase="rendering", blocks_total=blocks_total, questions_total=questions_total)
+
+    completed = False
+    try:
+        writer.start()
+
+        # Iterative walk: nested blocks / loops arrive as ENTER ... EXIT
+        # pairs, so nesting depth is not limited by the Python stack
+        for event, elem, in_loop in traverse(visible):
+            check_cancelled()
+            tag = local(elem.tag)
+
+            if event == ENTER:
+                if tag == "block":
+                    start_block(elem, in_loop=in_loop)
+                else:
+                    start_loop(elem)
+            elif event == EXIT:
+                if tag == "block":
+                    end_block(elem, in_loop=in_loop)
+                else:
+                    end_loop(elem)
+            elif tag in QUESTION_TYPES:
+                render_question(elem)
+            elif tag in {"term", "exec"}:
+                add_flow(elem)
+            elif tag in {"html", "suspend"}:
+                add_info(elem)
+
+            checkpoint()
+
+            if progress is not None:
+                if event == EXIT and tag == "block":
+                    blocks_done += 1
+                elif tag in QUESTION_TYPES and not is_hidden(elem):
+                    questions_done += 1
+                progress.update(
+                    blocks_done=blocks_done,
+                    questions_done=questions_done,
+                    bytes=writer.bytes_written
+                )
+
+        if reference_report:
+            add_reference_report(survey.index.reference_report())
+            checkpoint()
+
+        if progress is not None:
+            progress.update(phase="packaging")
+        writer.close()
+        completed = True
+
+        if progress is not None:
+            progress.update(phase="done", bytes=writer.bytes_written)
+    finally:
+        if not completed:
+            writer.abort()
+        if out is not output_path:
+            out.close()
+            # Partial file of a cancelled / failed render
+            if not completed:
+                os.remove(output_path)
@@ -1,30 +1,66 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file
+import math
 import os
+import re
 import tempfile
-from threading import Timer
-from decipher_api import lookup_survey, fetch_survey_xml
-from pqr_exporter import export_word_from_xml_file
+import time
+import uuid
 from config import Config
+from pqr_upstream import UpstreamError
+
+# decipher_api (requests), pqr_exporter / pqr_renderers / pqr_preview (lxml,
+# python-docx) are imported inside the handlers so starting the app stays
+# cheap; gunicorn.conf.py loads them once in the master before forking
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_DIR = os.path.join(BASE_DIR, "input")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+DOCX_MIMETYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
 
 os.makedirs(INPUT_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 app = Flask(__name__)
 app.secret_key = Config.FLASK_SECRET_KEY
 
+@app.errorhandler(UpstreamError)
+def upstream_unavailable(e):
+    # Decipher down or failing: tell the page to come back later instead of a 500
+    print(f"Upstream error: {e}")
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after or 30)}
+
 @app.route("/")
 def home():
     return render_template("index.html")
 
 @app.route("/api/lookup", methods=["POST"])
 def api_lookup():
+    from decipher_api import lookup_survey
+
     survey_id = request.json.get("survey_id")
     print(f"Received survey_id: {survey_id}")  # Log the received survey_id
     response = lookup_survey(survey_id=survey_id)
     print(f"Lookup response: {response}")  # Log the response from lookup_survey
+
+    # The export click usually follows: fetch and render it in the background
+    if request.json.get("prefetch", Config.PREFETCH_ON_LOOKUP):
+        from pqr_cache import export_cache, prefetcher, start_prerender_scheduler
+
+        start_prerender_scheduler()
+        for survey in response:
+            path = survey.get("path") or ""
+            if survey.get("error") or path.count("/") < 2:
+                continue
+            # Same id the page exports with
+            lookup_id = path.split("/")[2]
+            prefetcher.submit(lookup_id)
+            export_cache.record_lookup(lookup_id)
+
     return jsonify(response)
+def stale_headers(stale_age):
+    """
+    X-Survey-Stale: <seconds> when the survey.xml used is a cached copy
+    """
+    return {"X-Survey-Stale": str(round(stale_age))} if stale_age is not None else {}
+
 # Cleanup function to remove temporary files
 def delete_file(path):
     try:
@@ -33,36 +69,563 @@ def delete_file(path):
     except Exception as e:
         print(f"Cleanup failed for {path}: {e}")
 
+@app.route("/api/preview", methods=["POST"])
+def api_preview():
+    """
+    Survey outline (blocks, loops, question labels); block content is
+    fetched separately as the user expands it
+    """
+    from pqr_cache import fetch_survey_xml_cached
+    from pqr_preview import build_preview
+
+    survey_id = request.json.get("survey_id")
+
+    xml_content, stale_age = fetch_survey_xml_cached(survey_id)
+    preview = build_preview(xml_content)
+
+    return jsonify({
+        "survey_id": survey_id,
+        "name": preview.survey.name,
+        "version": preview.version,
+        "outline": preview.outline,
+    }), stale_headers(stale_age)
+
+@app.route("/api/preview/<survey_id>/<int:section_id>")
+def api_preview_section(survey_id, section_id):
+    """
+    HTML of one block / loop; "v" is the version the outline was built from
+    """
+    from pqr_preview import get_preview
+
+    preview = get_preview(survey_id, request.args.get("v", ""))
+    if preview is None:
+        return jsonify({"error": "The survey has changed, please reload the outline."}), 409
+    if section_id not in preview.sections:
+        return jsonify({"error": f"Unknown section {section_id}"}), 404
+
+    return Response(preview.render_section(section_id), mimetype="text/html")
+
+def export_selection(data):
+    """
+    What to export: "labels" (list or comma separated), "pattern" (label
+    regex) or "start_label" / "end_label" (default te1 ... b3), and the
+    "profile" (full, logic-only, respondent-view or no-hidden).
+    "sample" keeps only the first "sample_first" / last "sample_last"
+    options of every list (quick preview).
+    """
+    from pqr_survey import ExportSelection, EXPORT_START_LABEL, EXPORT_END_LABEL
+
+    labels = data.get("labels")
+    if isinstance(labels, str):
+        labels = [label.strip() for label in labels.split(",") if label.strip()]
+
+    sample = None
+    if str(data.get("sample")).lower() in ("1", "true"):
+        sample = (
+            data.get("sample_first", Config.SAMPLE_FIRST_OPTIONS),
+            data.get("sample_last", Config.SAMPLE_LAST_OPTIONS),
+        )
+
+    return ExportSelection(
+        start_label=data.get("start_label") or EXPORT_START_LABEL,
+        end_label=data.get("end_label") or EXPORT_END_LABEL,
+        labels=labels or None,
+        pattern=data.get("pattern") or None,
+        profile=data.get("profile") or None,
+        sample=sample,
+    )
+
+def diff_selection(data):
+    """
+    What a diff compares: "labels", "pattern" or "start_label" /
+    "end_label" as for an export, by default the whole survey (None)
+    """
+    if not any(data.get(key) for key in ("labels", "pattern", "start_label", "end_label")):
+        return None
+    return export_selection(data)
+
+def export_timeout(data):
+    """
+    Requested "timeout" in seconds, capped by Config.EXPORT_TIMEOUT_SECONDS
+    """
+    timeout = data.get("timeout")
+    if timeout is None:
+        return Config.EXPORT_TIMEOUT_SECONDS
+
+    timeout = float(timeout)
+    # float() also takes "nan" / "inf", which would never fire
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return min(timeout, Config.EXPORT_TIMEOUT_SECONDS)
+
 @app.route("/api/export", methods=["POST"])
 def api_export():
+    from pqr_exporter import stream_word_from_xml_file, stream_export_from_xml_file
+    from pqr_jobs import CancelToken, export_jobs
+    from pqr_lanes import LaneFull, choose_lane, scan_xml
+    from pqr_cache import export_cache, fetch_survey_xml_cached, prefetcher
+    from pqr_memory import check_budget
+    from pqr_progress import EXPORT_ID_PATTERN, ExportProgress
+    from pqr_renderers import get_renderer
+
     survey_id = request.json.get("survey_id")
 
+    # Chosen by the page so it can open the progress stream right away
+    export_id = str(request.json.get("export_id") or uuid.uuid4().hex)
+    if not EXPORT_ID_PATTERN.fullmatch(export_id):
+        return jsonify({"error": "Invalid export_id"}), 400
+
+    # docx (default), json, md / markdown, html
+    try:
+        renderer = get_renderer(request.json.get("format"))
+        selection = export_selection(request.json)
+        timeout = export_timeout(request.json)
+    except (ValueError, TypeError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Repeat looprow loop content per iteration with the loopvars filled in
+    expand_loops = bool(request.json.get("expand_loops"))
+
+    # Dangling / unreferenced label report at the end of the document
+    reference_report = bool(request.json.get("reference_report"))
+
+    # Static table of contents linked to the headings (Word only)
+    toc = bool(request.json.get("toc"))
+
+    progress = ExportProgress(export_id)
+
+    # Default Word exports may come straight from the prefetch cache; a
+    # prefetch already running gets a few seconds, otherwise render directly
+    cacheable = renderer is None and selection.is_default and not (expand_loops or reference_report or toc)
+    if cacheable:
+        prefetcher.wait(survey_id, min(Config.PREFETCH_WAIT_SECONDS, timeout))
+
+    # The deadline covers fetching, queueing and rendering
+    cancel = CancelToken(timeout)
+
     # ---------- 1️⃣ Download XML ----------
-    xml_content = fetch_survey_xml(survey_id)
+    # (reused when the lookup prefetched it moments ago, or the last copy
+    # when Decipher is unavailable)
+    progress.update(phase="fetching")
+    try:
+        xml_content, stale_age = fetch_survey_xml_cached(survey_id)
+    except Exception as e:
+        progress.update(phase="failed", error=str(e))
+        raise
+
+    # Refuse exports that would not fit in the worker's memory budget
+    # (the estimate is per byte of XML, not per character)
+    refusal = check_budget(len(xml_content.encode("utf-8")), request.json.get("format"))
+    if refusal:
+        print(f"Export refused for {survey_id}: {refusal['error']}")
+        progress.update(phase="failed", error=refusal["error"])
+        return jsonify(refusal), 413
 
-    xml_filename = f"{survey_id}.xml"
-    xml_path = os.path.join(INPUT_DIR, xml_filename)
+    cached_path = export_cache.get(xml_content) if cacheable else None
+    if cached_path:
+        print(f"Export {survey_id}: served from cache")
+        progress.update(phase="done", bytes=os.path.getsize(cached_path))
+        return send_file(
+            cached_path,
+            mimetype=DOCX_MIMETYPE,
+            as_attachment=True,
+            download_name=f"survey_{survey_id}.docx",
+            max_age=0
+        ), {"X-Export-Id": export_id, "X-Export-Cache": "hit", **stale_headers(stale_age)}
 
-    with open(xml_path, "w", encoding="utf-8") as f:
+    # One file per export, so a superseded export cleaning up cannot
+    # delete the XML of the one replacing it (hidden from the watcher)
+    fd, xml_path = tempfile.mkstemp(prefix=f".{survey_id}_", suffix=".xml", dir=INPUT_DIR)
+
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
         f.write(xml_content)
 
-    # ---------- 2️⃣ Generate Word ----------
+    # A new export of the same survey from the same client cancels the
+    # previous one
+    job_key = (survey_id, request.remote_addr)
+    export_jobs.start(job_key, cancel)
+
+    def cleanup():
+        export_jobs.finish(job_key, cancel)
+        delete_file(xml_path)
+
+    # ---------- 2️⃣ Lightweight formats ----------
+    if renderer is not None:
+        return Response(
+            stream_export_from_xml_file(
+                xml_path,
+                renderer,
+                selection,
+                on_close=cleanup,
+                cancel=cancel,
+                expand_loops=expand_loops,
+                progress=progress,
+                reference_report=reference_report
+            ),
+            mimetype=renderer.mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=survey_{survey_id}.{renderer.extension}",
+                "X-Export-Id": export_id,
+                **stale_headers(stale_age),
+            }
+        )
+
+    # ---------- 3️⃣ Generate + stream Word ----------
+    # The docx is written into the response while it renders, the XML is
+    # removed as soon as the stream ends. Large surveys render on the
+    # bounded slow lane so they do not hold up the small ones.
     word_filename = f"survey_{survey_id}.docx"
-    word_path = os.path.join(OUTPUT_DIR, word_filename)
-
-    export_word_from_xml_file(xml_path, word_path)
-    # ---------- Schedule cleanup ----------
-    Timer(30, delete_file, args=[xml_path]).start()
-    Timer(30, delete_file, args=[word_path]).start()
-    # ---------- 3️⃣ Download Word ----------
-    return send_file(
-        word_path,
-        as_attachment=True,
-        download_name=word_filename
+
+    scan = scan_xml(xml_content)
+    lane = choose_lane(scan)
+    print(f"Export {survey_id}: {lane} lane, {scan}")
+
+    try:
+        stream = stream_word_from_xml_file(
+            xml_path,
+            selection,
+            on_close=cleanup,
+            lane=lane,
+            cancel=cancel,
+            expand_loops=expand_loops,
+            progress=progress,
+            reference_report=reference_report,
+            toc=toc
+        )
+    except LaneFull as e:
+        cleanup()
+        progress.update(phase="failed", error=str(e))
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    return Response(
+        stream,
+        mimetype=DOCX_MIMETYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename={word_filename}",
+            "X-Export-Lane": lane,
+            "X-Export-Id": export_id,
+            **stale_headers(stale_age),
+        }
+    )
+
+@app.route("/api/export/upload", methods=["POST"])
+def api_export_upload():
+    """
+    Export of a survey.xml sent as the raw request body (surveys that
+    never went through Decipher). Options are query parameters: format,
+    labels / pattern / start_label / end_label, profile, sample,
+    expand_loops, reference_report, toc, timeout, export_id and name (used
+    for the file name).
+
+    curl -X POST --data-binary @survey.xml -H "Content-Type: application/xml" \
+         "http://localhost:5000/api/export/upload?name=wave2&format=html"
+    """
+    from lxml import etree
+    from pqr_exporter import stream_export_from_survey, stream_word_from_survey
+    from pqr_jobs import CancelToken, ExportCancelled, export_jobs
+    from pqr_lanes import LaneFull, choose_lane
+    from pqr_progress import EXPORT_ID_PATTERN, ExportProgress
+    from pqr_renderers import get_renderer
+    from pqr_upload import UploadRefused, parse_upload
+
+    name = re.sub(r"[^A-Za-z0-9_-]", "_", request.args.get("name") or "upload")[:64]
+
+    export_id = request.args.get("export_id") or uuid.uuid4().hex
+    if not EXPORT_ID_PATTERN.fullmatch(export_id):
+        return jsonify({"error": "Invalid export_id"}), 400
+
+    try:
+        renderer = get_renderer(request.args.get("format"))
+        selection = export_selection(request.args)
+        timeout = export_timeout(request.args)
+    except (ValueError, TypeError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+
+    expand_loops = request.args.get("expand_loops") in ("1", "true")
+    reference_report = request.args.get("reference_report") in ("1", "true")
+    toc = request.args.get("toc") in ("1", "true")
+
+    # The deadline also covers receiving the upload
+    cancel = CancelToken(timeout)
+
+    progress = ExportProgress(export_id)
+
+    # ---------- 1️⃣ Parse while receiving ----------
+    # The body goes straight into the feed parser, it is never buffered
+    progress.update(phase="parsing")
+    try:
+        survey, scan = parse_upload(
+            request.stream, request.args.get("format"), request.content_length, cancel
+        )
+    except UploadRefused as e:
+        print(f"Upload {name} refused: {e}")
+        progress.update(phase="failed", error=str(e))
+        return jsonify(e.refusal), 413
+    except (ValueError, etree.XMLSyntaxError) as e:
+        progress.update(phase="failed", error=str(e))
+        return jsonify({"error": f"Invalid survey.xml: {e}"}), 400
+    except ExportCancelled as e:
+        progress.update(phase="failed", error=str(e))
+        return jsonify({"error": str(e)}), 408
+
+    job_key = (f"upload:{name}", request.remote_addr)
+    export_jobs.start(job_key, cancel)
+
+    def cleanup():
+        export_jobs.finish(job_key, cancel)
+
+    # ---------- 2️⃣ Lightweight formats ----------
+    if renderer is not None:
+        return Response(
+            stream_export_from_survey(
+                survey,
+                renderer,
+                selection,
+                on_close=cleanup,
+                cancel=cancel,
+                expand_loops=expand_loops,
+                progress=progress,
+                reference_report=reference_report
+            ),
+            mimetype=renderer.mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=survey_{name}.{renderer.extension}",
+                "X-Export-Id": export_id,
+            }
+        )
+
+    # ---------- 3️⃣ Generate + stream Word ----------
+    lane = choose_lane(scan)
+    print(f"Upload {name}: {lane} lane, {scan}")
+
+    try:
+        stream = stream_word_from_survey(
+            survey,
+            selection,
+            on_close=cleanup,
+            lane=lane,
+            cancel=cancel,
+            expand_loops=expand_loops,
+            progress=progress,
+            reference_report=reference_report,
+            toc=toc
+        )
+    except LaneFull as e:
+        cleanup()
+        progress.update(phase="failed", error=str(e))
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    return Response(
+        stream,
+        mimetype=DOCX_MIMETYPE,
+        headers={
+            "Content-Disposition": f"attachment; filename=survey_{name}.docx",
+            "X-Export-Lane": lane,
+            "X-Export-Id": export_id,
+        }
+    )
+
+@app.route("/api/export/<export_id>/progress")
+def api_export_progress(export_id):
+    """
+    Server-Sent Events with the progress of one export (phase, blocks and
+    questions done out of total, bytes written) until it ends
+    """
+    from pqr_progress import EXPORT_ID_PATTERN, progress_events
+
+    if not EXPORT_ID_PATTERN.fullmatch(export_id):
+        return jsonify({"error": "Invalid export_id"}), 400
+
+    return Response(
+        progress_events(export_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/api/export/languages", methods=["POST"])
+def api_export_languages():
+    """
+    One .docx per language (base + translations) in a zip.
+    languages: list or comma separated, default the survey's otherLanguages
+    """
+    from pqr_exporter import stream_languages
+    from pqr_jobs import CancelToken
+    from pqr_languages import fetch_survey_languages
+
+    survey_id = request.json.get("survey_id")
+
+    languages = request.json.get("languages")
+    if isinstance(languages, str):
+        languages = [l.strip() for l in languages.split(",") if l.strip()]
+
+    try:
+        selection = export_selection(request.json)
+        timeout = export_timeout(request.json)
+    except (ValueError, TypeError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+
+    cancel = CancelToken(timeout)
+    expand_loops = bool(request.json.get("expand_loops"))
+
+    # survey.xml and the lang-<language>.xml files are fetched together
+    base_xml, translations, errors = fetch_survey_languages(survey_id, languages)
+
+    return Response(
+        stream_languages(
+            base_xml,
+            translations,
+            name=f"survey_{survey_id}",
+            selection=selection,
+            expand_loops=expand_loops,
+            cancel=cancel,
+            errors=errors
+        ),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=survey_{survey_id}_languages.zip"}
     )
 
+@app.route("/api/export/batch", methods=["POST"])
+def api_export_batch():
+    """
+    Several surveys in one export: "survey_ids" (list or comma separated),
+    "merge": true for one .docx with a section per survey, otherwise a zip
+    of survey_<id>.docx with a surveys.json report
+    """
+    from pqr_batch import MergedOutput, ZipOutput
+    from pqr_exporter import stream_surveys
+    from pqr_jobs import CancelToken
 
-    return response
+    survey_ids = request.json.get("survey_ids") or []
+    if isinstance(survey_ids, str):
+        survey_ids = survey_ids.split(",")
+    survey_ids = [str(s).strip() for s in survey_ids if str(s).strip()]
+
+    if not survey_ids:
+        return jsonify({"error": "Pass the surveys to export as survey_ids."}), 400
+    if len(survey_ids) > Config.BATCH_MAX_SURVEYS:
+        return jsonify({"error": f"At most {Config.BATCH_MAX_SURVEYS} surveys per export."}), 400
+
+    try:
+        selection = export_selection(request.json)
+        timeout = export_timeout(request.json)
+    except (ValueError, TypeError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+
+    merge = bool(request.json.get("merge"))
+    output = MergedOutput if merge else ZipOutput
+
+    def log_progress(event):
+        print(f"Batch export [{event['done']}/{event['total']}] {event['survey_id']}: {event['status']}")
+
+    return Response(
+        stream_surveys(
+            survey_ids,
+            merge=merge,
+            selection=selection,
+            expand_loops=bool(request.json.get("expand_loops")),
+            cancel=CancelToken(timeout),
+            on_progress=log_progress
+        ),
+        mimetype=output.mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=surveys_{len(survey_ids)}.{output.extension}"
+        }
+    )
+
+@app.route("/api/search")
+def api_search():
+    """
+    Full-text search over the questions, options, labels and conditions
+    of every indexed survey: ?q=brand awareness&kind=question&limit=50
+    """
+    import sqlite3
+    from pqr_search import index_stats, search
+
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Missing q"}), 400
+
+    start = time.time()
+    try:
+        results = search(
+            query,
+            kind=request.args.get("kind"),
+            survey_id=request.args.get("survey_id"),
+            limit=request.args.get("limit", 50, type=int)
+        )
+    except sqlite3.OperationalError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+
+    return jsonify({
+        "query": query,
+        "results": results,
+        "ms": round((time.time() - start) * 1000, 1),
+        "index": index_stats(),
+    })
+
+@app.route("/api/catalog/stats")
+def api_catalog_stats():
+    """
+    Complexity statistics over every survey fetched so far (question
+    types, options, loop depth, hidden questions, define fan-out,
+    estimated render cost). ?refresh=1 rebuilds the catalog first.
+    """
+    from pqr_catalog import Catalog, build_catalog
+
+    catalog = None if request.args.get("refresh") == "1" else Catalog.load()
+    if catalog is None:
+        catalog = build_catalog()
+
+    return jsonify(catalog.summary())
+
+@app.route("/api/diff", methods=["POST"])
+def api_diff():
+    """
+    Changes between two survey.xml versions (multipart upload).
+    "old" is required; "new" defaults to the current XML of "survey_id".
+    format: docx (default) or json. The whole survey is compared unless
+    "labels", "pattern" or "start_label" / "end_label" narrow it down.
+    """
+    import io
+    from decipher_api import fetch_survey_xml
+    from pqr_diff import SurveyDiff, write_diff_docx
+    from pqr_survey import Survey
+
+    old_file = request.files.get("old")
+    if old_file is None:
+        return jsonify({"error": "Upload the previous survey.xml as 'old'."}), 400
+
+    try:
+        selection = diff_selection(request.form)
+    except (ValueError, TypeError, re.error) as e:
+        return jsonify({"error": str(e)}), 400
+
+    new_file = request.files.get("new")
+    survey_id = request.form.get("survey_id")
+    if new_file is not None:
+        new_survey = Survey.from_string(new_file.read())
+    elif survey_id:
+        new_survey = Survey.from_string(fetch_survey_xml(survey_id))
+    else:
+        return jsonify({"error": "Upload 'new' or pass a survey_id."}), 400
+
+    diff = SurveyDiff.from_surveys(Survey.from_string(old_file.read()), new_survey, selection)
+
+    fmt = (request.form.get("format") or "docx").lower()
+    if fmt == "json":
+        return Response(diff.to_json(), mimetype="application/json")
+    if fmt != "docx":
+        return jsonify({"error": f"Unsupported diff format: {fmt}"}), 400
+
+    out = io.BytesIO()
+    write_diff_docx(diff, out)
+    name = f"survey_{survey_id}_changes.docx" if survey_id else "survey_changes.docx"
+
+    return Response(
+        out.getvalue(),
+        mimetype=DOCX_MIMETYPE,
+        headers={"Content-Disposition": f"attachment; filename={name}"}
+    )
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,96 @@ class Config:
     DECIPHER_API_KEY = os.getenv("DECIPHER_API_KEY")
     FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev")
 
+    # Exports whose estimated peak memory exceeds this are refused (0 = off)
+    EXPORT_MEMORY_BUDGET_MB = int(os.getenv("EXPORT_MEMORY_BUDGET_MB", "1024"))
+
+    # Largest survey.xml /api/export/upload accepts (0 = no limit). Reading
+    # stops as soon as an upload goes over it, or over what the requested
+    # format fits in EXPORT_MEMORY_BUDGET_MB.
+    UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "100"))
+
+    # Word exports estimated above this many ms go to the slow lane, which
+    # runs SLOW_LANE_WORKERS at a time with up to SLOW_LANE_QUEUE waiting
+    SLOW_LANE_THRESHOLD_MS = int(os.getenv("SLOW_LANE_THRESHOLD_MS", "3000"))
+    SLOW_LANE_WORKERS = int(os.getenv("SLOW_LANE_WORKERS", "1"))
+    SLOW_LANE_QUEUE = int(os.getenv("SLOW_LANE_QUEUE", "4"))
+
+    # Longest an export may take (seconds); requests may ask for less
+    EXPORT_TIMEOUT_SECONDS = int(os.getenv("EXPORT_TIMEOUT_SECONDS", "300"))
+
+    # Render processes per gunicorn worker, shared by the multi-document
+    # exports (languages, batch)
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 2)))
+
+    # Languages of one multi-language export rendered at the same time
+    LANGUAGE_WORKERS = int(os.getenv("LANGUAGE_WORKERS", str(os.cpu_count() or 2)))
+
+    # Surveys of one multi-survey export rendered at the same time, and how
+    # many surveys one request may ask for
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 2)))
+    BATCH_MAX_SURVEYS = int(os.getenv("BATCH_MAX_SURVEYS", "30"))
+
+    # Sampled (quick preview) exports list only the first / last this many
+    # options of every row, column and choice list
+    SAMPLE_FIRST_OPTIONS = int(os.getenv("SAMPLE_FIRST_OPTIONS", "5"))
+    SAMPLE_LAST_OPTIONS = int(os.getenv("SAMPLE_LAST_OPTIONS", "2"))
+
+    # Progress of running exports, shared by all gunicorn workers
+    PROGRESS_DIR = os.getenv("PROGRESS_DIR", os.path.join(tempfile.gettempdir(), "pqr-progress"))
+
+    # Rendered exports and prefetched XML, shared by all gunicorn workers;
+    # entries older than EXPORT_CACHE_TTL seconds are dropped
+    EXPORT_CACHE_DIR = os.getenv(
+        "EXPORT_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", ".cache")
+    )
+    EXPORT_CACHE_TTL = int(os.getenv("EXPORT_CACHE_TTL", "86400"))
+
+    # A lookup hit fetches and pre-renders the survey in the background
+    # (PREFETCH_WORKERS at a time, PREFETCH_QUEUE waiting). An export within
+    # PREFETCH_XML_TTL seconds reuses the prefetched XML instead of fetching.
+    PREFETCH_ON_LOOKUP = os.getenv("PREFETCH_ON_LOOKUP", "1") == "1"
+    PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "1"))
+    PREFETCH_QUEUE = int(os.getenv("PREFETCH_QUEUE", "4"))
+    PREFETCH_XML_TTL = int(os.getenv("PREFETCH_XML_TTL", "120"))
+    # Longest an export waits for a prefetch of its survey that is already
+    # running before rendering on its own (seconds)
+    PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "5"))
+
+    # Re-render the surveys looked up in the last PRERENDER_WINDOW seconds
+    # every PRERENDER_INTERVAL seconds (0 = off)
+    PRERENDER_INTERVAL = int(os.getenv("PRERENDER_INTERVAL", "0"))
+    PRERENDER_WINDOW = int(os.getenv("PRERENDER_WINDOW", "3600"))
+
+    # Decipher calls: time allowed per call including retries (seconds),
+    # retries after the first attempt and the base of the jittered backoff
+    UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+    UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+    UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+
+    # An endpoint failing BREAKER_FAILURES times in a row is not called for
+    # BREAKER_RESET_SECONDS
+    BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+    BREAKER_RESET_SECONDS = int(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+    # When an earlier copy of survey.xml is cached, an export waits at most
+    # this long for Decipher before using that copy (marked stale) and
+    # refreshing it in the background
+    STALE_FETCH_BUDGET = float(os.getenv("STALE_FETCH_BUDGET", "5"))
+
+    # Full-text index of every survey fetched (sqlite FTS5)
+    SEARCH_DB = os.getenv(
+        "SEARCH_DB",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", "search.sqlite")
+    )
+    SEARCH_INDEX_ON_FETCH = os.getenv("SEARCH_INDEX_ON_FETCH", "1") == "1"
+
+    # Column files of the survey catalog statistics (python pqr_catalog.py --build)
+    CATALOG_DIR = os.getenv(
+        "CATALOG_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", "catalog")
+    )
+
     @classmethod
     def validate(cls):
         missing = []
@@ -1,6 +1,5 @@
-import requests
 from config import Config
-from decipher.beacon import api
+from pqr_upstream import upstream_get
 
 HEADERS = {
     "x-apikey": Config.DECIPHER_API_KEY,  # Updated to use the correct header for the API key
@@ -11,7 +10,7 @@ def lookup_survey(survey_id: str) -> list:
     Config.validate()
 
     url = f"{Config.DECIPHER_BASE}/api/v1/rh/surveys/selfserve/2227/{survey_id}"
-    r = requests.get(url, headers=HEADERS)
+    r = upstream_get("lookup", url, HEADERS)
     if r.status_code == 404:
         return [{"error": f"Survey ID {survey_id} not found."}]
     r.raise_for_status()
@@ -20,15 +19,18 @@ def lookup_survey(survey_id: str) -> list:
     else:
         return [{"error": f"Unexpected response format: {r.status_code} {r.reason}", "content": r.text}]
 
-def fetch_survey_xml(survey_id):
+def fetch_survey_xml(survey_id, budget=None):
+    return fetch_survey_file(survey_id, "survey.xml", budget)
+
+def fetch_survey_file(survey_id, filename, budget=None):
     Config.validate()
 
-    url = f"{Config.DECIPHER_BASE}/api/v1/surveys/selfserve/2227/{survey_id}/files/survey.xml"
-    print(f"Fetching XML for survey_id: {survey_id}")  # Log the survey_id
-    r = requests.get(url, headers={
+    url = f"{Config.DECIPHER_BASE}/api/v1/surveys/selfserve/2227/{survey_id}/files/{filename}"
+    print(f"Fetching {filename} for survey_id: {survey_id}")  # Log the survey_id
+    r = upstream_get("files", url, {
         "x-apikey": Config.DECIPHER_API_KEY,  # Corrected header name
         "Accept": "application/xml"
-    })
+    }, budget)
     print(f"Response status: {r.status_code}")  # Log the response status
     if r.status_code != 200:
         print(f"Error response: {r.text}")  # Log error response
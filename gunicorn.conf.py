@@ -0,0 +1,36 @@
+import gc
+import multiprocessing
+import os
+
+# =========================
+# GUNICORN
+# =========================
+# gunicorn -c gunicorn.conf.py app:app
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Exports stream from a render thread, threads keep a slow download from
+# blocking the whole worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# Load the app once in the master; workers are forked from it and share the
+# imported modules and the warmed base document copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Runs in the master after the app is loaded, before the first fork
+    """
+    from pqr_exporter import warm_up
+    import pqr_preview  # noqa: F401  (imported for the forked workers)
+    import decipher_api  # noqa: F401
+
+    warm_up()
+    server.log.info("Export renderers warmed up")
+
+    # Keep the GC from touching (and un-sharing) the preloaded objects
+    gc.freeze()
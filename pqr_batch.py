@@ -0,0 +1,296 @@
+import argparse
+import io
+import json
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import deepcopy
+
+from config import Config
+
+# Surveys downloaded from Decipher at the same time
+FETCH_CONCURRENCY = 8
+
+
+# =========================
+# WORKER PROCESS
+# =========================
+def render_survey_xml(xml_content, selection=None, expand_loops=False):
+    """
+    Renders one survey.xml to .docx bytes; returns (bytes, seconds)
+    """
+    from PQR import generate_word_from_survey
+    from pqr_survey import Survey
+
+    start = time.time()
+    buffer = io.BytesIO()
+    generate_word_from_survey(
+        Survey.from_string(xml_content), buffer, selection, expand_loops=expand_loops
+    )
+    return buffer.getvalue(), time.time() - start
+
+def docx_body(data):
+    """
+    Serialized body content of an exported .docx, without its final <w:sectPr>
+    """
+    xml = zipfile.ZipFile(io.BytesIO(data)).read("word/document.xml")
+    start = xml.index(b">", xml.index(b"<w:body")) + 1
+    return xml[start:xml.rindex(b"<w:sectPr")]
+
+
+# =========================
+# OUTPUTS
+# =========================
+class ZipOutput:
+    """
+    survey_<id>.docx per survey, written as soon as each one is rendered,
+    plus surveys.json with the report
+    """
+    ordered = False
+    mimetype = "application/zip"
+    extension = "zip"
+
+    def __init__(self, out):
+        # docx files are already compressed
+        self._zipf = zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED)
+
+    def add(self, survey_id, data, error=None):
+        if data is not None:
+            self._zipf.writestr(f"survey_{survey_id}.docx", data)
+
+    def close(self, report):
+        self._zipf.writestr("surveys.json", json.dumps(report, indent=2, ensure_ascii=False))
+        self._zipf.close()
+
+    def abort(self):
+        try:
+            self._zipf.close()
+        except Exception:
+            pass
+
+
+class MergedOutput:
+    """
+    One .docx with a section (starting on a new page) per survey, in the
+    requested order, and the report as the last section
+    """
+    ordered = True
+    mimetype = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    extension = "docx"
+
+    def __init__(self, out):
+        from pqr_stream import StreamingDocxWriter
+        from pqr_template import new_document
+
+        self.doc, self.style_ids = new_document()
+
+        # Every survey brings its own title and legend
+        for p in self.doc.paragraphs:
+            p._p.getparent().remove(p._p)
+
+        self.writer = StreamingDocxWriter(self.doc, out)
+        self.writer.start()
+        self.sections = 0
+
+    def add_paragraph(self, text="", style=None):
+        p = self.doc.add_paragraph(text)
+        if style is not None:
+            p._p.style = self.style_ids[style]
+        return p
+
+    def new_section(self):
+        # A paragraph carrying a copy of the page setup ends the section
+        if self.sections:
+            p = self.add_paragraph()
+            p._p.get_or_add_pPr().append(deepcopy(self.doc.element.body.sectPr))
+        self.sections += 1
+
+    def add(self, survey_id, data, error=None):
+        from docx.shared import RGBColor
+
+        self.new_section()
+        if data is not None:
+            self.writer.write_xml(docx_body(data))
+            return
+
+        self.add_paragraph(f"Survey {survey_id}", "Heading 1")
+        r = self.add_paragraph().add_run(f"⚠ Could not be exported: {error}")
+        r.bold = True
+        r.font.color.rgb = RGBColor(255, 0, 0)
+
+    def close(self, report):
+        self.new_section()
+        self.add_paragraph("Export report", "Heading 1")
+        for survey_id, info in report.items():
+            text = f"{survey_id}: {info['status']}"
+            if info.get("render_seconds") is not None:
+                text += f" (rendered in {info['render_seconds']}s)"
+            if info.get("error"):
+                text += f" – {info['error']}"
+            self.add_paragraph(text, "List Bullet")
+        self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+# =========================
+# EXPORT
+# =========================
+def export_surveys(survey_ids, output, merge=False, selection=None, expand_loops=False,
+                   workers=None, cancel=None, on_progress=None, fetch=None):
+    """
+    Fetches the surveys concurrently, renders each in the shared render
+    pool as soon as its XML is in (workers, Config.BATCH_WORKERS, at a
+    time), and writes one merged .docx (merge=True) or a zip of
+    survey_<id>.docx to output (a path or a writable file object).
+
+    on_progress(event) is called as each survey moves through fetching /
+    rendering / done / failed, with "done" and "total" counts.
+    fetch(survey_id) defaults to decipher_api.fetch_survey_xml.
+    Returns the per-survey report.
+    """
+    from pqr_jobs import render_pool
+
+    if fetch is None:
+        from decipher_api import fetch_survey_xml as fetch
+
+    survey_ids = list(dict.fromkeys(survey_ids))
+    total = len(survey_ids)
+    report = {survey_id: {"status": "queued"} for survey_id in survey_ids}
+    finished = set()
+    # Merged document: rendered surveys waiting for the ones before them
+    waiting = {}
+    written = 0
+
+    def progress(survey_id, status, **info):
+        report[survey_id].update(status=status, **info)
+        if on_progress:
+            on_progress({
+                "survey_id": survey_id,
+                "status": status,
+                "done": len(finished),
+                "total": total,
+                **info
+            })
+
+    def timed_fetch(survey_id):
+        start = time.time()
+        return fetch(survey_id), time.time() - start
+
+    def finish(survey_id, data=None, error=None, **info):
+        nonlocal written
+        finished.add(survey_id)
+        if error is not None:
+            print(f"❌ {survey_id}: {error}")
+            progress(survey_id, "failed", error=error, **info)
+        else:
+            progress(survey_id, "done", **info)
+
+        if not out.ordered:
+            out.add(survey_id, data, error)
+            return
+
+        waiting[survey_id] = (data, error)
+        while written < total and survey_ids[written] in waiting:
+            ready = survey_ids[written]
+            out.add(ready, *waiting.pop(ready))
+            written += 1
+
+    out = MergedOutput(output) if merge else ZipOutput(output)
+    fetcher = ThreadPoolExecutor(max_workers=max(min(FETCH_CONCURRENCY, total), 1))
+    renderer = render_pool()
+    workers = max(min(workers or Config.BATCH_WORKERS, total), 1)
+
+    # future -> (survey_id, stage)
+    pending = {}
+    # (survey_id, XML) fetched and waiting for a render slot
+    fetched = deque()
+    rendering = 0
+
+    completed = False
+    try:
+        for survey_id in survey_ids:
+            pending[fetcher.submit(timed_fetch, survey_id)] = (survey_id, "fetch")
+            progress(survey_id, "fetching")
+
+        while pending or fetched:
+            while fetched and rendering < workers:
+                survey_id, xml_content = fetched.popleft()
+                pending[renderer.submit(render_survey_xml, xml_content, selection, expand_loops)] = (
+                    survey_id, "render"
+                )
+                rendering += 1
+                progress(survey_id, "rendering")
+
+            done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            if cancel is not None:
+                cancel.check()
+
+            for future in done:
+                survey_id, stage = pending.pop(future)
+                if stage == "render":
+                    rendering -= 1
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    finish(survey_id, error=str(e))
+                    continue
+
+                if stage == "fetch":
+                    report[survey_id]["fetch_seconds"] = round(seconds, 2)
+                    fetched.append((survey_id, result))
+                else:
+                    finish(survey_id, result, render_seconds=round(seconds, 2), bytes=len(result))
+
+        out.close(report)
+        completed = True
+    finally:
+        if not completed:
+            out.abort()
+        fetcher.shutdown(wait=False, cancel_futures=True)
+        # A cancelled export drops the surveys that have not started and
+        # waits for the running ones, so it leaves nothing behind in the
+        # shared pool
+        renders = [future for future, (_, stage) in pending.items() if stage == "render"]
+        for future in renders:
+            future.cancel()
+        wait(renders)
+
+    return report
+
+
+# =========================
+# CLI
+# =========================
+# python pqr_batch.py 240101 240102 240103 --merge -o wave.docx
+# python pqr_batch.py input/a.xml input/b.xml -o specs.zip
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export several surveys into one .docx or a zip")
+    parser.add_argument("surveys", nargs="+", help="Decipher survey IDs or local survey.xml paths")
+    parser.add_argument("--merge", action="store_true", help="one .docx with a section per survey")
+    parser.add_argument("-o", "--output", help="output file (default: surveys.docx / surveys.zip)")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_WORKERS)
+    parser.add_argument("--expand-loops", action="store_true")
+    args = parser.parse_args()
+
+    def fetch(survey):
+        if survey.lower().endswith(".xml") and os.path.exists(survey):
+            with open(survey, "rb") as f:
+                return f.read()
+        from decipher_api import fetch_survey_xml
+        return fetch_survey_xml(survey)
+
+    def show(event):
+        print(f"[{event['done']}/{event['total']}] {event['survey_id']}: {event['status']}")
+
+    output = args.output or ("surveys.docx" if args.merge else "surveys.zip")
+    start = time.time()
+    report = export_surveys(
+        args.surveys, output, merge=args.merge, workers=args.workers,
+        expand_loops=args.expand_loops, on_progress=show, fetch=fetch
+    )
+    failed = [s for s, info in report.items() if info["status"] == "failed"]
+    print(f"{len(report) - len(failed)}/{len(report)} surveys in {time.time() - start:.2f}s → {output}")
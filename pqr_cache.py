@@ -0,0 +1,374 @@
+import argparse
+import fcntl
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+# Survey ids used in cache file names
+SURVEY_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# Niceness of the prefetch threads (Linux applies it per thread)
+PREFETCH_NICE = 10
+
+
+def content_key(xml_content):
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode("utf-8")
+    return hashlib.sha1(xml_content).hexdigest()
+
+
+# =========================
+# EXPORT CACHE
+# =========================
+class ExportCache:
+    """
+    Word exports (default selection) keyed by the hash of their survey.xml,
+    plus the XML each survey had when it was last prefetched.
+
+    Files on disk, so every gunicorn worker serves what any of them
+    rendered. A changed survey has a new hash and simply misses.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.docs_dir = os.path.join(directory, "docx")
+        self.xml_dir = os.path.join(directory, "xml")
+        self.lookups_dir = os.path.join(directory, "lookups")
+        self._last_prune = 0.0
+
+    def _makedirs(self):
+        for d in (self.docs_dir, self.xml_dir, self.lookups_dir):
+            os.makedirs(d, exist_ok=True)
+
+    def docx_path(self, xml_content):
+        return os.path.join(self.docs_dir, f"{content_key(xml_content)}.docx")
+
+    def get(self, xml_content):
+        """
+        Path of the cached .docx for this exact XML, or None
+        """
+        path = self.docx_path(xml_content)
+        return path if os.path.exists(path) else None
+
+    def render(self, xml_content):
+        """
+        Renders the default Word export of xml_content into the cache
+        (unless it is already there) and returns its path
+        """
+        from PQR import generate_word_from_survey
+        from pqr_survey import Survey
+
+        path = self.get(xml_content)
+        if path:
+            return path
+
+        self._makedirs()
+        path = self.docx_path(xml_content)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        generate_word_from_survey(Survey.from_string(xml_content), tmp_path)
+        os.replace(tmp_path, path)
+        self.prune()
+        return path
+
+    def put_xml(self, survey_id, xml_content):
+        if not SURVEY_ID_PATTERN.fullmatch(survey_id or ""):
+            return
+        self._makedirs()
+        path = os.path.join(self.xml_dir, f"{survey_id}.xml")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(xml_content)
+        os.replace(tmp_path, path)
+
+        # Every fetched survey ends up here: keep the search index current
+        from pqr_search import index_survey_later
+        index_survey_later(survey_id, xml_content)
+
+    def cached_xml(self, survey_id):
+        """
+        (XML, age in seconds) of the last copy of survey_id fetched, or None
+        """
+        if not SURVEY_ID_PATTERN.fullmatch(survey_id or ""):
+            return None
+
+        path = os.path.join(self.xml_dir, f"{survey_id}.xml")
+        try:
+            age = time.time() - os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                return f.read(), age
+        except OSError:
+            return None
+
+    def fresh_xml(self, survey_id, max_age=None):
+        """
+        The prefetched XML of survey_id if it was fetched within max_age
+        seconds (Config.PREFETCH_XML_TTL), so the export can skip the fetch
+        """
+        max_age = Config.PREFETCH_XML_TTL if max_age is None else max_age
+        cached = self.cached_xml(survey_id) if max_age else None
+        if cached is None or cached[1] > max_age:
+            return None
+        return cached[0]
+
+    def record_lookup(self, survey_id):
+        if not SURVEY_ID_PATTERN.fullmatch(survey_id or ""):
+            return
+        self._makedirs()
+        with open(os.path.join(self.lookups_dir, survey_id), "w"):
+            pass
+
+    def recent_lookups(self, window):
+        now = time.time()
+        recent = []
+        try:
+            for entry in os.scandir(self.lookups_dir):
+                age = now - entry.stat().st_mtime
+                if age <= window:
+                    recent.append(entry.name)
+                elif age > Config.EXPORT_CACHE_TTL:
+                    os.remove(entry.path)
+        except OSError:
+            pass
+        return recent
+
+    def prune(self):
+        """
+        Drops cached files older than Config.EXPORT_CACHE_TTL (at most once a minute)
+        """
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+
+        for d in (self.docs_dir, self.xml_dir):
+            if not os.path.isdir(d):
+                continue
+            for entry in os.scandir(d):
+                try:
+                    if now - entry.stat().st_mtime > Config.EXPORT_CACHE_TTL:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+export_cache = ExportCache(Config.EXPORT_CACHE_DIR)
+
+
+# =========================
+# PREFETCH
+# =========================
+def prefetch_survey(survey_id):
+    """
+    Fetches survey_id and renders its default Word export into the cache
+    """
+    from decipher_api import fetch_survey_xml
+    from pqr_memory import check_budget
+
+    start = time.time()
+    xml_content = fetch_survey_xml(survey_id)
+    export_cache.put_xml(survey_id, xml_content)
+
+    if export_cache.get(xml_content):
+        print(f"⏭ Prefetch {survey_id}: export already cached")
+        return
+
+    # Never prefetch what the export itself would refuse
+    if check_budget(len(xml_content.encode("utf-8"))):
+        print(f"⏭ Prefetch {survey_id}: over the memory budget")
+        return
+
+    export_cache.render(xml_content)
+    print(f"✅ Prefetched {survey_id} in {time.time() - start:.2f}s")
+
+
+class Prefetcher:
+    """
+    Small background pool fetching and pre-rendering surveys right after a
+    lookup. Its threads run at a lower OS priority than the request
+    threads, a survey is only queued once and at most max_queued wait.
+    """
+
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._jobs = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _lower_priority():
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+        except (AttributeError, OSError):
+            pass
+
+    def submit(self, survey_id):
+        if not SURVEY_ID_PATTERN.fullmatch(survey_id or ""):
+            return None
+
+        with self._lock:
+            job = self._jobs.get(survey_id)
+            if job is not None and not job.done():
+                return job
+
+            running = sum(1 for j in self._jobs.values() if not j.done())
+            if running >= self.workers + self.max_queued:
+                return None
+
+            # Created on first use so no thread exists before gunicorn forks
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="prefetch",
+                    initializer=self._lower_priority
+                )
+
+            job = self._executor.submit(self._run, survey_id)
+            self._jobs = {k: j for k, j in self._jobs.items() if not j.done()}
+            self._jobs[survey_id] = job
+            return job
+
+    @staticmethod
+    def _run(survey_id):
+        try:
+            prefetch_survey(survey_id)
+        except Exception as e:
+            print(f"❌ Prefetch {survey_id}: {e}")
+
+    def wait(self, survey_id, timeout=None):
+        """
+        Waits up to timeout seconds (Config.PREFETCH_WAIT_SECONDS) for a
+        prefetch of survey_id already running in this process. A job still
+        queued behind other surveys is not waited for. Returns True when
+        the prefetch finished.
+        """
+        timeout = Config.PREFETCH_WAIT_SECONDS if timeout is None else timeout
+        with self._lock:
+            job = self._jobs.get(survey_id)
+        if job is None or not (job.running() or job.done()):
+            return False
+        try:
+            job.result(timeout)
+        except Exception:
+            return job.done()
+        return True
+
+
+prefetcher = Prefetcher(Config.PREFETCH_WORKERS, Config.PREFETCH_QUEUE)
+
+
+# =========================
+# STALE-WHILE-REVALIDATE
+# =========================
+def fetch_survey_xml_cached(survey_id):
+    """
+    survey.xml for an export: (XML, None) when it is current, or
+    (XML, age in seconds) when Decipher is down or slower than
+    Config.STALE_FETCH_BUDGET and the last cached copy is used instead.
+    A stale copy is refreshed (and re-rendered) in the background.
+
+    Without a cached copy Decipher gets its full budget and an
+    UpstreamError is raised if it still fails.
+    """
+    from decipher_api import fetch_survey_xml
+    from pqr_upstream import UpstreamError
+
+    # Prefetched moments ago
+    xml_content = export_cache.fresh_xml(survey_id)
+    if xml_content:
+        return xml_content, None
+
+    cached = export_cache.cached_xml(survey_id)
+    if cached is None:
+        xml_content = fetch_survey_xml(survey_id)
+    else:
+        try:
+            xml_content = fetch_survey_xml(survey_id, budget=Config.STALE_FETCH_BUDGET)
+        except UpstreamError as e:
+            print(f"⚠ Serving cached XML of {survey_id} ({cached[1]:.0f}s old): {e}")
+            prefetcher.submit(survey_id)
+            return cached
+
+    export_cache.put_xml(survey_id, xml_content)
+    return xml_content, None
+
+
+# =========================
+# SCHEDULED PRE-RENDER
+# =========================
+def prerender_recent(window=None):
+    """
+    Re-fetches every survey looked up within window seconds and renders
+    the ones whose XML changed. Only one process runs a pass at a time.
+    """
+    window = Config.PRERENDER_WINDOW if window is None else window
+    export_cache._makedirs()
+
+    with open(os.path.join(export_cache.directory, "prerender.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another worker is on it
+            return []
+
+        survey_ids = export_cache.recent_lookups(window)
+        for survey_id in survey_ids:
+            try:
+                prefetch_survey(survey_id)
+            except Exception as e:
+                print(f"❌ Pre-render {survey_id}: {e}")
+        return survey_ids
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def start_prerender_scheduler():
+    """
+    Starts the pre-render loop of this process once (Config.PRERENDER_INTERVAL
+    seconds apart; 0 turns it off)
+    """
+    global _scheduler
+
+    if not Config.PRERENDER_INTERVAL:
+        return
+
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return
+
+        def loop():
+            prefetcher._lower_priority()
+            while True:
+                time.sleep(Config.PRERENDER_INTERVAL)
+                try:
+                    prerender_recent()
+                except Exception as e:
+                    print(f"❌ Pre-render pass failed: {e}")
+
+        _scheduler = threading.Thread(target=loop, name="prerender", daemon=True)
+        _scheduler.start()
+
+
+# =========================
+# CLI
+# =========================
+# python pqr_cache.py --prerender   one pre-render pass (e.g. from cron)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export cache maintenance")
+    parser.add_argument("--prerender", action="store_true",
+                        help="re-render the recently looked-up surveys")
+    parser.add_argument("--window", type=int, default=Config.PRERENDER_WINDOW,
+                        help="seconds since the lookup (default %(default)s)")
+    args = parser.parse_args()
+
+    if args.prerender:
+        done = prerender_recent(args.window)
+        print(f"Pre-rendered {len(done)} surveys")
+    export_cache.prune()
@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+from config import Config
+from pqr_lanes import COST_MS
+from pqr_survey import QUESTION_TYPES, Survey, is_hidden, local, question_is_yellow
+
+# Column tables of the catalog and the array typecode of each column.
+# String columns (label, type, uses, name, define) hold indexes into a
+# per-column dictionary of values.
+TABLES = {
+    "questions": {
+        "survey": "I",
+        "label": "I",
+        "type": "I",
+        "uses": "I",        # uses= family ("" when none)
+        "rows": "I",
+        "cols": "I",
+        "choices": "I",
+        "inserts": "H",     # <insert> elements of the question
+        "inserted": "I",    # options they pull in from defines
+        "loop_depth": "B",
+        "hidden": "B",      # where= keeps it from respondents
+        "disabled": "B",    # cond="0"
+        "has_cond": "B",
+        "shuffled": "B",
+    },
+    "defines": {
+        "survey": "I",
+        "define": "I",
+        "items": "I",
+        "references": "I",  # <insert source=...> pointing at it
+    },
+    "surveys": {
+        "name": "I",
+        "blocks": "I",
+        "loops": "I",
+        "max_loop_depth": "B",
+        "bytes": "I",
+    },
+}
+STRING_COLUMNS = {"label", "type", "uses", "name", "define"}
+
+OPTION_TAGS = {"row": "rows", "col": "cols", "choice": "choices", "value": "choices", "noanswer": "choices"}
+
+
+# =========================
+# BUILD
+# =========================
+class CatalogBuilder:
+    """
+    Appends one record per question / define / survey straight into
+    typed column arrays, from a single walk of each survey tree
+    """
+
+    def __init__(self):
+        self.columns = {
+            table: {name: array(code) for name, code in columns.items()}
+            for table, columns in TABLES.items()
+        }
+        self.dictionaries = {name: [] for name in STRING_COLUMNS}
+        self._codes = {name: {} for name in STRING_COLUMNS}
+        self.survey_ids = []
+
+    def encode(self, column, value):
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return codes[value]
+
+    def add_survey(self, survey_id, xml_content):
+        survey = Survey.from_string(xml_content)
+        s = len(self.survey_ids)
+        self.survey_ids.append(survey_id)
+
+        q_cols = self.columns["questions"]
+        references = Counter()
+        blocks = loops = max_depth = 0
+
+        # (element, loop depth, (record, question element) it is inside)
+        stack = [(child, 0, None) for child in reversed(survey.root)]
+        while stack:
+            elem, depth, owner = stack.pop()
+            if not isinstance(elem.tag, str):
+                continue
+            tag = local(elem.tag)
+
+            if tag == "block":
+                blocks += 1
+            elif tag == "loop":
+                loops += 1
+                depth += 1
+                max_depth = max(max_depth, depth)
+            elif tag in QUESTION_TYPES and owner is None:
+                owner = (len(q_cols["survey"]), elem)
+                self._add_question(s, elem, depth)
+            elif tag in OPTION_TAGS and owner is not None:
+                # Same options Survey.collect_options keeps
+                if not is_hidden(elem):
+                    q_cols[OPTION_TAGS[tag]][owner[0]] += 1
+            elif tag == "insert":
+                references[elem.get("source")] += 1
+                if owner is not None and elem.getparent() is owner[1]:
+                    self._add_insert(survey, owner[0], elem)
+
+            stack.extend((child, depth, owner) for child in reversed(elem))
+
+        d_cols = self.columns["defines"]
+        for label, items in survey.defines.items():
+            d_cols["survey"].append(s)
+            d_cols["define"].append(self.encode("define", label))
+            d_cols["items"].append(len(items))
+            d_cols["references"].append(references[label])
+
+        s_cols = self.columns["surveys"]
+        s_cols["name"].append(self.encode("name", survey.name))
+        s_cols["blocks"].append(blocks)
+        s_cols["loops"].append(loops)
+        s_cols["max_loop_depth"].append(min(max_depth, 255))
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode("utf-8")
+        s_cols["bytes"].append(len(xml_content))
+
+    def _add_question(self, s, q, depth):
+        cols = self.columns["questions"]
+        uses = (q.get("uses") or "").split(".")[0].lower()
+
+        cols["survey"].append(s)
+        cols["label"].append(self.encode("label", q.get("label", "NO_LABEL")))
+        cols["type"].append(self.encode("type", local(q.tag)))
+        cols["uses"].append(self.encode("uses", uses))
+        for name in ("rows", "cols", "choices", "inserts", "inserted"):
+            cols[name].append(0)
+        cols["loop_depth"].append(min(depth, 255))
+        cols["hidden"].append(question_is_yellow(q))
+        cols["disabled"].append(is_hidden(q))
+        cols["has_cond"].append(bool(q.get("cond")))
+        cols["shuffled"].append(bool(q.get("shuffle")))
+
+    def _add_insert(self, survey, i, ins):
+        cols = self.columns["questions"]
+        cols["inserts"][i] += 1
+        for item in survey.resolve_insert(ins):
+            if item.get("cond") == "0":
+                continue
+            cols["inserted"][i] += 1
+            cols[OPTION_TAGS.get(item.get("tag"), "choices")][i] += 1
+
+    def save(self, directory):
+        """
+        Writes every column as a raw native array (<table>.<column>.bin,
+        loadable with array.fromfile or numpy.fromfile) plus catalog.json
+        with the typecodes, lengths and dictionaries
+        """
+        os.makedirs(directory, exist_ok=True)
+        for table, columns in self.columns.items():
+            for name, values in columns.items():
+                with open(os.path.join(directory, f"{table}.{name}.bin"), "wb") as f:
+                    values.tofile(f)
+
+        schema = {
+            "built_at": time.time(),
+            "survey_ids": self.survey_ids,
+            "tables": {
+                table: {
+                    "length": len(next(iter(columns.values()))),
+                    "columns": {name: values.typecode for name, values in columns.items()},
+                }
+                for table, columns in self.columns.items()
+            },
+            "dictionaries": self.dictionaries,
+        }
+        tmp_path = os.path.join(directory, "catalog.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(schema, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, "catalog.json"))
+
+
+def cached_surveys():
+    """
+    (survey_id, XML) of every survey in the export cache
+    """
+    from pqr_cache import export_cache
+
+    if not os.path.isdir(export_cache.xml_dir):
+        return
+    for entry in os.scandir(export_cache.xml_dir):
+        if entry.name.endswith(".xml"):
+            with open(entry.path, "rb") as f:
+                yield entry.name[:-4], f.read()
+
+def build_catalog(surveys=None, directory=None):
+    """
+    Builds the catalog from (survey_id, XML) pairs (default: every survey
+    fetched so far) and saves it
+    """
+    builder = CatalogBuilder()
+    for survey_id, xml_content in surveys if surveys is not None else cached_surveys():
+        try:
+            builder.add_survey(survey_id, xml_content)
+        except Exception as e:
+            print(f"❌ Catalog: skipping {survey_id}: {e}")
+    builder.save(directory or Config.CATALOG_DIR)
+    return Catalog.load(directory)
+
+
+# =========================
+# QUERIES
+# =========================
+class Catalog:
+    """
+    Loaded catalog columns with aggregate queries that run over whole
+    columns at a time (zip / compress / Counter), never record by record
+    """
+
+    def __init__(self, schema, columns):
+        self.schema = schema
+        self.columns = columns
+        self.dictionaries = schema["dictionaries"]
+        self.survey_ids = schema["survey_ids"]
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or Config.CATALOG_DIR
+        try:
+            with open(os.path.join(directory, "catalog.json"), encoding="utf-8") as f:
+                schema = json.load(f)
+        except OSError:
+            return None
+
+        columns = {}
+        for table, info in schema["tables"].items():
+            columns[table] = {}
+            for name, code in info["columns"].items():
+                values = array(code)
+                with open(os.path.join(directory, f"{table}.{name}.bin"), "rb") as f:
+                    values.fromfile(f, info["length"])
+                columns[table][name] = values
+        return cls(schema, columns)
+
+    def column(self, table, name):
+        return self.columns[table][name]
+
+    def decode(self, name, counts):
+        values = self.dictionaries[name]
+        return {values[code]: n for code, n in counts.items()}
+
+    def count_by(self, name, mask=None, table="questions"):
+        """
+        {value: number of records}, optionally only where mask is set
+        """
+        values = self.column(table, name)
+        if mask is not None:
+            values = compress(values, mask)
+        counts = Counter(values)
+        return self.decode(name, counts) if name in STRING_COLUMNS else dict(counts)
+
+    def sum_by(self, key, values, table="questions"):
+        """
+        {value of key: total of values}; values is a column name or an
+        array as long as the table
+        """
+        if isinstance(values, str):
+            values = self.column(table, values)
+        totals = self.sum_column(self.column(table, key), values)
+        return self.decode(key, totals) if key in STRING_COLUMNS else dict(totals)
+
+    def options(self):
+        q = self.columns["questions"]
+        return array("I", map(sum, zip(q["rows"], q["cols"], q["choices"])))
+
+    def survey_costs(self):
+        """
+        Estimated Word render ms per survey, with the same weights as the
+        export lanes (pqr_lanes.COST_MS)
+        """
+        q = self.columns["questions"]
+        s = self.columns["surveys"]
+        # Inserted options are costed through their <insert>
+        plain = array("I", map(lambda o, i: o - i, self.options(), q["inserted"]))
+
+        questions = Counter(q["survey"])
+        options = self.sum_column(q["survey"], plain)
+        inserts = self.sum_column(q["survey"], q["inserts"])
+
+        return {
+            survey_id: round(
+                questions[i] * COST_MS["question"]
+                + options[i] * COST_MS["option"]
+                + inserts[i] * COST_MS["insert"]
+                + s["blocks"][i] * COST_MS["block"]
+                + s["loops"][i] * COST_MS["loop"]
+            )
+            for i, survey_id in enumerate(self.survey_ids)
+        }
+
+    @staticmethod
+    def sum_column(keys, values):
+        totals = Counter()
+        for k, v in zip(keys, values):
+            totals[k] += v
+        return totals
+
+    def summary(self):
+        q = self.columns["questions"]
+        d = self.columns["defines"]
+        options = self.options()
+        n = len(q["survey"])
+
+        fan_out = sorted(
+            zip(d["references"], d["define"], d["survey"]), reverse=True
+        )[:10]
+
+        return {
+            "surveys": len(self.survey_ids),
+            "questions": n,
+            "built_at": self.schema["built_at"],
+            "questions_by_type": self.count_by("type"),
+            "questions_by_uses": {u or "(none)": c for u, c in self.count_by("uses").items()},
+            "options": {
+                "total": sum(options),
+                "mean_per_question": round(sum(options) / n, 2) if n else 0,
+                "max_per_question": max(options, default=0),
+                "inserted": sum(q["inserted"]),
+            },
+            "loop_depth": self.count_by("loop_depth"),
+            "hidden": sum(q["hidden"]),
+            "disabled": sum(q["disabled"]),
+            "with_cond": sum(q["has_cond"]),
+            "shuffled": sum(q["shuffled"]),
+            "options_by_type": self.sum_by("type", options),
+            "defines": {
+                "total": len(d["define"]),
+                "references": sum(d["references"]),
+                "unused": d["references"].tolist().count(0),
+                "top_fan_out": [
+                    {
+                        "survey_id": self.survey_ids[s],
+                        "define": self.dictionaries["define"][label],
+                        "references": refs,
+                    }
+                    for refs, label, s in fan_out if refs
+                ],
+            },
+            "estimated_render_ms": self.survey_costs(),
+        }
+
+
+# =========================
+# CLI
+# =========================
+# python pqr_catalog.py --build               from every survey fetched so far
+# python pqr_catalog.py --build input/*.xml   from local files (id = file name)
+# python pqr_catalog.py                       print the statistics
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Survey catalog statistics")
+    parser.add_argument("--build", nargs="*", metavar="XML", help="rebuild the catalog")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.build is not None:
+        def files():
+            for path in args.build:
+                with open(path, "rb") as f:
+                    yield os.path.splitext(os.path.basename(path))[0], f.read()
+
+        catalog = build_catalog(files() if args.build else None)
+        print(f"Built in {time.time() - start:.2f}s")
+    else:
+        catalog = Catalog.load()
+
+    if catalog is None:
+        print("No catalog yet, run with --build")
+    else:
+        start = time.time()
+        summary = catalog.summary()
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        print(f"Aggregated in {(time.time() - start) * 1000:.1f} ms")
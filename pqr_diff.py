@@ -0,0 +1,424 @@
+import argparse
+import hashlib
+import json
+import os
+from collections import Counter
+
+from pqr_survey import EXPORT_END_LABEL, EXPORT_START_LABEL, ExportSelection, Survey, iter_survey
+
+# Option lists compared option by option (by option label and occurrence);
+# groups are compared the same way, then row by row
+OPTION_FIELDS = ("groups", "rows", "cols", "choices")
+
+# Event keys that only describe the walk, not the content
+IGNORED_FIELDS = {"kind", "label"}
+
+
+def content_hash(content):
+    data = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+# =========================
+# SURVEY SNAPSHOT
+# =========================
+class SurveySnapshot:
+    """
+    Flattened export of a survey: one node per block / loop / question /
+    info / term / suspend, keyed by label. Each node carries the hash of
+    its own (resolved) content and a hash of its whole subtree.
+
+    Without a selection the whole survey is compared, not only the
+    te1 ... b3 export range (a survey may have no markers at all).
+    """
+
+    def __init__(self, survey, selection=None):
+        self.name = survey.name
+        self.nodes = {}
+        self.roots = []
+
+        if selection is None:
+            selection = ExportSelection(elements=list(survey.root))
+
+        stack = []
+        unlabeled = {}
+
+        for _, ev in iter_survey(survey, selection):
+            kind = ev["kind"]
+
+            if kind in {"block_end", "loop_end"}:
+                self._finish(stack.pop())
+                continue
+
+            parent = stack[-1] if stack else None
+            base_kind = kind[:-len("_start")] if kind.endswith("_start") else kind
+
+            # Unlabeled html / suspend / term are keyed by position in the parent
+            label = ev.get("label")
+            if label:
+                key = label
+            else:
+                counter = (parent, base_kind)
+                unlabeled[counter] = unlabeled.get(counter, 0) + 1
+                key = f"{parent or ''}/{base_kind}#{unlabeled[counter]}"
+
+            # Repeated labels keep their order
+            if key in self.nodes:
+                n = 2
+                while f"{key}#{n}" in self.nodes:
+                    n += 1
+                key = f"{key}#{n}"
+
+            node = {
+                "key": key,
+                "kind": base_kind,
+                "label": label,
+                "parent": parent,
+                "content": ev,
+                "hash": content_hash(ev),
+                "children": [],
+            }
+            self.nodes[key] = node
+            (self.nodes[parent]["children"] if parent else self.roots).append(key)
+
+            if kind.endswith("_start"):
+                stack.append(key)
+            else:
+                node["tree_hash"] = node["hash"]
+
+    @property
+    def fingerprint(self):
+        """
+        Hash of the whole export (the survey name is its title); equal
+        fingerprints render the same
+        """
+        return hashlib.sha1(
+            (self.name + "".join(k + self.nodes[k]["tree_hash"] for k in self.roots)).encode("utf-8")
+        ).hexdigest()
+
+    def _finish(self, key):
+        node = self.nodes[key]
+        child_hashes = "".join(self.nodes[c]["tree_hash"] for c in node["children"])
+        node["tree_hash"] = hashlib.sha1(
+            (node["hash"] + child_hashes).encode("ascii")
+        ).hexdigest()
+
+
+# =========================
+# DIFF
+# =========================
+def option_keys(options):
+    """
+    (label, occurrence) of each option: a question's own rows and rows
+    inserted from a define may share labels
+    """
+    seen = Counter()
+    keys = []
+    for o in options:
+        label = o.get("label")
+        seen[label] += 1
+        keys.append((label, seen[label]))
+    return keys
+
+def diff_options(old, new):
+    old_keys, new_keys = option_keys(old), option_keys(new)
+    old_by_key = dict(zip(old_keys, old))
+    new_by_key = dict(zip(new_keys, new))
+
+    modified = []
+    for key, o in zip(new_keys, new):
+        old_o = old_by_key.get(key)
+        if old_o is None or old_o == o:
+            continue
+        change = {"label": key[0], "old": old_o, "new": o}
+        if "rows" in o:
+            # A group: which of its rows changed
+            change["rows"] = diff_options(old_o.get("rows") or [], o["rows"])
+        modified.append(change)
+
+    return {
+        "added": [o for key, o in zip(new_keys, new) if key not in old_by_key],
+        "removed": [o for key, o in zip(old_keys, old) if key not in new_by_key],
+        "modified": modified,
+    }
+
+def diff_content(old, new):
+    """
+    Field by field changes between two event dicts
+    """
+    changes = {}
+
+    for field in list(old) + [f for f in new if f not in old]:
+        if field in IGNORED_FIELDS:
+            continue
+        a, b = old.get(field), new.get(field)
+        if a == b:
+            continue
+        if field in OPTION_FIELDS:
+            changes[field] = diff_options(a or [], b or [])
+        else:
+            changes[field] = {"old": a, "new": b}
+
+    return changes
+
+
+class SurveyDiff:
+    """
+    Added, removed and modified items between two versions of a survey,
+    aligned by label. Unchanged subtrees are skipped by their hash.
+    """
+
+    def __init__(self, old, new):
+        # SurveySnapshot of each version
+        self.old = old
+        self.new = new
+        self.added = []
+        self.removed = []
+        self.modified = []
+        self._compare()
+
+    @classmethod
+    def from_surveys(cls, old, new, selection=None):
+        return cls(SurveySnapshot(old, selection), SurveySnapshot(new, selection))
+
+    def _compare(self):
+        old_nodes, new_nodes = self.old.nodes, self.new.nodes
+
+        stack = list(reversed(self.new.roots))
+        while stack:
+            key = stack.pop()
+            node = new_nodes[key]
+            old_node = old_nodes.get(key)
+
+            if old_node is None:
+                self.added.append(node)
+            else:
+                moved = old_node["parent"] != node["parent"]
+                if not moved and old_node["tree_hash"] == node["tree_hash"]:
+                    # Whole subtree unchanged
+                    continue
+
+                changes = {}
+                if old_node["hash"] != node["hash"]:
+                    changes = diff_content(old_node["content"], node["content"])
+                if old_node["children"] != node["children"]:
+                    changes["children"] = {"old": old_node["children"], "new": node["children"]}
+                if moved:
+                    changes["parent"] = {"old": old_node["parent"], "new": node["parent"]}
+
+                if changes:
+                    self.modified.append({
+                        "key": key,
+                        "kind": node["kind"],
+                        "label": node["label"],
+                        "old": old_node["content"],
+                        "new": node["content"],
+                        "changes": changes,
+                    })
+
+            stack.extend(reversed(node["children"]))
+
+        self.removed = [
+            node for key, node in old_nodes.items()
+            if key not in new_nodes
+        ]
+
+    @property
+    def has_changes(self):
+        return bool(self.added or self.removed or self.modified)
+
+    def summary(self):
+        return {
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "modified": len(self.modified),
+        }
+
+    def to_dict(self):
+        return {
+            "old_name": self.old.name,
+            "new_name": self.new.name,
+            "summary": self.summary(),
+            "added": [{"key": n["key"], "kind": n["kind"], "content": n["content"]} for n in self.added],
+            "removed": [{"key": n["key"], "kind": n["kind"], "content": n["content"]} for n in self.removed],
+            "modified": self.modified,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+
+def diff_survey_files(old_path, new_path, selection=None):
+    return SurveyDiff.from_surveys(Survey.from_file(old_path), Survey.from_file(new_path), selection)
+
+
+# =========================
+# CHANGES-ONLY DOCX
+# =========================
+def format_value(value):
+    if value is None or value == [] or value == "":
+        return "(none)"
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, list):
+        return "; ".join(format_value(v) for v in value)
+    if isinstance(value, dict):
+        if "label" in value and "text" in value:
+            return f"{value['label']}: {value['text']}"
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def item_title(node):
+    content = node["content"]
+    if node["kind"] == "question":
+        return f"{content['label']} ({content['type']})"
+    return f"{node['kind'].capitalize()}: {node['label'] or node['key']}"
+
+def write_diff_docx(diff, output_path):
+    """
+    Writes only the changed items to a .docx, old values in red and new
+    values in blue. output_path may be a path or a writable file object.
+    """
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.shared import RGBColor
+
+    from pqr_stream import StreamingDocxWriter
+    from pqr_template import new_document
+
+    OLD_RED = RGBColor(255, 0, 0)
+    NEW_BLUE = RGBColor(68, 114, 196)
+
+    doc, STYLE_IDS = new_document()
+
+    # The export legend does not apply to this document
+    for p in doc.paragraphs:
+        p._p.getparent().remove(p._p)
+
+    def add_paragraph(text="", style=None):
+        p = doc.add_paragraph(text)
+        if style is not None:
+            p._p.style = STYLE_IDS[style]
+        return p
+
+    def add_heading(text, level):
+        return add_paragraph(text, f"Heading {level}")
+
+    def colored(label, text, color, style=None):
+        p = add_paragraph(style=style)
+        r = p.add_run(label)
+        r.bold = True
+        r = p.add_run(text)
+        r.font.color.rgb = color
+
+    def option_changes(change, prefix=""):
+        for o in change["added"]:
+            colored(f"{prefix}+ ", format_value(o), NEW_BLUE, "List Continue")
+        for o in change["removed"]:
+            colored(f"{prefix}- ", format_value(o), OLD_RED, "List Continue")
+        for o in change["modified"]:
+            if "rows" not in o:
+                colored(f"{prefix}{o['label']} old: ", format_value(o["old"]), OLD_RED, "List Continue")
+                colored(f"{prefix}{o['label']} new: ", format_value(o["new"]), NEW_BLUE, "List Continue")
+                continue
+            # A group: its title, then its rows
+            if o["old"]["text"] != o["new"]["text"]:
+                colored(f"{o['label']} old: ", o["old"]["text"], OLD_RED, "List Continue")
+                colored(f"{o['label']} new: ", o["new"]["text"], NEW_BLUE, "List Continue")
+            option_changes(o["rows"], prefix=f"{o['label']} ")
+
+    heading = add_heading(f"Survey changes: {diff.new.name}", level=1)
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    summary = diff.summary()
+    add_paragraph(
+        f"Added: {summary['added']}   Removed: {summary['removed']}   "
+        f"Modified: {summary['modified']}"
+    )
+
+    out = open(output_path, "wb") if isinstance(output_path, (str, os.PathLike)) else output_path
+    writer = StreamingDocxWriter(doc, out)
+
+    completed = False
+    try:
+        writer.start()
+
+        if diff.modified:
+            add_heading("Modified", level=2)
+        for item in diff.modified:
+            add_heading(item_title({"kind": item["kind"], "key": item["key"],
+                                    "label": item["label"], "content": item["new"]}), level=3)
+
+            for field, change in item["changes"].items():
+                name = field.replace("_", " ").capitalize()
+
+                if field in OPTION_FIELDS:
+                    add_paragraph(f"{name}:").runs[0].bold = True
+                    option_changes(change)
+                    continue
+
+                colored(f"{name} old: ", format_value(change["old"]), OLD_RED)
+                colored(f"{name} new: ", format_value(change["new"]), NEW_BLUE)
+
+            writer.flush()
+
+        for title, nodes, color in [
+            ("Added", diff.added, NEW_BLUE),
+            ("Removed", diff.removed, OLD_RED),
+        ]:
+            if not nodes:
+                continue
+            add_heading(title, level=2)
+            for node in nodes:
+                p = add_paragraph(style="List Bullet")
+                r = p.add_run(item_title(node))
+                r.bold = True
+                r.font.color.rgb = color
+                if node["kind"] == "question" and node["content"].get("text"):
+                    p.add_run(f" – {node['content']['text']}")
+                writer.flush()
+
+        writer.close()
+        completed = True
+    finally:
+        if not completed:
+            writer.abort()
+        if out is not output_path:
+            out.close()
+            # Partial file of a failed render
+            if not completed:
+                os.remove(output_path)
+
+
+# =========================
+# CLI
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Changes between two survey.xml versions")
+    parser.add_argument("old_xml")
+    parser.add_argument("new_xml")
+    parser.add_argument("-o", "--output", help="changes .docx or .json (default: JSON to stdout)")
+    parser.add_argument("--labels", help="comma separated labels to compare (default: whole survey)")
+    parser.add_argument("--pattern", help="regex of the labels to compare")
+    parser.add_argument("--range", action="store_true",
+                        help=f"compare the export range only ({EXPORT_START_LABEL} ... {EXPORT_END_LABEL})")
+    args = parser.parse_args()
+
+    selection = None
+    if args.labels or args.pattern:
+        labels = [label.strip() for label in (args.labels or "").split(",") if label.strip()]
+        selection = ExportSelection(labels=labels or None, pattern=args.pattern)
+    elif args.range:
+        selection = ExportSelection()
+
+    diff = diff_survey_files(args.old_xml, args.new_xml, selection)
+
+    if args.output and args.output.endswith(".docx"):
+        write_diff_docx(diff, args.output)
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(diff.to_json())
+    else:
+        print(diff.to_json())
+
+    if args.output:
+        print(f"Changes: {diff.summary()}")
@@ -1,4 +1,245 @@
-from PQR import generate_word_from_xml_file
+import io
+import threading
 
-def export_word_from_xml_file(xml_path, output_path):
-    generate_word_from_xml_file(xml_path, output_path)
+from PQR import generate_word_from_survey, generate_word_from_xml_file
+from pqr_jobs import ExportCancelled
+from pqr_lanes import FAST_LANE, SLOW_LANE, slow_lane
+from pqr_stream import ChunkPipe, PipeStream, StreamAborted
+from pqr_survey import Survey
+from pqr_template import warm_up as warm_up_template
+
+# Tiny survey rendered once at startup so every code path is imported and
+# initialised before gunicorn forks its workers
+WARMUP_XML = b"""<survey alt="Warmup">
+  <html label="te1">Warmup</html>
+  <block label="warmup_block">
+    <radio label="Q1">
+      <title>Warmup question</title>
+      <row label="r1">Yes</row>
+      <row label="r2">No</row>
+    </radio>
+  </block>
+  <suspend/>
+  <html label="b3">Done</html>
+</survey>"""
+
+def export_word_from_xml_file(xml_path, output_path, selection=None, cancel=None, expand_loops=False,
+                              reference_report=False, toc=False):
+    generate_word_from_xml_file(
+        xml_path, output_path, selection, cancel, expand_loops, reference_report=reference_report, toc=toc
+    )
+
+def stream_word_from_xml_file(xml_path, selection=None, on_close=None, lane=FAST_LANE, cancel=None,
+                              expand_loops=False, progress=None, reference_report=False, toc=False):
+    """
+    Renders xml_path in a background thread and returns an iterable of the
+    .docx bytes as they are produced.
+
+    Fast lane renders start right away on their own thread; slow lane
+    renders go through the bounded slow_lane pool, which raises LaneFull
+    (before anything is streamed) when it is saturated.
+
+    cancel (CancelToken) stops the render between elements; it is also
+    cancelled when the response is closed early.
+    progress (ExportProgress) follows the render through to its final phase.
+    """
+    def render(pipe):
+        generate_word_from_xml_file(xml_path, pipe, selection, cancel, expand_loops, progress,
+                                    reference_report, toc)
+
+    return _stream_word(render, xml_path, on_close, lane, cancel, progress)
+
+def stream_word_from_survey(survey, selection=None, on_close=None, lane=FAST_LANE, cancel=None,
+                            expand_loops=False, progress=None, reference_report=False, toc=False):
+    """
+    Same as stream_word_from_xml_file for an already parsed Survey (uploads)
+    """
+    def render(pipe):
+        generate_word_from_survey(survey, pipe, selection, cancel, expand_loops, progress,
+                                  reference_report, toc)
+
+    return _stream_word(render, survey.name, on_close, lane, cancel, progress)
+
+def _stream_word(render, name, on_close, lane, cancel, progress):
+    pipe = ChunkPipe()
+
+    def stopped(phase, error):
+        if progress is not None:
+            progress.update(phase=phase, error=str(error))
+
+    def run():
+        # Client gave up while the job was queued
+        if pipe.aborted:
+            stopped("cancelled", "Export closed")
+            return
+        try:
+            # Superseded or past its deadline while queued
+            if cancel is not None:
+                cancel.check()
+            render(pipe)
+        except StreamAborted:
+            stopped("cancelled", "Export closed")
+            pipe.finish()
+        except ExportCancelled as e:
+            print(f"{e}: {name}")
+            stopped("cancelled", e)
+            pipe.finish(e)
+        except Exception as e:
+            stopped("failed", e)
+            pipe.finish(e)
+        else:
+            pipe.finish()
+
+    if lane == SLOW_LANE:
+        slow_lane.submit(run)
+    else:
+        threading.Thread(target=run, daemon=True).start()
+
+    def close():
+        if cancel is not None:
+            cancel.cancel("closed")
+        if on_close:
+            on_close()
+
+    # Client gone or stream finished: close() stops the render and cleans up
+    return PipeStream(pipe, close)
+
+def stream_export_from_xml_file(xml_path, renderer, selection=None, on_close=None, cancel=None,
+                                expand_loops=False, progress=None, reference_report=False):
+    """
+    Streams a JSON / Markdown / HTML export of xml_path as utf-8 bytes
+    """
+    def parse():
+        if progress is not None:
+            progress.update(phase="parsing")
+        return Survey.from_file(xml_path)
+
+    return _stream_export(parse, renderer, selection, on_close, cancel, expand_loops, progress,
+                          reference_report)
+
+def stream_export_from_survey(survey, renderer, selection=None, on_close=None, cancel=None,
+                              expand_loops=False, progress=None, reference_report=False):
+    """
+    Same as stream_export_from_xml_file for an already parsed Survey (uploads)
+    """
+    return _stream_export(lambda: survey, renderer, selection, on_close, cancel, expand_loops, progress,
+                          reference_report)
+
+def _stream_export(load_survey, renderer, selection, on_close, cancel, expand_loops, progress,
+                   reference_report):
+    sent = 0
+    try:
+        survey = load_survey()
+
+        for chunk in renderer.stream(survey, selection, expand_loops, progress, reference_report):
+            if cancel is not None:
+                cancel.check()
+            data = chunk.encode("utf-8")
+            sent += len(data)
+            if progress is not None:
+                progress.update(bytes=sent)
+            yield data
+
+        if progress is not None:
+            progress.update(phase="done", bytes=sent)
+    except (ExportCancelled, GeneratorExit) as e:
+        if progress is not None:
+            progress.update(phase="cancelled", error=str(e) or "Export closed")
+        raise
+    except Exception as e:
+        if progress is not None:
+            progress.update(phase="failed", error=str(e))
+        raise
+    finally:
+        if on_close:
+            on_close()
+
+def stream_surveys(survey_ids, merge=False, selection=None, expand_loops=False,
+                   cancel=None, on_progress=None):
+    """
+    Multi-survey export (see pqr_batch.export_surveys) written into a
+    response stream from a background thread. Closing the stream cancels
+    the export and waits until its renders have left the process pool.
+    """
+    from pqr_batch import export_surveys
+
+    pipe = ChunkPipe()
+
+    def run():
+        try:
+            export_surveys(
+                survey_ids, pipe, merge=merge, selection=selection,
+                expand_loops=expand_loops, cancel=cancel, on_progress=on_progress
+            )
+        except StreamAborted:
+            pipe.finish()
+        except ExportCancelled as e:
+            print(f"{e}: {', '.join(survey_ids)}")
+            pipe.finish(e)
+        except Exception as e:
+            pipe.finish(e)
+        else:
+            pipe.finish()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    def close():
+        if cancel is not None:
+            cancel.cancel("closed")
+        thread.join()
+
+    return PipeStream(pipe, close)
+
+def stream_languages(base_xml, translations, name="survey", selection=None, expand_loops=False,
+                     cancel=None, errors=None):
+    """
+    Multi-language export (see pqr_languages.export_languages) written into
+    a response stream from a background thread. Closing the stream cancels
+    the export and waits until its renders have left the process pool.
+    """
+    from pqr_languages import export_languages
+
+    pipe = ChunkPipe()
+
+    def run():
+        try:
+            report = export_languages(
+                base_xml, translations, pipe, name=name, selection=selection,
+                expand_loops=expand_loops, cancel=cancel, errors=errors
+            )
+        except StreamAborted:
+            pipe.finish()
+        except ExportCancelled as e:
+            print(f"{e}: {name}")
+            pipe.finish(e)
+        except Exception as e:
+            pipe.finish(e)
+        else:
+            print(f"Language export {name}: {report}")
+            pipe.finish()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    def close():
+        if cancel is not None:
+            cancel.cancel("closed")
+        thread.join()
+
+    return PipeStream(pipe, close)
+
+def warm_up():
+    """
+    Builds the base document and renders WARMUP_XML through every export
+    format, discarding the output
+    """
+    from pqr_renderers import RENDERERS
+
+    warm_up_template()
+    generate_word_from_xml_file(io.BytesIO(WARMUP_XML), io.BytesIO())
+
+    survey = Survey.from_string(WARMUP_XML)
+    for renderer_cls in set(RENDERERS.values()):
+        for _ in renderer_cls().stream(survey):
+            pass
@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Config
+
+# Imported once by the fork server, so render processes start warm
+RENDER_PRELOAD = ["PQR"]
+
+
+class ExportCancelled(Exception):
+    """
+    Raised inside a render once its CancelToken is cancelled
+    """
+
+
+class ExportTimedOut(ExportCancelled):
+    """
+    Raised inside a render once its deadline has passed
+    """
+
+
+# =========================
+# CANCELLATION
+# =========================
+class CancelToken:
+    """
+    Checked by the renderers between elements. cancel() may be called from
+    any thread; the render stops at its next check().
+    """
+
+    def __init__(self, timeout=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise ExportCancelled(f"Export {self.reason}")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.cancel("timed out")
+            raise ExportTimedOut("Export timed out")
+
+
+# =========================
+# RUNNING EXPORTS
+# =========================
+class ExportJobs:
+    """
+    Latest export per key (survey + client). Starting a new export for the
+    same key cancels the one it supersedes.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, key, token):
+        with self._lock:
+            previous = self._jobs.get(key)
+            self._jobs[key] = token
+        if previous is not None:
+            previous.cancel("superseded")
+
+    def finish(self, key, token):
+        with self._lock:
+            if self._jobs.get(key) is token:
+                del self._jobs[key]
+
+
+export_jobs = ExportJobs()
+
+
+# =========================
+# RENDER PROCESSES
+# =========================
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+def render_pool():
+    """
+    Process pool of this gunicorn worker, created on first use. Its
+    processes come from a fork server (spawn where there is none): forking
+    the threaded worker itself could copy a lock some other thread holds.
+    A pool broken by a crashed process is replaced.
+    """
+    global _render_pool, _render_pool_pid
+
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool._broken or _render_pool_pid != os.getpid():
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(RENDER_PRELOAD)
+            else:
+                context = multiprocessing.get_context("spawn")
+
+            _render_pool = ProcessPoolExecutor(max_workers=Config.RENDER_WORKERS, mp_context=context)
+            _render_pool_pid = os.getpid()
+
+        return _render_pool
@@ -0,0 +1,150 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from pqr_survey import QUESTION_TYPES
+
+# Opening tags the pre-scan counts; the XML is not parsed
+SCAN_PATTERN = re.compile(
+    rb"<(radio|checkbox|select|text|textarea|number|float|row|col|choice|insert|loop|block)[\s/>]"
+)
+
+# Estimated Word render cost in milliseconds per element (an <insert>
+# stands for the few options it pulls in from its define)
+COST_MS = {
+    "question": 2.0,
+    "option": 0.3,
+    "insert": 1.0,
+    "block": 0.5,
+    "loop": 1.0,
+}
+
+# Longest match of SCAN_PATTERN ("<checkbox" plus one character)
+SCAN_TAIL = 10
+
+FAST_LANE = "fast"
+SLOW_LANE = "slow"
+
+
+class LaneFull(Exception):
+    """
+    Raised when the slow lane already has as many jobs as it may queue
+    """
+
+
+# =========================
+# PRE-SCAN
+# =========================
+def scan_xml(xml_content):
+    """
+    Size and element counts of a survey.xml (str or bytes) and the
+    estimated render cost, from a regex pass over the raw text
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode("utf-8")
+
+    scan = XmlScan()
+    scan.feed(xml_content)
+    return scan.result()
+
+
+class XmlScan:
+    """
+    scan_xml over a survey.xml arriving in chunks (uploads); an opening
+    tag cut in two by a chunk boundary is counted once it is complete
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.counts = {}
+        self._tail = b""
+
+    @staticmethod
+    def _count(counts, data, end):
+        for m in SCAN_PATTERN.finditer(data, 0, end):
+            tag = m.group(1).decode("ascii")
+            counts[tag] = counts.get(tag, 0) + 1
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        data = self._tail + chunk
+
+        # Hold back a trailing "<..." that may still be an incomplete tag
+        cut = data.rfind(b"<")
+        if cut == -1 or len(data) - cut > SCAN_TAIL:
+            cut = len(data)
+        self._count(self.counts, data, cut)
+        self._tail = data[cut:]
+
+    def result(self):
+        counts = dict(self.counts)
+        self._count(counts, self._tail, len(self._tail))
+
+        scan = {
+            "bytes": self.size,
+            "questions": sum(counts.get(t, 0) for t in QUESTION_TYPES),
+            "options": counts.get("row", 0) + counts.get("col", 0) + counts.get("choice", 0),
+            "inserts": counts.get("insert", 0),
+            "blocks": counts.get("block", 0),
+            "loops": counts.get("loop", 0),
+        }
+        scan["cost_ms"] = round(
+            scan["questions"] * COST_MS["question"]
+            + scan["options"] * COST_MS["option"]
+            + scan["inserts"] * COST_MS["insert"]
+            + scan["blocks"] * COST_MS["block"]
+            + scan["loops"] * COST_MS["loop"]
+        )
+        return scan
+
+
+def choose_lane(scan):
+    return SLOW_LANE if scan["cost_ms"] >= Config.SLOW_LANE_THRESHOLD_MS else FAST_LANE
+
+
+# =========================
+# SLOW LANE
+# =========================
+class SlowLanePool:
+    """
+    Bounded pool for large renders: at most `workers` run at once and at
+    most `max_queued` more wait, so a burst of huge surveys cannot take
+    every thread of the worker.
+    """
+
+    def __init__(self, workers, max_queued):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers + max_queued)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so no thread exists before gunicorn forks
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="slow-lane"
+                    )
+        return self._executor
+
+    def submit(self, fn):
+        if not self._slots.acquire(blocking=False):
+            raise LaneFull("Too many large exports in progress, please retry shortly.")
+
+        def job():
+            try:
+                fn()
+            finally:
+                self._slots.release()
+
+        try:
+            return self._get_executor().submit(job)
+        except Exception:
+            self._slots.release()
+            raise
+
+
+slow_lane = SlowLanePool(Config.SLOW_LANE_WORKERS, Config.SLOW_LANE_QUEUE)
@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import deepcopy
+
+from lxml import etree
+
+from config import Config
+from pqr_survey import Survey, SurveyIndex, check_parsed, local, xml_parser
+
+# Decipher keeps one translation file per language next to survey.xml
+LANGUAGE_FILE = "lang-{language}.xml"
+LANGUAGE_FILE_PATTERN = re.compile(r"lang-([A-Za-z0-9_]+)\.xml$", re.I)
+
+# Elements whose content is translatable text. Their attributes (logic)
+# always come from the base survey, only text and inline markup are swapped.
+TEXT_TAGS = {"title", "comment", "row", "col", "choice", "noanswer", "html", "res", "loopvar", "case"}
+
+
+def parse_xml(xml_content):
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode("utf-8")
+    parser = xml_parser()
+    root = etree.fromstring(xml_content, parser)
+    check_parsed(parser)
+    return root
+
+def survey_languages(base_xml):
+    """
+    (base language, other languages) from the <survey> tag, without
+    parsing the rest of the file
+    """
+    if isinstance(base_xml, str):
+        base_xml = base_xml.encode("utf-8")
+
+    for _, elem in etree.iterparse(io.BytesIO(base_xml), events=("start",), recover=True):
+        others = elem.get("otherLanguages", "")
+        return elem.get("lang", "english"), [l.strip() for l in others.split(",") if l.strip()]
+    return "english", []
+
+
+# =========================
+# TEXT SLOTS
+# =========================
+def text_slots(root):
+    """
+    {key: element} of every translatable element in document order.
+
+    The key is (owner, tag, label) where owner is the label of the nearest
+    labelled question / block / define around it; unlabelled elements
+    (title, comment, ...) are numbered per owner. A translation file keyed
+    the same way maps onto the survey even if it leaves out the blocks.
+    """
+    slots = {}
+    counters = {}
+    stack = [(child, "") for child in reversed(root)]
+
+    while stack:
+        elem, owner = stack.pop()
+        if not isinstance(elem.tag, str):
+            continue
+
+        tag = local(elem.tag)
+        label = elem.get("label")
+
+        if tag in TEXT_TAGS:
+            if not label:
+                n = counters.get((owner, tag), 0)
+                counters[(owner, tag)] = n + 1
+                label = f"#{n}"
+            slots[(owner, tag, label)] = elem
+            continue
+
+        owner = label or owner
+        stack.extend((child, owner) for child in reversed(elem))
+
+    return slots
+
+def apply_translation(slots, translation):
+    """
+    Swaps the translated content into the matching base elements and
+    returns what restore_translation needs to undo it
+    """
+    undo = []
+
+    for key, source in translation.items():
+        target = slots.get(key)
+        if target is None or (source.text is None and not len(source)):
+            continue
+
+        undo.append((target, target.text, list(target)))
+        for child in list(target):
+            target.remove(child)
+        target.text = source.text
+        for child in source:
+            target.append(deepcopy(child))
+
+    return undo
+
+def restore_translation(undo):
+    for target, text, children in reversed(undo):
+        for child in list(target):
+            target.remove(child)
+        target.text = text
+        target.extend(children)
+
+
+# =========================
+# WORKER PROCESS
+# =========================
+# Last base survey of this render process (by hash): parsed, keyed and
+# indexed once, then every language is swapped in, rendered and swapped
+# back out
+_base = None
+
+def load_base(base_xml):
+    global _base
+    key = hashlib.sha1(base_xml if isinstance(base_xml, bytes) else base_xml.encode("utf-8")).hexdigest()
+    if _base is None or _base[0] != key:
+        root = parse_xml(base_xml)
+        _base = (key, root, text_slots(root), SurveyIndex(root))
+    return _base[1:]
+
+def render_language(base_xml, translation_xml=None, selection=None, expand_loops=False):
+    """
+    Renders base_xml in one language and returns the .docx bytes.
+    translation_xml None renders the base language.
+    """
+    from PQR import generate_word_from_survey
+
+    root, slots, index = load_base(base_xml)
+    translation = text_slots(parse_xml(translation_xml)) if translation_xml else {}
+
+    undo = apply_translation(slots, translation)
+    try:
+        # DEFINES and RES_VALUES are rebuilt from the translated text
+        survey = Survey(root, index=index)
+        buffer = io.BytesIO()
+        generate_word_from_survey(survey, buffer, selection, expand_loops=expand_loops)
+        return buffer.getvalue()
+    finally:
+        restore_translation(undo)
+
+
+# =========================
+# EXPORT
+# =========================
+def fetch_survey_languages(survey_id, languages=None):
+    """
+    Fetches survey.xml and the translation files concurrently. Returns
+    (base_xml, {language: xml}, {language: error}); languages defaults
+    to the survey's otherLanguages.
+    """
+    from decipher_api import fetch_survey_file
+
+    def fetch(language):
+        return fetch_survey_file(survey_id, LANGUAGE_FILE.format(language=language))
+
+    with ThreadPoolExecutor(max_workers=max(len(languages or ()), 1) + 1) as pool:
+        base_future = pool.submit(fetch_survey_file, survey_id, "survey.xml")
+        # Without a list the languages are only known once the base is in
+        futures = {l: pool.submit(fetch, l) for l in languages or ()}
+
+        base_xml = base_future.result()
+        if languages is None:
+            futures = {l: pool.submit(fetch, l) for l in survey_languages(base_xml)[1]}
+
+        translations, errors = {}, {}
+        for language, future in futures.items():
+            try:
+                translations[language] = future.result()
+            except Exception as e:
+                errors[language] = str(e)
+
+    return base_xml, translations, errors
+
+def export_languages(base_xml, translations, output, name="survey", selection=None,
+                     expand_loops=False, workers=None, cancel=None, errors=None):
+    """
+    Renders the base survey plus every translation ({language: xml}) in
+    the shared render pool, workers (Config.LANGUAGE_WORKERS) languages at
+    a time, and writes <name>_<language>.docx per language to a zip
+    (output is a path or a writable file object).
+
+    Returns {language: "ok" or error}, also stored as languages.json.
+    """
+    from pqr_jobs import render_pool
+
+    base_language = survey_languages(base_xml)[0]
+    jobs = [(base_language, None), *translations.items()]
+    report = dict(errors or {})
+
+    workers = min(workers or Config.LANGUAGE_WORKERS, len(jobs))
+    pool = render_pool()
+    pending = {}
+
+    try:
+        # docx files are already compressed
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf:
+            while jobs or pending:
+                while jobs and len(pending) < workers:
+                    language, xml = jobs.pop(0)
+                    pending[pool.submit(render_language, base_xml, xml, selection, expand_loops)] = language
+
+                done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                if cancel is not None:
+                    cancel.check()
+
+                for future in done:
+                    language = pending.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        report[language] = str(e)
+                        print(f"❌ {language}: {e}")
+                        continue
+
+                    zf.writestr(f"{name}_{language}.docx", data)
+                    report[language] = "ok"
+                    print(f"✅ {language} rendered")
+
+            zf.writestr("languages.json", json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        # A cancelled export waits for its running languages, so it leaves
+        # nothing behind in the shared pool
+        for future in pending:
+            future.cancel()
+        wait(pending)
+
+    return report
+
+
+# =========================
+# CLI
+# =========================
+# python pqr_languages.py survey.xml lang-french.xml lang-german.xml -o specs.zip
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="One .docx per language in a zip")
+    parser.add_argument("survey_xml")
+    parser.add_argument("translations", nargs="*", help="lang-<language>.xml files")
+    parser.add_argument("-o", "--output", help="zip to write (default: <survey>_languages.zip)")
+    parser.add_argument("--workers", type=int, default=Config.LANGUAGE_WORKERS)
+    parser.add_argument("--expand-loops", action="store_true")
+    args = parser.parse_args()
+
+    name = os.path.splitext(os.path.basename(args.survey_xml))[0]
+
+    with open(args.survey_xml, "rb") as f:
+        base_xml = f.read()
+
+    translations = {}
+    for path in args.translations:
+        m = LANGUAGE_FILE_PATTERN.search(os.path.basename(path))
+        language = m.group(1) if m else os.path.splitext(os.path.basename(path))[0]
+        with open(path, "rb") as f:
+            translations[language] = f.read()
+
+    output = args.output or f"{name}_languages.zip"
+    report = export_languages(
+        base_xml, translations, output, name=name,
+        workers=args.workers, expand_loops=args.expand_loops
+    )
+    print(f"Languages: {report} → {output}")
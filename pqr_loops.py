@@ -0,0 +1,170 @@
+import re
+from copy import deepcopy
+
+# [loopvar: name] placeholders in titles, rows, html, conditions ...
+LOOPVAR_PATTERN = re.compile(r"\[loopvar:\s*([A-Za-z0-9_]+)\s*\]")
+
+W_T = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+
+
+# =========================
+# SLOTS
+# =========================
+def compile_slots(text):
+    """
+    Splits text into literal strings and (name, placeholder) slots.
+    Returns None when there is no [loopvar: x] to fill.
+    """
+    parts = []
+    pos = 0
+    for m in LOOPVAR_PATTERN.finditer(text):
+        parts.append(text[pos:m.start()])
+        parts.append((m.group(1), m.group(0)))
+        pos = m.end()
+
+    if not parts:
+        return None
+    parts.append(text[pos:])
+    return parts
+
+def fill_slots(parts, values):
+    # Variables this loop does not define are left for an enclosing loop
+    return "".join(
+        part if isinstance(part, str) else values.get(part[0], part[1])
+        for part in parts
+    )
+
+def expansion_rows(survey, loop):
+    """
+    looprows an expanded loop is stamped for, or None when the loop has no
+    looprows (define-based / dynamic loops are not expanded). Iterations
+    with cond="0" can never be shown and are left out.
+    """
+    rows = survey.get_loop_rows(loop)
+    if not rows:
+        return None
+    return [row for row in rows if (row["cond"] or "").strip() != "0"]
+
+
+# =========================
+# EVENT TEMPLATE
+# =========================
+_STATIC, _SLOT, _DICT, _LIST = range(4)
+
+def _compile(value):
+    if isinstance(value, str):
+        parts = compile_slots(value)
+        return (_SLOT, parts) if parts else (_STATIC, value)
+
+    if isinstance(value, dict):
+        items = [(k, _compile(v)) for k, v in value.items()]
+        if all(c[0] == _STATIC for _, c in items):
+            return (_STATIC, value)
+        return (_DICT, items)
+
+    if isinstance(value, list):
+        items = [_compile(v) for v in value]
+        if all(c[0] == _STATIC for c in items):
+            return (_STATIC, value)
+        return (_LIST, items)
+
+    return (_STATIC, value)
+
+def _stamp(compiled, values):
+    kind, payload = compiled
+    if kind == _STATIC:
+        return payload
+    if kind == _SLOT:
+        return fill_slots(payload, values)
+    if kind == _DICT:
+        return {k: _stamp(c, values) for k, c in payload}
+    return [_stamp(c, values) for c in payload]
+
+
+class LoopTemplate:
+    """
+    Loop content events compiled once. Strings holding [loopvar: x] become
+    slots; everything without one is shared by all iterations as is.
+    """
+
+    def __init__(self, events):
+        self.events = [(elem, _compile(ev)) for elem, ev in events]
+
+    def stamp(self, values):
+        for elem, compiled in self.events:
+            yield elem, _stamp(compiled, values)
+
+
+def iteration_event(loop_label, index, row):
+    return {
+        "kind": "iteration",
+        "loop": loop_label,
+        "index": index,
+        "label": row["label"],
+        "text": row["text"],
+        "cond": row["cond"],
+    }
+
+def expand_loop_events(survey, events):
+    """
+    Replaces the content of every looprow loop in an iter_survey stream by
+    one stamped copy per iteration, each introduced by an "iteration"
+    event. Inner loops are expanded first, so an outer loop stamps their
+    output and fills its own variables in it.
+    """
+    # (loop, rows, buffered content events) of the loops being expanded
+    stack = []
+
+    for elem, ev in events:
+        kind = ev["kind"]
+
+        if kind == "loop_end" and stack and stack[-1][0] is elem:
+            _, rows, content = stack.pop()
+            template = LoopTemplate(content)
+            out = []
+            for i, row in enumerate(rows, 1):
+                out.append((elem, iteration_event(ev["label"], i, row)))
+                out.extend(template.stamp(row["vars"]))
+            out.append((elem, ev))
+        else:
+            out = [(elem, ev)]
+
+        if stack:
+            stack[-1][2].extend(out)
+        else:
+            yield from out
+
+        if kind == "loop_start":
+            rows = expansion_rows(survey, elem)
+            if rows is not None:
+                stack.append((elem, rows, []))
+
+
+# =========================
+# WORD TEMPLATE
+# =========================
+class ParagraphTemplate:
+    """
+    Rendered Word body elements of a loop's content, compiled once: the
+    <w:t> runs holding [loopvar: x] are located up front, stamping
+    deep-copies the elements and fills only those runs.
+    """
+
+    def __init__(self, elements):
+        self.elements = []
+        for elem in elements:
+            slots = []
+            for i, t in enumerate(elem.iter(W_T)):
+                parts = compile_slots(t.text or "")
+                if parts:
+                    slots.append((i, parts))
+            self.elements.append((elem, slots))
+
+    def stamp(self, values):
+        for elem, slots in self.elements:
+            copy = deepcopy(elem)
+            if slots:
+                texts = list(copy.iter(W_T))
+                for i, parts in slots:
+                    texts[i].text = fill_slots(parts, values)
+            yield copy
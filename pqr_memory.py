@@ -0,0 +1,218 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from config import Config
+
+MB = 1024 * 1024
+
+# Estimated peak memory of one export: fixed cost plus a multiple of the
+# survey.xml size (lxml tree, DEFINES and the document being rendered).
+# Measured as RSS growth with `python pqr_memory.py` on a 330 KB survey
+# (about 20 MB for Word, 11 MB for HTML); refresh when the renderers change.
+FOOTPRINT_BASE = 8 * MB
+FOOTPRINT_FACTOR = {
+    "docx": 60,
+    "text": 36,  # json / md / html
+}
+
+
+# =========================
+# MEASUREMENT
+# =========================
+def current_rss():
+    """
+    Resident set size of this process in bytes
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # No /proc: fall back to the peak RSS
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class MemoryReport:
+    """
+    Peak traced (Python) memory and RSS change per export phase.
+
+    tracemalloc only sees Python allocations; the lxml tree lives in
+    libxml2 and only shows up in the RSS delta.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        tracemalloc.reset_peak()
+        rss = current_rss()
+        start = time.time()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self.phases.append({
+                "phase": name,
+                "seconds": round(time.time() - start, 3),
+                "traced_peak": peak,
+                "traced_current": current,
+                "rss_delta": current_rss() - rss,
+            })
+
+    @property
+    def traced_peak(self):
+        return max((p["traced_peak"] for p in self.phases), default=0)
+
+    @property
+    def rss_delta(self):
+        return sum(p["rss_delta"] for p in self.phases)
+
+    def to_dict(self):
+        return {
+            "phases": self.phases,
+            "traced_peak": self.traced_peak,
+            "rss_delta": self.rss_delta,
+        }
+
+    def format(self):
+        lines = [f"{'phase':<10}{'seconds':>9}{'peak MB':>10}{'held MB':>10}{'RSS +MB':>10}"]
+        for p in self.phases:
+            lines.append(
+                f"{p['phase']:<10}{p['seconds']:>9.3f}{p['traced_peak'] / MB:>10.1f}"
+                f"{p['traced_current'] / MB:>10.1f}{p['rss_delta'] / MB:>10.1f}"
+            )
+        lines.append(f"peak traced: {self.traced_peak / MB:.1f} MB, RSS delta: {self.rss_delta / MB:.1f} MB")
+        return "\n".join(lines)
+
+
+def profile_export(xml_path, output_path=None):
+    """
+    Runs a Word export of xml_path phase by phase (parse, defines, render,
+    save) under tracemalloc and returns the MemoryReport.
+
+    The streamed render serializes document.xml as it goes, so "render"
+    includes building the zip in memory and "save" is writing it out.
+    """
+    from lxml import etree
+
+    from PQR import generate_word_from_survey
+    from pqr_survey import Survey, xml_parser
+    from pqr_template import warm_up
+
+    # The cached base document is shared by all exports, not part of this one
+    warm_up()
+
+    report = MemoryReport()
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+
+    try:
+        with report.phase("parse"):
+            tree = etree.parse(xml_path, xml_parser())
+
+        with report.phase("defines"):
+            survey = Survey(tree.getroot())
+
+        with report.phase("render"):
+            buffer = io.BytesIO()
+            generate_word_from_survey(survey, buffer)
+
+        with report.phase("save"):
+            if output_path:
+                with open(output_path, "wb") as f:
+                    f.write(buffer.getbuffer())
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    return report
+
+
+# =========================
+# ADMISSION
+# =========================
+def estimate_footprint(xml_size, fmt="docx"):
+    factor = FOOTPRINT_FACTOR["docx" if fmt in (None, "docx") else "text"]
+    return FOOTPRINT_BASE + xml_size * factor
+
+def check_budget(xml_size, fmt="docx", budget_mb=None):
+    """
+    Returns None when the export fits in the memory budget, otherwise a
+    dict describing the refusal (with a lighter format when one fits)
+    """
+    budget_mb = Config.EXPORT_MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+    if not budget_mb:
+        return None
+
+    estimate = estimate_footprint(xml_size, fmt)
+    if estimate <= budget_mb * MB:
+        return None
+
+    refusal = {
+        "error": (
+            f"Survey too large to export: needs about {estimate / MB:.0f} MB, "
+            f"budget is {budget_mb} MB."
+        ),
+        "estimated_mb": round(estimate / MB),
+        "budget_mb": budget_mb,
+    }
+    if fmt in (None, "docx") and estimate_footprint(xml_size, "html") <= budget_mb * MB:
+        refusal["suggested_format"] = "html"
+    return refusal
+
+
+# =========================
+# REGRESSION GATE (CLI)
+# =========================
+# python pqr_memory.py survey.xml                          report only
+# python pqr_memory.py survey.xml --save-baseline mem.json record a baseline
+# python pqr_memory.py survey.xml --baseline mem.json      fail on regression
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-phase memory report of a Word export")
+    parser.add_argument("xml_path")
+    parser.add_argument("-o", "--output", help="also write the .docx")
+    parser.add_argument("--baseline", help="JSON baseline to compare the peak against")
+    parser.add_argument("--save-baseline", help="write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed growth over the baseline peak (default 10%%)")
+    parser.add_argument("--max-peak-mb", type=float, help="absolute limit for the traced peak")
+    args = parser.parse_args()
+
+    report = profile_export(args.xml_path, args.output)
+    print(report.format())
+
+    xml_size = os.path.getsize(args.xml_path)
+    print(f"estimated footprint: {estimate_footprint(xml_size) / MB:.1f} MB for {xml_size / MB:.2f} MB of XML")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    failures = []
+
+    if args.max_peak_mb and report.traced_peak > args.max_peak_mb * MB:
+        failures.append(f"traced peak {report.traced_peak / MB:.1f} MB > {args.max_peak_mb} MB")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        allowed = baseline["traced_peak"] * (1 + args.tolerance)
+        if report.traced_peak > allowed:
+            failures.append(
+                f"traced peak {report.traced_peak / MB:.1f} MB > baseline "
+                f"{baseline['traced_peak'] / MB:.1f} MB + {args.tolerance:.0%}"
+            )
+
+    for failure in failures:
+        print(f"❌ Memory regression: {failure}")
+    sys.exit(1 if failures else 0)
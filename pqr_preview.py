@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+from pqr_cache import content_key, export_cache
+from pqr_renderers import HtmlRenderer
+from pqr_survey import ExportSelection, Survey, iter_survey
+
+# Parsed surveys kept per worker (only saves re-parsing the XML)
+PREVIEW_CACHE_SIZE = 8
+
+
+# =========================
+# SURVEY PREVIEW
+# =========================
+class SurveyPreview:
+    """
+    Outline of a survey (blocks, loops, question labels) plus on-demand
+    HTML for one block / loop at a time.
+
+    Sections are addressed by their document position, which is the same
+    in every parse of the same XML, and the outline carries the hash of
+    that XML (version).
+    """
+
+    def __init__(self, survey, version=None):
+        self.survey = survey
+        self.version = version
+        # document position -> block / loop
+        self.sections = {}
+        self.outline = self._build_outline()
+
+    def _build_outline(self):
+        outline = []
+        stack = [outline]
+
+        # No question content is built here, only labels
+        for elem, ev in iter_survey(self.survey, detail=lambda q: False):
+            kind = ev["kind"]
+
+            if kind in {"block_start", "loop_start"}:
+                section_id = self.survey.index.pos[elem]
+                node = {
+                    "id": section_id,
+                    "kind": kind[:-len("_start")],
+                    "label": ev["label"],
+                    "cond": ev["cond"],
+                    "children": [],
+                }
+                self.sections[section_id] = elem
+                stack[-1].append(node)
+                stack.append(node["children"])
+
+            elif kind in {"block_end", "loop_end"}:
+                stack.pop()
+
+            elif kind == "question":
+                stack[-1].append({
+                    "kind": "question",
+                    "label": ev["label"],
+                    "type": ev["type"],
+                    "hidden": ev["hidden"],
+                })
+
+        return outline
+
+    def render_section(self, section_id):
+        """
+        HTML fragment for one block / loop (including nested content)
+        """
+        target = self.sections[section_id]
+        renderer = HtmlRenderer()
+
+        # Only the path down to target and its subtree are walked
+        selection = ExportSelection(elements=[target])
+
+        chunks = []
+        capture = False
+        for elem, ev in iter_survey(self.survey, selection):
+            if elem is target and ev["kind"].endswith("_start"):
+                capture = True
+            if capture:
+                chunks.append(renderer.event(ev))
+            if elem is target and ev["kind"].endswith("_end"):
+                break
+
+        return "".join(chunks)
+
+
+# =========================
+# CACHE
+# =========================
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def build_preview(xml_content):
+    version = content_key(xml_content)
+
+    with _cache_lock:
+        preview = _cache.get(version)
+        if preview is not None:
+            _cache.move_to_end(version)
+            return preview
+
+    preview = SurveyPreview(Survey.from_string(xml_content), version)
+
+    with _cache_lock:
+        _cache[version] = preview
+        while len(_cache) > PREVIEW_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return preview
+
+def get_preview(survey_id, version):
+    """
+    Preview of the survey.xml the outline was built from, rebuilt from the
+    export cache on disk (any worker may serve a section request), or None
+    if survey_id has been fetched again since and its XML changed
+    """
+    cached = export_cache.cached_xml(survey_id)
+    if cached is None or content_key(cached[0]) != version:
+        return None
+    return build_preview(cached[0])
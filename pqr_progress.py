@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import threading
+import time
+
+from config import Config
+from pqr_survey import ENTER, QUESTION_TYPES, VISIT, is_hidden, local, traverse
+
+# Phases an export ends in
+FINAL_PHASES = {"done", "failed", "cancelled"}
+
+# Export ids come from the client
+EXPORT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# A progress file is rewritten at most this often (seconds) except on a
+# phase change, and removed once it is older than KEEP_SECONDS
+WRITE_INTERVAL = 0.25
+KEEP_SECONDS = 3600
+
+# SSE stream: poll interval, how long to wait for an export to appear and
+# how often to send a keep-alive comment
+POLL_INTERVAL = 0.25
+APPEAR_TIMEOUT = 30
+KEEP_ALIVE = 15
+
+_last_cleanup = 0.0
+
+
+def progress_path(export_id):
+    return os.path.join(Config.PROGRESS_DIR, f"{export_id}.json")
+
+def clean_progress_dir():
+    """
+    Removes progress files of old exports (at most once a minute)
+    """
+    global _last_cleanup
+
+    now = time.time()
+    if now - _last_cleanup < 60:
+        return
+    _last_cleanup = now
+
+    for entry in os.scandir(Config.PROGRESS_DIR):
+        try:
+            if now - entry.stat().st_mtime > KEEP_SECONDS:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# =========================
+# PUBLISHING
+# =========================
+class ExportProgress:
+    """
+    Progress of one export (phase, blocks and questions done out of total,
+    bytes written), published by the render as it goes.
+
+    Kept in a small JSON file rather than in memory so the SSE stream can
+    be served by any gunicorn worker, not only the one rendering.
+    """
+
+    def __init__(self, export_id):
+        os.makedirs(Config.PROGRESS_DIR, exist_ok=True)
+        clean_progress_dir()
+
+        self.path = progress_path(export_id)
+        self.state = {
+            "export_id": export_id,
+            "phase": "queued",
+            "blocks_done": 0,
+            "blocks_total": 0,
+            "questions_done": 0,
+            "questions_total": 0,
+            "bytes": 0,
+        }
+        self._lock = threading.Lock()
+        self._written = 0.0
+        self._write()
+
+    def update(self, **fields):
+        with self._lock:
+            phase_changed = fields.get("phase", self.state["phase"]) != self.state["phase"]
+            self.state.update(fields)
+            if phase_changed or time.monotonic() - self._written >= WRITE_INTERVAL:
+                self._write()
+
+    def _write(self):
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+        self._written = time.monotonic()
+
+
+def count_content(visible):
+    """
+    (blocks, questions) a walk of the SelectedTree will render; hidden
+    questions are skipped like the renderers skip them
+    """
+    blocks = questions = 0
+    for event, elem, _ in traverse(visible):
+        tag = local(elem.tag)
+        if event == ENTER and tag == "block":
+            blocks += 1
+        elif event == VISIT and tag in QUESTION_TYPES and not is_hidden(elem):
+            questions += 1
+    return blocks, questions
+
+def track_events(events, visible, progress):
+    """
+    Passes walk_survey events through, counting finished blocks and
+    questions into progress
+    """
+    blocks_total, questions_total = count_content(visible)
+    progress.update(phase="rendering", blocks_total=blocks_total, questions_total=questions_total)
+
+    blocks = questions = 0
+    for ev in events:
+        yield ev
+        if ev["kind"] == "block_end":
+            blocks += 1
+        elif ev["kind"] == "question":
+            questions += 1
+        else:
+            continue
+        progress.update(blocks_done=blocks, questions_done=questions)
+
+
+# =========================
+# READING (SSE)
+# =========================
+def read_progress(export_id):
+    try:
+        with open(progress_path(export_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def progress_events(export_id, max_seconds=None):
+    """
+    Server-Sent Events for one export: a "data:" message whenever its
+    progress changes, until it reaches a final phase. An "event: missing"
+    message is sent if the export never shows up.
+    """
+    max_seconds = max_seconds or Config.EXPORT_TIMEOUT_SECONDS + APPEAR_TIMEOUT
+    start = last_sent = time.monotonic()
+    last = None
+
+    while time.monotonic() - start < max_seconds:
+        state = read_progress(export_id)
+        now = time.monotonic()
+
+        if state is not None and state != last:
+            yield f"data: {json.dumps(state)}\n\n"
+            last, last_sent = state, now
+            if state["phase"] in FINAL_PHASES:
+                return
+        elif state is None and now - start > APPEAR_TIMEOUT:
+            yield "event: missing\ndata: {}\n\n"
+            return
+        elif now - last_sent > KEEP_ALIVE:
+            # Also notices a client that went away
+            yield ": keep-alive\n\n"
+            last_sent = now
+
+        time.sleep(POLL_INTERVAL)
@@ -0,0 +1,412 @@
+import json
+from html import escape
+
+from pqr_survey import reference_text, walk_survey
+
+
+# =========================
+# RENDERERS
+# =========================
+# Lightweight alternatives to the Word export. Each renderer consumes the
+# event stream from walk_survey and yields text chunks as it goes, so the
+# output can be written to a file or streamed to the client directly.
+
+class Renderer:
+    name = None
+    mimetype = "text/plain"
+    extension = "txt"
+
+    def render(self, survey, events):
+        raise NotImplementedError
+
+    def stream(self, survey, selection=None, expand_loops=False, progress=None, reference_report=False):
+        events = walk_survey(survey, selection, expand_loops, reference_report)
+        if progress is not None:
+            from pqr_progress import track_events
+            events = track_events(events, survey.select(selection), progress)
+        yield from self.render(survey, events)
+
+
+def question_heading(q):
+    heading = f"{q['label']} ({q['uses']})" if q["uses"] else f"{q['label']} ({q['type']})"
+    return f"Hidden: {heading}" if q["hidden"] else heading
+
+def iteration_heading(ev):
+    return f"🔁 Iteration {ev['label'] or ev['index']}: {ev['text']}"
+
+def question_logic_lines(q):
+    """
+    Red logic lines shown under a question header, in Word export order
+    """
+    lines = []
+    if q.get("range"):
+        lines.append(f"Range - ({q['range']})")
+    if q.get("post_text") is not None:
+        lines.append(f"Post Text: {q['post_text']}")
+    if q.get("pre_text") is not None:
+        lines.append(f"Pre Text: {q['pre_text']}")
+    if q["optional"]:
+        lines.append("Optional Question")
+    if q["keep_with"]:
+        lines.append(f"Layout Logic: Keep with {q['keep_with']} (Same Page)")
+    if q["right_of"]:
+        lines.append(f"Layout Logic: Right of {q['right_of']} (Same Page)")
+    return lines
+
+def question_cond_lines(q):
+    lines = []
+    for key, label in [
+        ("row_cond", "Row Condition"),
+        ("col_cond", "Column Condition"),
+        ("choice_cond", "Choice Condition"),
+    ]:
+        if q[key]:
+            lines.append(f"{label}: {q[key]}")
+    return lines + q["shuffle"]
+
+def option_sections(q):
+    """
+    Returns [(heading, group_text, options)] the way the Word export lists them
+    """
+    sections = []
+    if q["groups"]:
+        for i, g in enumerate(q["groups"]):
+            sections.append(("Rows:" if i == 0 else None, g["text"], g["rows"]))
+        if q["rows"]:
+            sections.append(("Other Rows:", None, q["rows"]))
+    elif q["rows"]:
+        sections.append(("Rows:", None, q["rows"]))
+    if q["cols"]:
+        sections.append(("Columns:", None, q["cols"]))
+    if q["choices"]:
+        sections.append(("Answer Options:", None, q["choices"]))
+    return sections
+
+def omitted_text(o):
+    """
+    Marker of the options a sampled export left out
+    """
+    return f"… {o['more']} more ({o['total']} in total)"
+
+def option_logic(o):
+    parts = [f"({s})" for s in o["shuffle"]]
+    parts += [f"- {f}" for f in o["flags"]]
+    if o["cond"]:
+        parts.append(f"(Display Condition: {o['cond']})")
+    if o["exclusive"]:
+        parts.append("(Exclusive)")
+    return " ".join(parts)
+
+
+# =========================
+# JSON
+# =========================
+class JsonRenderer(Renderer):
+    """
+    One JSON document; blocks and loops nest their content under "children".
+    One item per line keeps the output diffable.
+    """
+    name = "json"
+    mimetype = "application/json"
+    extension = "json"
+
+    def render(self, survey, events):
+        yield "{" + f'"survey": {json.dumps(survey.name, ensure_ascii=False)}, "items": ['
+
+        first = [True]
+        for ev in events:
+            kind = ev["kind"]
+            if kind.endswith("_end"):
+                first.pop()
+                yield "\n]}"
+                continue
+
+            sep = "" if first[-1] else ","
+            first[-1] = False
+
+            if kind.endswith("_start"):
+                node = dict(ev, kind=kind[:-len("_start")])
+                text = json.dumps(node, ensure_ascii=False)
+                yield f"{sep}\n{text[:-1]}, \"children\": ["
+                first.append(True)
+            else:
+                yield f"{sep}\n{json.dumps(ev, ensure_ascii=False)}"
+
+        yield "\n]}\n"
+
+
+# =========================
+# MARKDOWN
+# =========================
+class MarkdownRenderer(Renderer):
+    name = "md"
+    mimetype = "text/markdown"
+    extension = "md"
+
+    def render(self, survey, events):
+        yield f"# {survey.name}\n\n"
+
+        for ev in events:
+            kind = ev["kind"]
+            out = []
+
+            if kind == "block_start":
+                prefix = "START LOOP BLOCK" if ev["in_loop"] else "START BLOCK"
+                out.append(f"**📦 {prefix}: {ev['label']}**")
+                if ev["cond"]:
+                    cond_label = "Loop iteration logic" if ev["in_loop"] else "Block Display Condition"
+                    out.append(f"*{cond_label}: {ev['cond']}*")
+                out.append(f"### Block: {ev['label']}")
+
+            elif kind == "block_end":
+                prefix = "END LOOP BLOCK" if ev["in_loop"] else "END BLOCK"
+                out.append(f"**📦 {prefix}: {ev['label']}**")
+
+            elif kind == "loop_start":
+                out.append(f"## 🔁 Loop: {ev['label']}")
+                if ev["cond"]:
+                    out.append(f"*Loop Display Condition: {ev['cond']}*")
+                if ev["title"]:
+                    out.append(f"**Loop Title:** {ev['title']}")
+                out.append("**Loop Iterations:**")
+                out.append("\n".join(
+                    f"{i}. {it['text']}" + (f" *(Condition: {it['cond']})*" if it["cond"] else "")
+                    for i, it in enumerate(ev["iterations"], 1)
+                ))
+                out.append("**Loop Content:**")
+
+            elif kind == "iteration":
+                text = f"**{iteration_heading(ev)}**"
+                if ev["cond"]:
+                    text += f" *(Condition: {ev['cond']})*"
+                out.append(text)
+
+            elif kind == "loop_end":
+                out.append(f"**🔚 END LOOP: {ev['label']}**")
+
+            elif kind == "question":
+                out.extend(self.question(ev))
+
+            elif kind == "term":
+                text = "🚫 Terminate Logic"
+                if ev["cond"]:
+                    text += f" : {ev['cond']}"
+                out.append(f"**{text}**")
+
+            elif kind == "info":
+                if ev["label"]:
+                    out.append(f"**{ev['label']} (🅘 Information)**")
+                if ev["cond"]:
+                    out.append(f"*Display Condition: {ev['cond']}*")
+                if ev["text"]:
+                    out.append(ev["text"])
+
+            elif kind == "suspend":
+                out.append("---")
+                if ev["cond"]:
+                    out.append(f"*Display Condition: {ev['cond']}*")
+
+            elif kind == "references":
+                out.append("## Reference report")
+                out.append("### Dangling references")
+                out.append("\n".join(f"- {reference_text(r)}" for r in ev["dangling"]) or "None")
+                out.append("### Unreferenced questions")
+                out.append(", ".join(ev["unreferenced"]) or "None")
+
+            if out:
+                yield "\n\n".join(out) + "\n\n"
+
+    def question(self, q):
+        out = [f"#### {question_heading(q)}"]
+        if q["cond"]:
+            out.append(f"*Display Condition: {q['cond']}*")
+
+        if q["text"] is not None:
+            out.append(f"**Question:** {q['text']}")
+        if q["bullets"]:
+            out.append("\n".join(f"- {b}" for b in q["bullets"]))
+        if q["definition"]:
+            out.append(f"**Definition:** {q['definition']}")
+
+        out.extend(f"*{line}*" for line in question_logic_lines(q))
+        if q["comment"]:
+            out.append(f"**Respondent Instruction:** {q['comment']}")
+        out.extend(f"*{line}*" for line in question_cond_lines(q))
+
+        for heading, group_text, options in option_sections(q):
+            if heading:
+                out.append(f"**{heading}**")
+            if group_text is not None:
+                out.append(f"**Group:** {group_text}")
+            if options:
+                out.append("\n".join(self.option(o) for o in options))
+        return out
+
+    @staticmethod
+    def option(o):
+        if "more" in o:
+            return f"- *{omitted_text(o)}*"
+        return f"- **{o['label']}:** {o['text']} {option_logic(o)}".rstrip()
+
+
+# =========================
+# HTML
+# =========================
+HTML_STYLE = """
+body { font-family: Calibri, Arial, sans-serif; }
+.logic { color: #FF0000; }
+.info { color: #4472C4; font-weight: bold; }
+.hidden { background-color: #FFF2CC; }
+.marker { font-weight: bold; }
+"""
+
+class HtmlRenderer(Renderer):
+    name = "html"
+    mimetype = "text/html"
+    extension = "html"
+
+    def render(self, survey, events):
+        yield (
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{escape(survey.name)}</title>\n<style>{HTML_STYLE}</style>\n"
+            f"</head>\n<body>\n<h1>{escape(survey.name)}</h1>\n"
+        )
+        for ev in events:
+            yield self.event(ev)
+        yield "</body>\n</html>\n"
+
+    def event(self, ev):
+        kind = ev["kind"]
+        out = []
+
+        if kind == "block_start":
+            prefix = "START LOOP BLOCK" if ev["in_loop"] else "START BLOCK"
+            out.append(f'<section class="block" id="block-{escape(ev["label"])}">')
+            out.append(f'<p class="marker">📦 {prefix}: {escape(ev["label"])}</p>')
+            if ev["cond"]:
+                cond_label = "Loop iteration logic" if ev["in_loop"] else "Block Display Condition"
+                out.append(f'<p class="logic">{cond_label}: {escape(ev["cond"])}</p>')
+            out.append(f"<h3>Block: {escape(ev['label'])}</h3>")
+
+        elif kind == "block_end":
+            prefix = "END LOOP BLOCK" if ev["in_loop"] else "END BLOCK"
+            out.append(f'<p class="marker">📦 {prefix}: {escape(ev["label"])}</p>')
+            out.append("</section>")
+
+        elif kind == "loop_start":
+            out.append(f'<section class="loop" id="loop-{escape(ev["label"])}">')
+            out.append(f"<h2>🔁 Loop: {escape(ev['label'])}</h2>")
+            if ev["cond"]:
+                out.append(f'<p class="logic">Loop Display Condition: {escape(ev["cond"])}</p>')
+            if ev["title"]:
+                out.append(f"<p><b>Loop Title:</b> {escape(ev['title'])}</p>")
+            out.append('<p class="marker">Loop Iterations:</p>')
+            out.append("<ol>" + "".join(
+                f"<li>{escape(it['text'])}"
+                + (f' <b class="logic">(Condition: {escape(it["cond"])})</b>' if it["cond"] else "")
+                + "</li>"
+                for it in ev["iterations"]
+            ) + "</ol>")
+            out.append('<p class="marker">Loop Content:</p>')
+
+        elif kind == "iteration":
+            cond = f' <b class="logic">(Condition: {escape(ev["cond"])})</b>' if ev["cond"] else ""
+            out.append(f'<p class="marker">{escape(iteration_heading(ev))}{cond}</p>')
+
+        elif kind == "loop_end":
+            out.append(f'<p class="marker">🔚 END LOOP: {escape(ev["label"])}</p>')
+            out.append("</section>")
+
+        elif kind == "question":
+            out.extend(self.question(ev))
+
+        elif kind == "term":
+            text = "🚫 Terminate Logic"
+            if ev["cond"]:
+                text += f" : {ev['cond']}"
+            out.append(f'<p class="logic"><b>{escape(text)}</b></p>')
+
+        elif kind == "info":
+            if ev["label"]:
+                out.append(f'<p class="info">{escape(ev["label"])} (🅘 Information)</p>')
+            if ev["cond"]:
+                out.append(f'<p class="logic"><b>Display Condition: {escape(ev["cond"])}</b></p>')
+            if ev["text"]:
+                out.append(f"<p>{escape(ev['text'])}</p>")
+
+        elif kind == "suspend":
+            out.append("<hr>")
+            if ev["cond"]:
+                out.append(f'<p class="logic"><b>Display Condition: {escape(ev["cond"])}</b></p>')
+
+        elif kind == "references":
+            out.append('<section class="references">')
+            out.append("<h2>Reference report</h2>")
+            out.append("<h3>Dangling references</h3>")
+            if ev["dangling"]:
+                out.append("<ul>" + "".join(
+                    f'<li class="logic">{escape(reference_text(r))}</li>' for r in ev["dangling"]
+                ) + "</ul>")
+            else:
+                out.append("<p>None</p>")
+            out.append("<h3>Unreferenced questions</h3>")
+            out.append(f"<p>{escape(', '.join(ev['unreferenced'])) or 'None'}</p>")
+            out.append("</section>")
+
+        return "\n".join(out) + "\n" if out else ""
+
+    def question(self, q):
+        css = ' class="hidden"' if q["hidden"] else ""
+        out = [f'<h4 id="q-{escape(q["label"])}"{css}>{escape(question_heading(q))}</h4>']
+        if q["cond"]:
+            out.append(f'<p class="logic">Display Condition: {escape(q["cond"])}</p>')
+
+        if q["text"] is not None:
+            out.append(f"<p><b>Question:</b> {escape(q['text'])}</p>")
+        if q["bullets"]:
+            out.append("<ul>" + "".join(f"<li>{escape(b)}</li>" for b in q["bullets"]) + "</ul>")
+        if q["definition"]:
+            out.append(f"<p><b>Definition:</b> {escape(q['definition'])}</p>")
+
+        out.extend(f'<p class="logic"><b>{escape(line)}</b></p>' for line in question_logic_lines(q))
+        if q["comment"]:
+            out.append(f"<p><b>Respondent Instruction:</b> {escape(q['comment'])}</p>")
+        out.extend(f'<p class="logic"><b>{escape(line)}</b></p>' for line in question_cond_lines(q))
+
+        for heading, group_text, options in option_sections(q):
+            if heading:
+                out.append(f"<p><b>{heading}</b></p>")
+            if group_text is not None:
+                out.append(f"<p><b>Group:</b> {escape(group_text)}</p>")
+            if options:
+                out.append("<ul>" + "".join(self.option(o) for o in options) + "</ul>")
+        return out
+
+    @staticmethod
+    def option(o):
+        if "more" in o:
+            return f'<li class="marker">{escape(omitted_text(o))}</li>'
+        return (
+            f"<li><b>{escape(o['label'])}:</b> {escape(o['text'])}"
+            + (f' <span class="logic">{escape(option_logic(o))}</span>' if option_logic(o) else "")
+            + "</li>"
+        )
+
+
+RENDERERS = {
+    "json": JsonRenderer,
+    "md": MarkdownRenderer,
+    "markdown": MarkdownRenderer,
+    "html": HtmlRenderer,
+}
+
+def get_renderer(fmt):
+    """
+    Returns a renderer instance for fmt, or None for the Word export
+    """
+    fmt = (fmt or "docx").lower()
+    if fmt == "docx":
+        return None
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return RENDERERS[fmt]()
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+# One row per searchable item of a survey. survey_id / kind are stored
+# but not tokenized; owner is the question (or block / loop) an option or
+# term belongs to.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS surveys (
+    survey_id TEXT PRIMARY KEY,
+    name TEXT,
+    content_hash TEXT,
+    item_count INTEGER,
+    indexed_at REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS items USING fts5(
+    survey_id UNINDEXED,
+    kind UNINDEXED,
+    owner,
+    label,
+    text,
+    cond,
+    tokenize = "unicode61 remove_diacritics 2"
+);
+"""
+
+# bm25 weight of each column (survey_id, kind, owner, label, text, cond):
+# a hit on an item's own label ranks first
+RANK_WEIGHTS = (0, 0, 1, 10, 1, 2)
+
+# Highest number of results a search returns
+MAX_RESULTS = 200
+
+
+def content_hash(xml_content):
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode("utf-8")
+    return hashlib.sha1(xml_content).hexdigest()
+
+def connect(path=None):
+    path = path or Config.SEARCH_DB
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # Every gunicorn worker writes to the same file
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# =========================
+# EXTRACTION
+# =========================
+def join_conds(*conds):
+    return " | ".join(c for c in conds if c)
+
+def survey_items(survey):
+    """
+    (kind, owner, label, text, cond) of every question, option, block,
+    loop, term and info element the export would show, taken from the
+    compiled question content (defines and inserts resolved), over the
+    whole survey rather than the te1 ... b3 range
+    """
+    from pqr_survey import ExportSelection, walk_survey
+
+    selection = ExportSelection(elements=list(survey.root))
+    # Block / loop labels, so terms and info elements have an owner
+    owners = []
+
+    for ev in walk_survey(survey, selection):
+        kind = ev["kind"]
+        owner = owners[-1] if owners else ""
+
+        if kind in ("block_start", "loop_start"):
+            yield kind[:-6], owner, ev["label"], ev.get("title") or "", ev.get("cond") or ""
+            owners.append(ev["label"])
+        elif kind in ("block_end", "loop_end"):
+            owners.pop()
+        elif kind == "question":
+            label = ev["label"]
+            text = " ".join(filter(None, [ev["text"], *ev["bullets"], ev["comment"], ev["definition"]]))
+            cond = join_conds(ev["cond"], ev["row_cond"], ev["col_cond"], ev["choice_cond"])
+            yield "question", owner, label, text, cond
+
+            groups = [r for g in ev["groups"] for r in g["rows"]]
+            for o in groups + ev["rows"] + ev["cols"] + ev["choices"]:
+                yield "option", label, o["label"], o["text"], o["cond"] or ""
+        elif kind == "term":
+            yield "term", owner, ev["label"] or "", "", ev["cond"]
+        elif kind == "info":
+            yield "info", owner, ev["label"], ev["text"], ev["cond"] or ""
+
+
+# =========================
+# INDEX
+# =========================
+def index_survey(survey_id, xml_content, conn=None):
+    """
+    (Re)indexes one survey unless the same XML is already indexed.
+    Returns the number of items written (0 when unchanged).
+    """
+    from pqr_survey import Survey
+
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        digest = content_hash(xml_content)
+        row = conn.execute(
+            "SELECT content_hash FROM surveys WHERE survey_id = ?", (survey_id,)
+        ).fetchone()
+        if row and row[0] == digest:
+            return 0
+
+        survey = Survey.from_string(xml_content)
+        items = [(survey_id, *item) for item in survey_items(survey)]
+
+        with conn:
+            conn.execute("DELETE FROM items WHERE survey_id = ?", (survey_id,))
+            conn.executemany(
+                "INSERT INTO items (survey_id, kind, owner, label, text, cond) VALUES (?, ?, ?, ?, ?, ?)",
+                items
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO surveys VALUES (?, ?, ?, ?, ?)",
+                (survey_id, survey.name, digest, len(items), time.time())
+            )
+        return len(items)
+    finally:
+        if own_conn:
+            conn.close()
+
+def remove_survey(survey_id, conn=None):
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM items WHERE survey_id = ?", (survey_id,))
+            conn.execute("DELETE FROM surveys WHERE survey_id = ?", (survey_id,))
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# Indexing of fetched surveys, off the request thread
+_indexer = None
+_indexer_lock = threading.Lock()
+
+def index_survey_later(survey_id, xml_content):
+    global _indexer
+
+    if not Config.SEARCH_INDEX_ON_FETCH:
+        return
+
+    with _indexer_lock:
+        # Created on first use so no thread exists before gunicorn forks
+        if _indexer is None:
+            _indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+
+    def run():
+        try:
+            count = index_survey(survey_id, xml_content)
+            if count:
+                print(f"🔎 Indexed {survey_id}: {count} items")
+        except Exception as e:
+            print(f"❌ Indexing {survey_id} failed: {e}")
+
+    _indexer.submit(run)
+
+
+# =========================
+# SEARCH
+# =========================
+def fts_query(text):
+    """
+    FTS5 query matching every word of text (a trailing * keeps prefix
+    search); quoting each word keeps labels like Q12b or Q1.r2 literal
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+def search(text, kind=None, survey_id=None, limit=50, conn=None):
+    """
+    Best matching items across all indexed surveys (bm25 ranking), each
+    with the survey name and a snippet of the matching text
+    """
+    query = fts_query(text)
+    if not query:
+        return []
+
+    sql = """
+        SELECT items.survey_id, surveys.name, kind, owner, label, text, cond,
+               snippet(items, -1, '[', ']', '…', 12)
+        FROM items JOIN surveys USING (survey_id)
+        WHERE items MATCH ?
+    """
+    params = [query]
+    if kind:
+        sql += " AND kind = ?"
+        params.append(kind)
+    if survey_id:
+        sql += " AND items.survey_id = ?"
+        params.append(survey_id)
+    sql += f" ORDER BY bm25(items, {', '.join(map(str, RANK_WEIGHTS))}) LIMIT ?"
+    params.append(max(1, min(int(limit), MAX_RESULTS)))
+
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        if own_conn:
+            conn.close()
+
+    return [
+        {
+            "survey_id": row[0],
+            "survey": row[1],
+            "kind": row[2],
+            "owner": row[3],
+            "label": row[4],
+            "text": row[5],
+            "cond": row[6],
+            "snippet": row[7],
+        }
+        for row in rows
+    ]
+
+def index_stats(conn=None):
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        surveys, items = conn.execute("SELECT COUNT(*), COALESCE(SUM(item_count), 0) FROM surveys").fetchone()
+        return {"surveys": surveys, "items": items}
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# =========================
+# CLI
+# =========================
+# python pqr_search.py --index input/*.xml    index local files (id = file name)
+# python pqr_search.py "brand awareness"      search
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search across surveys")
+    parser.add_argument("query", nargs="*")
+    parser.add_argument("--index", nargs="+", metavar="XML", help="survey.xml files to index")
+    parser.add_argument("--kind", help="question, option, block, loop, term or info")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect()
+
+    for path in args.index or ():
+        start = time.time()
+        with open(path, "rb") as f:
+            count = index_survey(os.path.splitext(os.path.basename(path))[0], f.read(), conn)
+        print(f"{path}: {count or 'unchanged'} ({time.time() - start:.2f}s)")
+
+    if args.query:
+        start = time.time()
+        results = search(" ".join(args.query), args.kind, limit=args.limit, conn=conn)
+        for r in results:
+            where = f"{r['owner']} › {r['label']}" if r["owner"] else r["label"]
+            print(f"{r['survey_id']:>12}  {r['kind']:<8} {where}: {r['snippet'] or r['cond']}")
+        print(f"{len(results)} results in {(time.time() - start) * 1000:.1f} ms ({index_stats(conn)})")
@@ -0,0 +1,248 @@
+import queue
+import threading
+import zipfile
+
+from lxml import etree
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.pkgwriter import _ContentTypesItem
+
+BODY_MARKER = "pqr-stream-body"
+
+# Body paragraphs kept in memory before they are serialized into the zip
+FLUSH_EVERY = 200
+
+# Response chunk size and how many chunks may wait for a slow client
+CHUNK_SIZE = 64 * 1024
+MAX_PENDING_CHUNKS = 16
+
+
+class StreamAborted(Exception):
+    """
+    Raised inside the render when the reader of the stream went away
+    """
+
+
+# =========================
+# STREAMING DOCX WRITER
+# =========================
+class StreamingDocxWriter:
+    """
+    Writes a python-docx Document as a zip package while it is being built.
+
+    word/document.xml is the only part that grows with the survey, so it is
+    opened as a streamed zip entry and body paragraphs are serialized and
+    dropped from the tree every FLUSH_EVERY elements. All other parts are
+    written from the package once the body is finished.
+    """
+
+    def __init__(self, doc, fileobj, flush_every=FLUSH_EVERY):
+        self.doc = doc
+        self.body = doc.element.body
+        self.flush_every = flush_every
+        self._zipf = zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED)
+        self._entry = None
+        self._tail = b""
+        self.bytes_written = 0
+
+    def start(self):
+        package = self.doc.part.package
+        parts = list(package.iter_parts())
+        for part in parts:
+            part.before_marshal()
+
+        self._zipf.writestr(
+            CONTENT_TYPES_URI.membername,
+            _ContentTypesItem.from_parts(parts).blob
+        )
+        self._zipf.writestr(PACKAGE_URI.rels_uri.membername, package.rels.xml)
+
+        head, self._tail = self._split_document()
+        self._entry = self._zipf.open(self.doc.part.partname.membername, "w")
+        self._write(head)
+
+    def _split_document(self):
+        """
+        Serializes <w:document> around an empty body and returns the markup
+        before and after the body content
+        """
+        children = list(self.body)
+        for c in children:
+            self.body.remove(c)
+
+        marker = etree.Comment(BODY_MARKER)
+        self.body.append(marker)
+        xml = etree.tostring(self.doc.element, encoding="UTF-8", standalone=True)
+        self.body.remove(marker)
+
+        for c in children:
+            self.body.append(c)
+
+        head, tail = xml.split(f"<!--{BODY_MARKER}-->".encode("utf-8"), 1)
+        return head, tail
+
+    def _write(self, data):
+        self._entry.write(data)
+        self.bytes_written += len(data)
+
+    def _write_body(self, include_sect_pr=False):
+        """
+        Serializes and drops the current body content. <w:sectPr> stays in the
+        tree until the document is closed.
+        """
+        sect_pr = self.body.sectPr
+        if sect_pr is not None and not include_sect_pr:
+            self.body.remove(sect_pr)
+        else:
+            sect_pr = None
+
+        if len(self.body):
+            # Serialize through <w:body> so namespace declarations are written
+            # once per chunk instead of once per paragraph
+            xml = etree.tostring(self.body, encoding="UTF-8")
+            start = xml.index(b">", xml.index(b"<w:body")) + 1
+            end = xml.rindex(b"</w:body>")
+            self._write(xml[start:end])
+
+            for c in list(self.body):
+                self.body.remove(c)
+
+        if sect_pr is not None:
+            self.body.append(sect_pr)
+
+    def flush(self, force=False):
+        """
+        Moves finished body paragraphs into the zip
+        """
+        if force or len(self.body) >= self.flush_every:
+            self._write_body()
+
+    def write_xml(self, fragment):
+        """
+        Writes already serialized body content after the current body, e.g.
+        the body of another export built from the same base document (so
+        the same namespace prefixes)
+        """
+        self._write_body()
+        self._write(fragment)
+
+    def close(self):
+        self._write_body(include_sect_pr=True)
+        self._write(self._tail)
+        self._entry.close()
+
+        document_part = self.doc.part
+        for part in self.doc.part.package.iter_parts():
+            if part is not document_part:
+                self._zipf.writestr(part.partname.membername, part.blob)
+            if len(part._rels):
+                self._zipf.writestr(part.partname.rels_uri.membername, part._rels.xml)
+
+        self._zipf.close()
+
+    def abort(self):
+        """
+        Closes an unfinished package (cancelled / failed render); the output
+        is incomplete and only closed so no handle is left open
+        """
+        try:
+            if self._entry is not None:
+                self._entry.close()
+            self._zipf.close()
+        except Exception:
+            pass
+
+
+# =========================
+# PIPE TO HTTP RESPONSE
+# =========================
+class ChunkPipe:
+    """
+    Write-only file object that hands fixed-size chunks to a reader thread.
+
+    The queue is bounded, so a slow client holds the render back instead of
+    letting the whole document pile up in memory.
+    """
+
+    _DONE = object()
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_pending=MAX_PENDING_CHUNKS):
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._aborted = threading.Event()
+        self.error = None
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._put(chunk)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _put(self, item):
+        while True:
+            if self._aborted.is_set():
+                raise StreamAborted()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, error=None):
+        self.error = error
+        try:
+            if self._buffer and error is None:
+                self._put(bytes(self._buffer))
+                self._buffer.clear()
+            self._put(self._DONE)
+        except StreamAborted:
+            pass
+
+    def abort(self):
+        self._aborted.set()
+
+    @property
+    def aborted(self):
+        return self._aborted.is_set()
+
+    def chunks(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+
+class PipeStream:
+    """
+    Response iterable over a ChunkPipe. The WSGI server calls close() when
+    the response ends or the client goes away, even if iteration never
+    started, which stops the render and runs on_close.
+    """
+
+    def __init__(self, pipe, on_close=None):
+        self.pipe = pipe
+        self.on_close = on_close
+        self._closed = False
+
+    def __iter__(self):
+        return self.pipe.chunks()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.pipe.abort()
+        if self.on_close:
+            self.on_close()
+
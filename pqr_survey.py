@@ -0,0 +1,1466 @@
+from lxml import etree
+from html import unescape
+from itertools import islice
+import re
+
+from pqr_loops import expand_loop_events
+
+# =========================
+# GLOBAL CONSTANTS
+# =========================
+QUESTION_TYPES = {"radio", "checkbox", "select", "text", "textarea", "number", "float"}
+
+EXPORT_START_LABEL = "te1"
+EXPORT_END_LABEL = "b3"
+
+OPTION_XPATH = (
+    './/*[local-name()="row" or local-name()="col" '
+    'or local-name()="choice" or local-name()="value" '
+    'or local-name()="noanswer"]'
+)
+
+ANCHOR_KEYWORDS = (
+    "other", "none", "dk", "don't know",
+    "dont know", "na", "n/a", "not applicable"
+)
+
+RES_VAR_PATTERN = re.compile(r"\$\{res\.([A-Za-z0-9_]+)\}")
+ZERO_TOKEN = re.compile(r'(?<![\w.])0(?![\w.])')
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Deepest nesting libxml2 parses with huge_tree
+MAX_XML_DEPTH = 2048
+
+
+# =========================
+# PARSING
+# =========================
+def xml_parser():
+    """
+    Parser for survey.xml: broken markup is recovered from, and huge_tree
+    lifts libxml2's limits (nesting depth 256 instead of 2048, text size)
+    """
+    return etree.XMLParser(recover=True, huge_tree=True)
+
+def check_parsed(parser, root=None):
+    """
+    recover=True also carries on past a libxml2 resource limit, silently
+    dropping the rest of the document; that is an error.
+
+    The feed parser keeps no error log, so for it (root given) a tree
+    that reaches the depth limit counts as cut off.
+    """
+    for error in parser.error_log:
+        if error.type_name == "ERR_RESOURCE_LIMIT":
+            raise ValueError(f"survey.xml could not be read completely: {error.message}")
+
+    if root is None:
+        return
+    depth = 0
+    for event, _ in etree.iterwalk(root, events=("start", "end")):
+        depth += 1 if event == "start" else -1
+        if depth >= MAX_XML_DEPTH:
+            raise ValueError(f"survey.xml could not be read completely: nested deeper than {MAX_XML_DEPTH - 1} levels")
+
+
+# =========================
+# HELPERS
+# =========================
+def local(tag):
+    return etree.QName(tag).localname.lower()
+
+def safe(text):
+    return text.strip() if text else ""
+
+def clean_html(text):
+    # Remove span and br tags
+    text = re.sub(r"</?span[^>]*>", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"<br\s*/?>", "\n", text, flags=re.IGNORECASE)
+    return text.strip()
+
+def strip_tags(text):
+    """
+    Plain text of an inline-HTML string (tags dropped, whitespace collapsed)
+    """
+    if not text:
+        return ""
+    text = TAG_PATTERN.sub(" ", unescape(text).replace("&nbsp;", " "))
+    return " ".join(text.split())
+
+def split_list_items(html_text):
+    """
+    Splits "<ul><li />A<li />B" style text into (text_before_list, [items])
+    """
+    if not html_text:
+        return "", []
+
+    html_text = unescape(html_text)
+
+    # Remove <ul> tags
+    html_text = re.sub(r"</?ul[^>]*>", "", html_text, flags=re.IGNORECASE)
+
+    # Split on <li /> or <li/>
+    items = re.split(r"<li\s*/\s*>", html_text, flags=re.IGNORECASE)
+
+    # First item = text before first <li />
+    first = items.pop(0).strip()
+
+    # Remaining items = bullets
+    bullets = []
+    for item in items:
+        text = clean_html(item).strip()
+        if text:
+            bullets.append(text)
+
+    return first, bullets
+
+def title_html(title_elem):
+    """
+    Inner HTML of a <title> element
+    """
+    html_text = etree.tostring(title_elem, encoding="unicode", method="html")
+    return re.sub(r"</?title[^>]*>", "", html_text)
+
+def element_text(elem):
+    """
+    Plain text of an option element or define item
+    """
+    if isinstance(elem, dict):
+        return strip_tags(elem.get("text", ""))
+    return strip_tags("".join(elem.itertext()))
+
+
+# =========================
+# SURVEY NAME DETECTION (ALT FIX)
+# =========================
+def get_survey_name(root, default="Survey Specification Document"):
+    # 1. Root <survey alt="...">
+    if root.get("alt"):
+        return root.get("alt").strip()
+
+    # 2. <survey alt="..."> anywhere
+    survey_node = root.xpath('.//*[local-name()="survey"]')
+    if survey_node and survey_node[0].get("alt"):
+        return survey_node[0].get("alt").strip()
+
+    # 3. title / name / label attributes
+    for attr in ("title", "name", "label"):
+        if root.get(attr):
+            return root.get(attr).strip()
+
+    # 4. <title> node
+    title_node = root.xpath('./*[local-name()="title"]')
+    if title_node and title_node[0].text:
+        return title_node[0].text.strip()
+
+    return default
+
+
+# =========================
+# EXPORT SELECTION
+# =========================
+# Elements a selection can name (label list / regex)
+EXPORTABLE_TAGS = QUESTION_TYPES | {"block", "loop", "term", "exec", "html", "suspend"}
+
+# Attributes naming another element, and conditions that may reference
+# question labels (Q1.r2, Q5.val, Q3.any ...)
+LAYOUT_REF_ATTRS = ("keepWith", "rightOf")
+COND_REF_ATTRS = ("cond", "rowCond", "colCond", "choiceCond")
+REFERENCE_ATTRS = set(LAYOUT_REF_ATTRS + COND_REF_ATTRS + ("source",))
+COND_REF_PATTERN = re.compile(r"(?<![\w.])([A-Za-z_]\w*)\.(?=[A-Za-z_])")
+STRING_LITERAL = re.compile(r"'[^']*'|\"[^\"]*\"")
+
+# Python names conditions use that are not survey labels
+COND_BUILTINS = {"gv", "p", "this", "re", "math", "datetime", "time", "random", "string", "loopvar"}
+
+def element_references(elem):
+    """
+    (attribute, target label) of every reference elem makes: keepWith /
+    rightOf targets, <insert source>, and labels used in its conditions
+    """
+    for attr, value in elem.items():
+        if attr not in REFERENCE_ATTRS or not value:
+            continue
+
+        if attr in LAYOUT_REF_ATTRS:
+            yield attr, value.strip()
+        elif attr == "source":
+            if local(elem.tag) == "insert":
+                yield attr, value.strip()
+        else:
+            names = COND_REF_PATTERN.findall(STRING_LITERAL.sub("", value))
+            for name in dict.fromkeys(names):
+                if name not in COND_BUILTINS:
+                    yield attr, name
+
+
+class SurveyIndex:
+    """
+    Document-order index of a survey: position and subtree end of every
+    node, the elements carrying each label and the references between
+    them (references in document order, referenced_by per target label)
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.order = []
+        self.pos = {}
+        self.end = {}
+        self.labels = {}
+        self.references = []
+        self.referenced_by = {}
+
+        for event, elem in etree.iterwalk(root, events=("start", "end")):
+            if event == "start":
+                self.pos[elem] = len(self.order)
+                self.order.append(elem)
+            else:
+                # Exclusive: order[pos:end] is the subtree
+                self.end[elem] = len(self.order)
+
+        for elem in self.order:
+            if not isinstance(elem.tag, str):
+                continue
+            label = elem.get("label")
+            if label:
+                self.labels.setdefault(label, []).append(elem)
+            # Most elements (options) reference nothing
+            if REFERENCE_ATTRS.isdisjoint(elem.keys()):
+                continue
+            for attr, target in element_references(elem):
+                self.references.append((elem, attr, target))
+                self.referenced_by.setdefault(target, []).append((elem, attr))
+
+    def find(self, label, after=0):
+        """
+        First element labelled label at or after position after
+        """
+        for elem in self.labels.get(label, ()):
+            if self.pos[elem] >= after:
+                return elem
+        return None
+
+    def element(self, label):
+        """
+        First element labelled label, or None
+        """
+        found = self.labels.get(label)
+        return found[0] if found else None
+
+    def owner_label(self, elem):
+        # Unlabelled elements (<insert>, ...) report their nearest labelled ancestor
+        while elem is not None and not elem.get("label"):
+            elem = elem.getparent()
+        return elem.get("label") if elem is not None else ""
+
+    def reference_report(self):
+        """
+        References to labels that do not exist and labelled questions no
+        other element references, from the maps built with the index
+        """
+        dangling = [
+            {"label": self.owner_label(elem), "attribute": attr, "target": target}
+            for elem, attr, target in self.references
+            if target not in self.labels
+        ]
+
+        unreferenced = []
+        for label, found in self.labels.items():
+            if not any(local(e.tag) in QUESTION_TYPES for e in found):
+                continue
+            # A question's own conditions do not count
+            if all(elem in found for elem, _ in self.referenced_by.get(label, ())):
+                unreferenced.append(label)
+
+        return {"dangling": dangling, "unreferenced": unreferenced}
+
+def reference_text(ref):
+    """
+    One dangling reference of reference_report, e.g. "Q5 keepWith → Q99"
+    """
+    return f"{ref['label'] or '(survey)'} {ref['attribute']} → {ref['target']}"
+
+
+class ExportProfile:
+    """
+    Categories of content an export keeps:
+
+      text     question text, definitions, instructions, info text and
+               loop titles
+      options  rows / columns / choices
+      logic    conditions, terminates, shuffles, layout and validation
+      hidden   where= questions respondents never see
+    """
+
+    def __init__(self, name, text=True, options=True, logic=True, hidden=True):
+        self.name = name
+        self.text = text
+        self.options = options
+        self.logic = logic
+        self.hidden = hidden
+
+    def __repr__(self):
+        return f"ExportProfile({self.name!r})"
+
+
+DEFAULT_PROFILE = "full"
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        ExportProfile("full"),
+        ExportProfile("logic-only", text=False, options=False),
+        ExportProfile("respondent-view", logic=False, hidden=False),
+        ExportProfile("no-hidden", hidden=False),
+    )
+}
+
+def get_profile(name):
+    """
+    ExportProfile by name (default: full)
+    """
+    if isinstance(name, ExportProfile):
+        return name
+    profile = PROFILES.get(name or DEFAULT_PROFILE)
+    if profile is None:
+        raise ValueError(f"Unknown export profile: {name} (one of {', '.join(PROFILES)})")
+    return profile
+
+
+class ExportSelection:
+    """
+    What to export: everything between two marker labels (te1 ... b3 by
+    default), an explicit list of labels, a label regex (matched against
+    the whole label) or already located elements, limited to the
+    categories of an export profile (default: full).
+    """
+
+    def __init__(self, start_label=EXPORT_START_LABEL, end_label=EXPORT_END_LABEL,
+                 labels=None, pattern=None, elements=None, profile=None, sample=None):
+        self.start_label = start_label
+        self.end_label = end_label
+        self.labels = list(labels) if labels is not None else None
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.elements = list(elements) if elements is not None else None
+        self.profile = get_profile(profile)
+
+        # (first, last): keep only that many options at each end of a list
+        if sample is not None:
+            sample = tuple(int(n) for n in sample)
+            if len(sample) != 2 or min(sample) < 0:
+                raise ValueError("sample is (first, last) option counts, both 0 or more")
+        self.sample = sample
+
+    @property
+    def is_default(self):
+        """
+        True for the plain te1 ... b3 range with the full profile, unsampled
+        """
+        return (
+            self.labels is None and self.pattern is None and self.elements is None
+            and self.start_label == EXPORT_START_LABEL and self.end_label == EXPORT_END_LABEL
+            and self.profile.name == DEFAULT_PROFILE and self.sample is None
+        )
+
+    def resolve(self, index):
+        visible = self._resolve(index)
+        visible.profile = self.profile
+        visible.sample = self.sample
+        return visible
+
+    def _resolve(self, index):
+        if self.elements is not None:
+            return SelectedTree(index, self.elements)
+
+        if self.labels is not None:
+            return SelectedTree(index, [
+                elem
+                for label in self.labels
+                for elem in index.labels.get(label, ())
+                if local(elem.tag) in EXPORTABLE_TAGS
+            ])
+
+        if self.pattern is not None:
+            return SelectedTree(index, [
+                elem
+                for label, found in index.labels.items()
+                if self.pattern.fullmatch(label)
+                for elem in found
+                if local(elem.tag) in EXPORTABLE_TAGS
+            ])
+
+        return self._resolve_range(index)
+
+    def _resolve_range(self, index):
+        start = index.find(self.start_label)
+        if start is None:
+            return SelectedTree(index, [])
+
+        # Neither marker is exported
+        first = index.end[start]
+        end = index.find(self.end_label, after=first)
+        stop = index.pos[end] if end is not None else len(index.order)
+
+        # Whole subtrees inside the range are selected and skipped over;
+        # an element the end marker sits in is only entered
+        selected, partial = [], []
+        i = first
+        while i < stop:
+            elem = index.order[i]
+            if index.end[elem] <= stop:
+                selected.append(elem)
+                i = index.end[elem]
+            else:
+                partial.append(elem)
+                i += 1
+
+        return SelectedTree(index, selected, partial)
+
+
+class SelectedTree:
+    """
+    A resolved selection: the selected subtrees plus the blocks / loops
+    leading down to them. children(elem) is what a walk visits below elem,
+    so nothing outside the selection is ever reached.
+    """
+
+    def __init__(self, index, selected, partial=()):
+        self.index = index
+        self.profile = PROFILES[DEFAULT_PROFILE]
+        self.sample = None
+        self.selected = []
+        self._children = {index.root: []}
+
+        items = sorted(
+            [(index.pos[e], False, e) for e in selected] +
+            [(index.pos[e], True, e) for e in partial],
+            key=lambda item: item[0]
+        )
+
+        covered = -1
+        for pos, is_partial, elem in items:
+            if pos < covered:
+                # Already inside a selected subtree
+                continue
+            if is_partial:
+                self._children.setdefault(elem, [])
+            else:
+                self.selected.append(elem)
+                covered = index.end[elem]
+            self._add_path(elem)
+
+    def _add_path(self, elem):
+        child, parent = elem, elem.getparent()
+        while parent is not None:
+            siblings = self._children.setdefault(parent, [])
+            if siblings and siblings[-1] is child:
+                break
+            siblings.append(child)
+            child, parent = parent, parent.getparent()
+
+    def children(self, elem):
+        return self._children.get(elem, elem)
+
+
+# =========================
+# ATTRIBUTE LOGIC
+# =========================
+def question_is_yellow(q):
+    where = q.get("where", "")
+    if not where:
+        return False
+
+    where_parts = {w.strip().lower() for w in where.split(",")}
+    trigger_values = {"survey", "notdp", "execute", "report", "none"}
+
+    return bool(where_parts & trigger_values)
+
+def is_hidden(elem):
+    if elem is None:
+        return False
+
+    cond = elem.get("cond")
+    if not cond:
+        return False
+
+    cond_clean = cond.strip().lower()
+
+    # 1️⃣ Exact hidden
+    if cond_clean == "0":
+        return True
+
+    # 2️⃣ Starts with "0 and ..."
+    if re.match(r'^0\s*(and|&&)\b', cond_clean):
+        return True
+
+    # 3️⃣ Contains "... and 0 ..." (standalone zero)
+    if re.search(r'\b(and|&&)\s*0\b', cond_clean):
+        return True
+
+    if re.search(r'(and|&&)\s*(?<![\w.])0(?![\w.])', cond_clean):
+        return True
+
+    return False
+
+def strip_hides_define_cond(q):
+    """
+    If question has strip="cond", suppress define-level condition display
+    """
+    return q is not None and q.get("strip", "").lower() == "cond"
+
+def get_display_cond(elem):
+    """
+    Returns display condition for both XML elements and define dicts
+    """
+    if isinstance(elem, dict):
+        return elem.get("cond")
+    return elem.get("cond")
+
+def get_any_cond(elem, cond_type):
+    for k, v in elem.attrib.items():
+        if k.lower() == cond_type.lower():
+            return v
+    return None
+
+def get_attr(elem, *names):
+
+    for k, v in elem.attrib.items():
+        if "}" in k:
+            lname = k.split("}", 1)[1]
+        elif ":" in k:
+            lname = k.split(":", 1)[1]
+        else:
+            lname = k
+
+        if lname in names:
+            return v
+    return None
+
+def parse_exclude(exclude_value):
+
+    if not exclude_value:
+        return set()
+    return {x.strip().lower() for x in exclude_value.split(",")}
+
+def resolve_uses_question_name(q):
+    """
+    Returns human-readable question name based on uses / atleast attributes
+    """
+    uses = q.get("uses", "")
+    atleast = q.get("atleast")
+
+    if not uses:
+        return None
+
+    uses = uses.lower()
+
+    # Date
+    if uses.startswith("fvdatepicker"):
+        return "Date Question"
+
+    # Card Rating
+    if uses.startswith("cardrating"):
+        return "Card Rating Question"
+
+    # Slider variants
+    if uses.startswith("sliderpoints"):
+        return "Slider Rating Question"
+
+    if uses.startswith("slidernumber"):
+        return "Slider Question"
+
+    if uses.startswith("sliderdecimal"):
+        return "Slider Decimal Question"
+
+    # Card Sort
+    if uses.startswith("cardsort"):
+        if atleast and atleast.isdigit() and int(atleast) > 1:
+            return "Card Sort Multi Select Question"
+        return "Card Sort Single Select Question"
+
+    # Autosum
+    if uses.startswith("autosum"):
+        return "Autosum Question"
+
+    # Rank Sort (multiple versions)
+    if uses.startswith("ranksort"):
+        return "Ranksort Question"
+
+    # This That
+    if uses.startswith("leftright"):
+        return "This-That Question"
+
+    if uses.startswith("imgmap"):
+        return "Image highlighter Question"
+
+    if uses.startswith("hottext"):
+        return "Text highlighter Question"
+
+    if uses.startswith("autosuggest"):
+        return "Autosuggest Question"
+
+    return None
+
+def is_optional_shown(q):
+    """
+    number / text / textarea questions that show "Optional Question"
+    """
+    qtype = local(q.tag)
+    optional = q.get("optional")
+
+    if qtype in {"number", "text", "textarea"}:
+        # Explicit optional
+        if optional == "1":
+            return True
+        # Default optional for text / textarea
+        if qtype in {"text", "textarea"} and optional is None:
+            return True
+    return False
+
+def get_numeric_range(q):
+    """
+    Range from range="" OR verify="range(x,y)"
+    """
+    # 1️⃣ Direct range attribute
+    if "range" in q.attrib and q.get("range"):
+        return q.get("range")
+
+    # 2️⃣ Verify range(x,y)
+    verify = q.get("verify")
+    if verify:
+        m = re.search(r"range\s*\(\s*([^)]+)\s*\)", verify)
+        if m:
+            return m.group(1)
+
+    return None
+
+def get_shuffle_logic(elem):
+    """
+    Reads shuffle / order attributes and returns readable logic text
+    """
+    logic = []
+
+    shuffle = elem.get("shuffle")
+    sortRows = elem.get("sortRows")
+    rowShuffle = elem.get("rowShuffle")
+    colShuffle = elem.get("colShuffle")
+
+
+    if shuffle:
+        shuffle = shuffle.lower()
+
+        if shuffle == "rows":
+            logic.append("Randomize Rows")
+        elif shuffle == "cols":
+            logic.append("Randomize Columns")
+        elif shuffle == "choice":
+            logic.append("Randomize Choices")
+        elif shuffle == "rows,groups":
+            logic.append("Randomize Rows and Groups")
+
+    if rowShuffle:
+        rowShuffle = rowShuffle.lower()
+
+        if rowShuffle == "flip" and shuffle == "rows":
+            logic.append("Flip Rows")
+        elif rowShuffle == "rflip" and shuffle == "rows":
+            logic.append("Reverse Flip Rows")
+        elif rowShuffle == "rotate" and shuffle == "rows":
+            logic.append("Rotate Options")
+        elif rowShuffle == "rrotate" and shuffle == "rows":
+            logic.append("Reverse Rotate Options")
+
+    if colShuffle:
+        colShuffle = colShuffle.lower()
+
+        if colShuffle == "flip" and shuffle == "cols":
+            logic.append("Flip Column")
+        elif colShuffle == "rflip" and shuffle == "cols":
+            logic.append("Reverse Flip Column")
+        elif colShuffle == "rotate" and shuffle == "cols":
+            logic.append("Rotate Options")
+        elif colShuffle == "rrotate" and shuffle == "cols":
+            logic.append("Reverse Rotate Options")
+
+    if sortRows:
+        sortRows = sortRows.lower()
+    if sortRows == "asc":
+        logic.append("Alphabatic Order")
+    elif sortRows == "dsc":
+        logic.append("Reverse Alphabatic Order")
+
+
+    return logic
+
+
+# =========================
+# TOOLTIPS
+# =========================
+def extract_tooltip_from_text(text):
+
+    if not text:
+        return text, None, None
+
+    text = unescape(text)
+
+    pattern = re.compile(
+        r'<span\s+class="tooltip">\s*(.*?)\s*'
+        r'<span\s+class="tooltiptext">\s*(.*?)\s*</span>\s*</span>',
+        flags=re.IGNORECASE | re.DOTALL
+    )
+
+    m = pattern.search(text)
+    if not m:
+        return text, None, None
+
+    label = m.group(1).strip()
+    definition = m.group(2).strip()
+
+    clean_text = pattern.sub(label, text)
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+
+    return clean_text, label, definition
+
+def extract_tooltip_from_xml(title_elem):
+    """
+    Supports:
+    1) Real XML tooltip spans
+    2) Escaped HTML tooltip spans
+    """
+
+    # ---------- CASE 1: REAL XML TOOLTIP ----------
+    tooltip = title_elem.xpath(
+        './/*[local-name()="span" and @class="tooltip"]'
+    )
+
+    if tooltip:
+        tooltip = tooltip[0]
+        label = (tooltip.text or "").strip()
+
+        tooltiptext = tooltip.xpath(
+            './/*[local-name()="span" and @class="tooltiptext"]'
+        )
+
+        definition = (
+            ''.join(tooltiptext[0].itertext()).strip()
+            if tooltiptext else None
+        )
+
+        parts = []
+        for node in title_elem.iter():
+            if node is tooltip:
+                parts.append(label)
+            elif node.getparent() is tooltip:
+                continue
+            elif node.text:
+                parts.append(node.text)
+
+        clean_text = ' '.join(' '.join(parts).split())
+        return clean_text, label, definition
+
+    # ---------- CASE 2: ESCAPED HTML TOOLTIP ----------
+    raw_text = ''.join(title_elem.itertext()).strip()
+    return extract_tooltip_from_text(raw_text)
+
+def resolve_definition_text(text, q):
+    """
+    Resolves ${res.X} → resource text
+    """
+    if not text:
+        return None
+
+    m = re.match(r'\$\{res\.(\w+)\}', text)
+    if m:
+        return get_resource_text(q, m.group(1))  # your existing function
+
+    return text
+
+def get_resource_text(q, resource_name):
+    # example implementation
+    return q.get("resources", {}).get(resource_name, "")
+
+
+# =========================
+# OPTIONS
+# =========================
+def is_anchor_text(text):
+    t = text.lower().strip()
+    return any(t.startswith(k) for k in ANCHOR_KEYWORDS)
+
+def is_noanswer(elem):
+    if isinstance(elem, dict):
+        return elem.get("noanswer") == "1"
+    return local(elem.tag) == "noanswer" or elem.get("noanswer") in {"1", "true", "yes"}
+
+def get_row_text(r):
+    return r.get("text") if isinstance(r, dict) else safe(r.text)
+
+def get_option_label(o):
+    return o.get("label") if isinstance(o, dict) else o.get("label", "")
+
+def format_option(elem, text):
+    flags = []
+
+    randomize = elem.get("randomize") if not isinstance(elem, dict) else elem.get("randomize")
+    exclusive = elem.get("exclusive") if not isinstance(elem, dict) else elem.get("exclusive")
+    open_flag = elem.get("open") if not isinstance(elem, dict) else elem.get("open")
+
+    if open_flag == "1" or randomize == "0" or is_anchor_text(text):
+        flags.append("anchor")
+
+    # Exclusive
+    if exclusive == "1":
+        flags.append("exclusive")
+
+    return text, flags, False
+
+def option_rank(o):
+    """
+    Where sort_options puts an option: 0 normal, 1 anchored, 2 no answer
+    """
+    text = o["text"] if isinstance(o, dict) else safe(o.text)
+
+    if is_noanswer(o):
+        return 2
+    if is_anchor_text(text):
+        return 1
+    return 0
+
+def sort_options(items):
+    ranked = ([], [], [])
+    for o in items:
+        ranked[option_rank(o)].append(o)
+
+    normal, anchor, noanswer = ranked
+    return normal + anchor + noanswer
+
+
+class OmittedOptions:
+    """
+    Stands for the options a sampled list leaves out
+    """
+
+    def __init__(self, count, total):
+        self.count = count
+        self.total = total
+
+    def as_dict(self):
+        return {"more": self.count, "total": self.total}
+
+def sample_options(items, first, last):
+    """
+    The first / last options of sort_options order with an OmittedOptions
+    in between; short lists come back whole. Every option is ranked
+    (anchored and no-answer ones move to the end wherever they are), but
+    only the kept ones are ordered and returned.
+    """
+    if len(items) <= first + last:
+        return sort_options(items)
+
+    ranks = [option_rank(o) for o in items]
+
+    def in_order(options, option_ranks, order):
+        return (o for rank in order for o, r in zip(options, option_ranks) if r == rank)
+
+    head = list(islice(in_order(items, ranks, (0, 1, 2)), first))
+    tail = list(islice(in_order(items[::-1], ranks[::-1], (2, 1, 0)), last))[::-1]
+    return head + [OmittedOptions(len(items) - first - last, len(items))] + tail
+
+def options_in_order(items, sample=None):
+    """
+    sort_options, or sample_options when sample is (first, last)
+    """
+    return sort_options(items) if sample is None else sample_options(items, *sample)
+
+def group_rows_by_group(rows):
+    grouped = {}
+    ungrouped = []
+
+    for r in rows:
+        grp = r.get("groups") if not isinstance(r, dict) else r.get("groups")
+        if grp:
+            for g in grp.split(","):
+                grouped.setdefault(g.strip(), []).append(r)
+        else:
+            ungrouped.append(r)
+
+    return grouped, ungrouped
+
+def parse_groups(q):
+    """
+    Returns:
+    groups: {group_label: clean_group_text}
+    """
+    groups = {}
+
+    for g in q.xpath('./*[local-name()="group"]'):
+        label = g.get("label")
+        if not label:
+            continue
+
+        # Convert XML to HTML string
+        text = etree.tostring(g, encoding="unicode", method="html")
+
+        # Remove opening and closing <group> tags
+        text = re.sub(r'</?group[^>]*>', '', text, flags=re.IGNORECASE)
+
+        # Decode HTML entities (&lt;b&gt; → <b>)
+        text = unescape(text)
+
+        # Final safety cleanup (JUST IN CASE)
+        text = text.replace('</group>', '').strip()
+
+        groups[label] = text
+
+    return groups
+
+
+# =========================
+# COMPILED SURVEY
+# =========================
+class Survey:
+    """
+    Parsed survey.xml with the lookups every renderer needs
+    (DEFINES for <insert>/loop sources, RES_VALUES for ${res.X})
+    """
+
+    def __init__(self, root, index=None):
+        self.root = root
+        self.name = get_survey_name(root)
+        self.defines = self._build_defines(root)
+        self.res_values = self._build_res_values(root)
+        # A SurveyIndex of the same tree may be reused (structure only)
+        self._index = index
+
+    @classmethod
+    def from_file(cls, xml_path):
+        parser = xml_parser()
+        tree = etree.parse(xml_path, parser)
+        check_parsed(parser)
+        return cls(tree.getroot())
+
+    @classmethod
+    def from_string(cls, xml_content):
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode("utf-8")
+        parser = xml_parser()
+        root = etree.fromstring(xml_content, parser)
+        check_parsed(parser)
+        return cls(root)
+
+    @classmethod
+    def from_stream(cls, stream, chunk_size=64 * 1024, on_chunk=None):
+        """
+        Parses a binary file object chunk by chunk with lxml's feed parser,
+        so the raw XML is never held in memory as a whole (uploads).
+        on_chunk(chunk) sees every chunk first and may raise to stop.
+        """
+        parser = xml_parser()
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            if on_chunk is not None:
+                on_chunk(chunk)
+            parser.feed(chunk)
+
+        root = parser.close()
+        if root is None:
+            raise ValueError("No XML element found")
+        check_parsed(parser, root)
+        return cls(root)
+
+    @property
+    def index(self):
+        """
+        SurveyIndex, built on first use
+        """
+        if self._index is None:
+            self._index = SurveyIndex(self.root)
+        return self._index
+
+    def select(self, selection=None):
+        """
+        Resolves an ExportSelection (default: the te1 ... b3 range)
+        """
+        return (selection or ExportSelection()).resolve(self.index)
+
+    @staticmethod
+    def _build_defines(root):
+        defines = {}
+
+        for d in root.xpath('.//*[local-name()="define"]'):
+            label = d.get("label")
+            if not label:
+                continue
+
+            items = []
+            for r in d.xpath(OPTION_XPATH):
+                items.append({
+                    "tag": local(r.tag),
+                    "label": r.get("label", ""),
+                    "text": safe(r.text),
+                    "randomize": r.get("randomize"),
+                    "exclusive": r.get("exclusive"),
+                    "cond": r.get("cond"),
+                    "rowCond": r.get("rowCond"),
+                    "colCond": r.get("colCond"),
+                    "choiceCond": r.get("choiceCond"),
+                    "noanswer": "1" if local(r.tag) == "noanswer" else r.get("exclusive")
+                })
+
+            defines[label] = items
+
+        return defines
+
+    @staticmethod
+    def _build_res_values(root):
+        res_values = {}
+
+        for r in root.xpath('.//*[local-name()="res"]'):
+            label = r.get("label")
+            value = safe("".join(r.itertext()))
+            if label:
+                res_values[label] = value
+
+        return res_values
+
+    def resolve_res_value(self, text):
+        """
+        Replaces ${res.X} with actual <res label="X">value</res>
+        """
+        if not text:
+            return text
+
+        def replacer(match):
+            var = match.group(1)
+            return self.res_values.get(var, var)  # fallback to var name if missing
+
+        return RES_VAR_PATTERN.sub(replacer, text)
+
+    def resolve_insert(self, elem):
+        source = elem.get("source")
+        items = self.defines.get(source, [])
+
+        exclude_set = parse_exclude(elem.get("exclude"))
+
+        if not exclude_set:
+            return items
+
+        filtered = []
+        for item in items:
+            label = item.get("label", "").lower()
+
+            # Match r / c / ch prefixes
+            if label and any(
+                label == ex or label.startswith(ex)
+                for ex in exclude_set
+            ):
+                continue
+
+            filtered.append(item)
+
+        return filtered
+
+    def collect_options(self, q):
+        """
+        Returns (rows, cols, choices) of a question, XML options first,
+        then resolved <insert> items
+        """
+        rows, cols, choices = [], [], []
+
+        for e in q.xpath(OPTION_XPATH):
+            if is_hidden(e):
+                continue
+            tag = local(e.tag)
+            if tag == "row":
+                rows.append(e)
+            elif tag == "col":
+                cols.append(e)
+            else:
+                choices.append(e)
+
+        # Process <insert> elements
+        for ins in q.xpath('./*[local-name()="insert"]'):
+            for i in self.resolve_insert(ins):
+                if i.get("cond") == "0":
+                    continue
+                tag = i.get("tag")
+                if tag == "row":
+                    rows.append(i)
+                elif tag == "col":
+                    cols.append(i)
+                else:
+                    choices.append(i)
+
+        return rows, cols, choices
+
+    def get_loop_rows(self, loop):
+        """
+        Returns the looprows of a loop as dicts:
+        label, cond, vars (loopvar name -> value) and text ("name = value | ...")
+        Empty for define-based / dynamic loops
+        """
+        rows = []
+
+        for lr in loop.xpath('./*[local-name()="looprow"]'):
+            values = {}
+            vars_text = []
+            for lv in lr.xpath('./*[local-name()="loopvar"]'):
+                name = lv.get("name", "").strip()
+                value = safe(lv.text)
+                if name:
+                    values[name] = value
+                if name and value:
+                    vars_text.append(f"{name} = {value}")
+                elif value:
+                    vars_text.append(value)
+
+            rows.append({
+                "label": lr.get("label"),
+                "cond": lr.get("cond"),
+                "vars": values,
+                "text": " | ".join(vars_text) if vars_text else "",
+            })
+
+        return rows
+
+    def get_loop_iterations(self, loop):
+        """
+        Returns list of tuples:
+        (display_text, cond)
+        Supports MULTIPLE loopvar per looprow
+        """
+        iterations = []
+
+        looprows = self.get_loop_rows(loop)
+        if looprows:
+            for row in looprows:
+                label = row["label"]
+                display = f"{label}. {row['text']}" if label else row["text"]
+
+                iterations.append((display, row["cond"]))
+
+            return iterations
+
+        # Fallback (define-based loops)
+        source = loop.get("source")
+        if source in self.defines:
+            for item in self.defines[source]:
+                display = f"{item['label']}: {item['text']}"
+                iterations.append((display, item.get("cond")))
+            return iterations
+
+        iterations.append(("⚠ Dynamic loop (resolved at runtime)", None))
+        return iterations
+
+
+# =========================
+# LOGICAL CONTENT
+# =========================
+# Renderer independent view of what render_question / render_loop /
+# render_block put into the Word document. Used by the JSON, Markdown and
+# HTML renderers.
+
+def option_content(o, parent_q=None, logic=True):
+    if not logic:
+        return {
+            "label": get_option_label(o),
+            "text": element_text(o),
+            "flags": [],
+            "shuffle": [],
+            "cond": None,
+            "exclusive": False,
+        }
+
+    _, flags, _ = format_option(o, get_row_text(o))
+
+    # 🚫 Hide define-level cond when question has strip="cond"
+    cond = get_display_cond(o)
+    if cond and parent_q is not None and strip_hides_define_cond(parent_q) and isinstance(o, dict):
+        cond = None
+
+    return {
+        "label": get_option_label(o),
+        "text": element_text(o),
+        "flags": flags,
+        "shuffle": [] if isinstance(o, dict) else get_shuffle_logic(o),
+        "cond": cond,
+        "exclusive": is_noanswer(o),
+    }
+
+def question_content(q, survey, profile=None, sample=None):
+    """
+    Returns the logical content of a question, or None when it has no title.
+    Categories the profile leaves out are never computed: their text is
+    None, their logic fields are empty and there are no options. With
+    sample, option lists hold {"more", "total"} in place of the options
+    left out.
+    """
+    profile = profile or PROFILES[DEFAULT_PROFILE]
+    text_on, logic_on = profile.text, profile.logic
+
+    title_elem = q.xpath('.//*[local-name()="title"]')
+    if not title_elem:
+        return None
+    title_elem = title_elem[0]
+
+    text = bullets = definition = None
+    if text_on:
+        _, _, definition = extract_tooltip_from_xml(title_elem)
+        text, bullets = split_list_items(title_html(title_elem))
+
+    content = {
+        "kind": "question",
+        "label": q.get("label", "NO_LABEL"),
+        "type": local(q.tag).upper(),
+        "uses": resolve_uses_question_name(q),
+        "hidden": question_is_yellow(q),
+        "cond": q.get("cond") if logic_on else None,
+        "text": strip_tags(clean_html(text)) if text_on else None,
+        "bullets": [strip_tags(b) for b in bullets] if text_on else [],
+        "definition": resolve_definition_text(definition, q) if definition else None,
+    }
+
+    if logic_on and local(q.tag) in {"number", "float"}:
+        post_text = get_attr(q, "postText")
+        pre_text = get_attr(q, "preText")
+        content["range"] = get_numeric_range(q)
+        content["post_text"] = survey.resolve_res_value(post_text) if post_text is not None else None
+        content["pre_text"] = survey.resolve_res_value(pre_text) if pre_text is not None else None
+
+    comment = q.xpath('.//*[local-name()="comment"]') if text_on else None
+
+    content.update({
+        "optional": logic_on and (is_optional_shown(q) or (
+            local(q.tag) in {"number", "float"} and q.get("optional") == "1"
+        )),
+        "keep_with": q.get("keepWith") if logic_on else None,
+        "right_of": q.get("rightOf") if logic_on else None,
+        "comment": element_text(comment[0]) if comment else None,
+        "row_cond": get_any_cond(q, "rowCond") if logic_on else None,
+        "col_cond": get_any_cond(q, "colCond") if logic_on else None,
+        "choice_cond": get_any_cond(q, "choiceCond") if logic_on else None,
+        "shuffle": get_shuffle_logic(q) if logic_on else [],
+    })
+
+    if profile.options:
+        content.update(question_options(q, survey, logic_on, sample))
+    else:
+        content.update({"groups": [], "rows": [], "cols": [], "choices": []})
+
+    return content
+
+def question_options(q, survey, logic=True, sample=None):
+    """
+    Sorted groups / rows / cols / choices of a question (inserts resolved);
+    without logic only the label and text of each option
+    """
+    content = {}
+    rows, cols, choices = survey.collect_options(q)
+
+    def options(items, parent_q=None):
+        return [
+            o.as_dict() if isinstance(o, OmittedOptions) else option_content(o, parent_q, logic)
+            for o in options_in_order(items, sample)
+        ]
+
+    # Grouped rows
+    groups = parse_groups(q)
+    grouped_rows, ungrouped_rows = group_rows_by_group(rows)
+
+    content["groups"] = [
+        {
+            "label": g_label,
+            "text": strip_tags(g_title),
+            "rows": options(grouped_rows.get(g_label, []), q),
+        }
+        for g_label, g_title in groups.items()
+    ]
+    content["rows"] = options(ungrouped_rows if groups else rows, q)
+    content["cols"] = options(cols)
+    content["choices"] = options(choices)
+
+    return content
+
+
+# =========================
+# DOCUMENT WALK
+# =========================
+# traverse() events
+ENTER = "enter"
+EXIT = "exit"
+VISIT = "visit"
+
+# Elements traverse() yields as VISIT; questions handle their own
+# term / html children
+CONTENT_TAGS = QUESTION_TYPES | {"term", "exec", "html", "suspend"}
+
+def traverse(visible):
+    """
+    Iterative walk of a SelectedTree in document order, yielding
+    (event, elem, in_loop):
+
+      ENTER / EXIT  around every block and loop (hidden ones are skipped
+                    with their content)
+      VISIT         for questions, term, exec, html and suspend
+
+    in_loop is True for blocks directly inside a loop. The explicit stack
+    keeps nesting depth independent of the Python recursion limit.
+    where= questions are skipped when the profile leaves them out.
+    """
+    root = visible.index.root
+    skip_hidden = not visible.profile.hidden
+    stack = [(root, iter(visible.children(root)), False, False)]
+
+    while stack:
+        parent, children, parent_is_loop, parent_in_loop = stack[-1]
+
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if parent is not root:
+                yield EXIT, parent, parent_in_loop
+            continue
+
+        tag = local(child.tag)
+        if tag in {"block", "loop"}:
+            if is_hidden(child):
+                continue
+            in_loop = parent_is_loop and tag == "block"
+            yield ENTER, child, in_loop
+            stack.append((child, iter(visible.children(child)), tag == "loop", in_loop))
+        elif tag in CONTENT_TAGS:
+            if skip_hidden and tag in QUESTION_TYPES and question_is_yellow(child):
+                continue
+            yield VISIT, child, parent_is_loop
+
+def walk_survey(survey, selection=None, expand_loops=False, reference_report=False):
+    """
+    Yields the survey as a flat stream of event dicts in document order:
+    block_start / block_end, loop_start / loop_end, question, term, info,
+    suspend. Applies the same export selection and hidden rules as the
+    Word export.
+
+    expand_loops repeats the content of looprow loops once per iteration
+    (after an "iteration" event) with the [loopvar: x] values filled in.
+    reference_report ends the stream with a "references" event (dangling
+    references and unreferenced questions of the whole survey).
+    """
+    events = iter_survey(survey, selection)
+    if expand_loops:
+        events = expand_loop_events(survey, events)
+
+    for _, event in events:
+        yield event
+
+    if reference_report:
+        yield {"kind": "references", **survey.index.reference_report()}
+
+def iter_survey(survey, selection=None, detail=None):
+    """
+    Same walk as walk_survey, yielding (element, event) pairs.
+
+    detail(q) decides whether a question gets its full content; questions
+    it rejects only carry label / type / hidden (used for outlines).
+    """
+    visible = survey.select(selection)
+    profile = visible.profile
+
+    def logic(value):
+        return value if profile.logic else None
+
+    def flow(elem):
+        if is_hidden(elem) or not profile.logic:
+            return
+        if local(elem.tag) == "term":
+            yield elem, {
+                "kind": "term",
+                "label": elem.get("label"),
+                "cond": elem.get("cond", "").strip(),
+            }
+
+    def info(elem):
+        if is_hidden(elem):
+            return
+
+        tag = local(elem.tag)
+        if tag == "html":
+            cond = logic(elem.get("cond"))
+            if not (profile.text or cond):
+                return
+            yield elem, {
+                "kind": "info",
+                "label": elem.get("label", "").strip(),
+                "cond": cond,
+                "text": element_text(elem) if profile.text else None,
+            }
+        elif tag == "suspend":
+            yield elem, {"kind": "suspend", "cond": logic(elem.get("cond"))}
+
+    def question(q):
+        if is_hidden(q):
+            return
+
+        if detail is None or detail(q):
+            content = question_content(q, survey, profile, visible.sample)
+        elif q.xpath('.//*[local-name()="title"]'):
+            content = {
+                "kind": "question",
+                "label": q.get("label", "NO_LABEL"),
+                "type": local(q.tag).upper(),
+                "hidden": question_is_yellow(q),
+            }
+        else:
+            content = None
+
+        if content is None:
+            return
+        yield q, content
+
+        # Process flow and info elements
+        for child in visible.children(q):
+            tag = local(child.tag)
+            if tag in {"term", "exec"}:
+                yield from flow(child)
+            elif tag in {"html", "suspend"}:
+                yield from info(child)
+
+    def loop_start(l):
+        title = l.xpath('./*[local-name()="title"]') if profile.text else None
+
+        return {
+            "kind": "loop_start",
+            "label": l.get("label", "LOOP"),
+            "cond": logic(l.get("cond")),
+            "title": element_text(title[0]) if title else None,
+            "iterations": [
+                {"text": text, "cond": logic(cond)}
+                for text, cond in survey.get_loop_iterations(l)
+            ],
+        }
+
+    for event, elem, in_loop in traverse(visible):
+        tag = local(elem.tag)
+
+        if event == ENTER:
+            if tag == "loop":
+                yield elem, loop_start(elem)
+            else:
+                yield elem, {
+                    "kind": "block_start",
+                    "label": elem.get("label", "BLOCK"),
+                    "in_loop": in_loop,
+                    "cond": logic(elem.get("cond")),
+                }
+        elif event == EXIT:
+            if tag == "loop":
+                yield elem, {"kind": "loop_end", "label": elem.get("label", "LOOP")}
+            else:
+                yield elem, {"kind": "block_end", "label": elem.get("label", "BLOCK"), "in_loop": in_loop}
+        elif tag in QUESTION_TYPES:
+            yield from question(elem)
+        elif tag in {"term", "exec"}:
+            yield from flow(elem)
+        elif tag in {"html", "suspend"}:
+            yield from info(elem)
@@ -0,0 +1,86 @@
+import copy
+import threading
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import RGBColor
+
+# =========================
+# BASE DOCUMENT
+# =========================
+# Legend bullets every export starts with (text, color)
+LEGEND = (
+    # Red bullet – Programming Logic
+    ("Red highlighted for Programming Logic", RGBColor(255, 0, 0)),
+    # Blue bullet – Instructions
+    ("Blue highlighted for Instructions", RGBColor(68, 114, 196)),
+    # Yellow bullet – Hidden Questions
+    ("All hidden question label will be highlighted in yellow", RGBColor(255, 192, 0)),
+)
+
+# Paragraph styles used by the renderer, resolved to style ids once
+PARAGRAPH_STYLES = (
+    "Title", "Heading 1", "Heading 2", "Heading 3", "Heading 4",
+    "List Bullet", "List Continue",
+)
+
+_base = None
+_base_lock = threading.Lock()
+
+
+def build_base_document():
+    """
+    Default python-docx template with the legend added and style ids resolved
+    """
+    doc = Document()
+
+    for text, color in LEGEND:
+        p = doc.add_paragraph(style="List Bullet")
+        r = p.add_run(text)
+        r.bold = True
+        r.font.color.rgb = color
+
+    style_ids = {
+        name: doc.part.get_style_id(name, WD_STYLE_TYPE.PARAGRAPH)
+        for name in PARAGRAPH_STYLES
+    }
+
+    return doc, style_ids
+
+
+def get_base_document():
+    global _base
+
+    if _base is None:
+        with _base_lock:
+            if _base is None:
+                _base = build_base_document()
+    return _base
+
+
+def warm_up():
+    """
+    Builds the base document up front (gunicorn preload_app / app start),
+    so forked workers share it copy-on-write
+    """
+    get_base_document()
+
+
+def new_document():
+    """
+    Returns (doc, style_ids) for one export.
+
+    Only word/document.xml is copied; styles, numbering, settings and the
+    other template parts are never modified while rendering and stay shared
+    with the base document.
+    """
+    base, style_ids = get_base_document()
+
+    memo = {
+        id(part): part
+        for part in base.part.package.iter_parts()
+        if part is not base.part
+    }
+
+    part = copy.deepcopy(base.part, memo)
+    return part.document, style_ids
@@ -0,0 +1,142 @@
+import hashlib
+import re
+from collections import Counter
+
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Inches, RGBColor
+
+from pqr_loops import expansion_rows
+from pqr_survey import ENTER, EXIT, QUESTION_TYPES, is_hidden, local, resolve_uses_question_name, traverse
+
+TOC_TITLE = "Table of Contents"
+
+LINK_BLUE = RGBColor(5, 99, 193)
+
+# Indent per level: loops (2), blocks (3), questions (4)
+TOC_INDENT = Inches(0.25)
+
+# Word allows 40 characters in a bookmark name
+BOOKMARK_NAME_LENGTH = 40
+BOOKMARK_HASH_LENGTH = 8
+
+
+def bookmark_name(kind, label, occurrence):
+    """
+    Bookmark of the n-th heading of a label. The leading underscore keeps
+    it out of Word's bookmark list, like Word's own _Toc bookmarks.
+
+    The readable part is the label with non-word characters replaced and
+    cut to fit; a hash of the raw label keeps Q1.a / Q1_a and long labels
+    with the same start apart.
+    """
+    digest = hashlib.sha1(label.encode("utf-8")).hexdigest()[:BOOKMARK_HASH_LENGTH]
+    suffix = f"_{digest}_{occurrence}"
+    prefix = f"_{kind[0].upper()}_"
+    readable = re.sub(r"\W", "_", label, flags=re.ASCII)
+    return prefix + readable[:BOOKMARK_NAME_LENGTH - len(prefix) - len(suffix)] + suffix
+
+def question_heading(q):
+    """
+    Header text of a question in the Word export
+    """
+    label = q.get("label", "NO_LABEL")
+    uses_name = resolve_uses_question_name(q)
+    return f"{label} ({uses_name})" if uses_name else f"{label} ({local(q.tag).upper()})"
+
+
+# =========================
+# DOCX MARKUP
+# =========================
+def add_bookmark(paragraph, name, bookmark_id):
+    """
+    Puts a bookmark at the start of paragraph
+    """
+    p = paragraph._p
+
+    start = OxmlElement("w:bookmarkStart")
+    start.set(qn("w:id"), str(bookmark_id))
+    start.set(qn("w:name"), name)
+    end = OxmlElement("w:bookmarkEnd")
+    end.set(qn("w:id"), str(bookmark_id))
+
+    position = 1 if p.pPr is not None else 0
+    p.insert(position, start)
+    p.insert(position + 1, end)
+
+def add_internal_link(paragraph, text, anchor):
+    """
+    Appends text to paragraph as a hyperlink to the bookmark anchor
+    """
+    link = OxmlElement("w:hyperlink")
+    link.set(qn("w:anchor"), anchor)
+    link.set(qn("w:history"), "1")
+
+    run = paragraph.add_run(text)
+    run.font.color.rgb = LINK_BLUE
+    run.font.underline = True
+    # add_run put the run in the paragraph; move it into the link
+    link.append(run._r)
+    paragraph._p.append(link)
+
+
+# =========================
+# TABLE OF CONTENTS
+# =========================
+class TableOfContents:
+    """
+    Loop, block and question headings of a Word export with a bookmark
+    for each.
+
+    The body is streamed, so the contents (which come first) are worked
+    out up front from the structure of the selected tree: a label-only walk
+    with the same hidden / title rules as the render. The render then calls
+    bookmark() at every heading it creates. Bookmarks are named after the
+    label and its occurrence, so an entry can only ever point at its own
+    heading.
+
+    Content of expanded loops is stamped once per iteration and gets no
+    entries (the loop heading itself does).
+    """
+
+    def __init__(self, survey, visible, expand_loops=False):
+        # (level, text, bookmark name)
+        self.entries = []
+        self._seen = Counter()
+        self._next_id = 0
+
+        seen = Counter()
+        expanded = []
+
+        def add(level, kind, label, text):
+            if expanded:
+                return
+            seen[(kind, label)] += 1
+            self.entries.append((level, text, bookmark_name(kind, label, seen[(kind, label)])))
+
+        for event, elem, _ in traverse(visible):
+            tag = local(elem.tag)
+
+            if event == ENTER:
+                if tag == "loop":
+                    label = elem.get("label", "LOOP")
+                    add(2, "loop", label, f"🔁 Loop: {label}")
+                    if expand_loops and expansion_rows(survey, elem) is not None:
+                        expanded.append(elem)
+                else:
+                    label = elem.get("label", "BLOCK")
+                    add(3, "block", label, f"Block: {label}")
+            elif event == EXIT:
+                if expanded and expanded[-1] is elem:
+                    expanded.pop()
+            elif tag in QUESTION_TYPES and not is_hidden(elem):
+                if elem.xpath('.//*[local-name()="title"]'):
+                    add(4, "question", elem.get("label", "NO_LABEL"), question_heading(elem))
+
+    def bookmark(self, paragraph, kind, label):
+        """
+        Bookmarks a heading the render just created
+        """
+        self._seen[(kind, label)] += 1
+        add_bookmark(paragraph, bookmark_name(kind, label, self._seen[(kind, label)]), self._next_id)
+        self._next_id += 1
@@ -0,0 +1,61 @@
+from config import Config
+from pqr_lanes import XmlScan
+from pqr_memory import MB, check_budget
+from pqr_survey import Survey
+
+
+class UploadRefused(Exception):
+    """
+    Raised while reading an upload once it is larger than
+    Config.UPLOAD_MAX_MB or its export no longer fits in the memory budget;
+    refusal is the upload_refusal / check_budget dict
+    """
+
+    def __init__(self, refusal):
+        super().__init__(refusal["error"])
+        self.refusal = refusal
+
+
+def upload_refusal(size, limit_mb=None):
+    """
+    None while size bytes are within the upload limit, otherwise the
+    413 body stating the limit
+    """
+    limit_mb = Config.UPLOAD_MAX_MB if limit_mb is None else limit_mb
+    if not limit_mb or size <= limit_mb * MB:
+        return None
+
+    return {
+        "error": f"Upload too large: survey.xml may be at most {limit_mb} MB.",
+        "limit_mb": limit_mb,
+    }
+
+def refuse_upload(size, fmt=None):
+    refusal = upload_refusal(size) or check_budget(size, fmt)
+    if refusal:
+        raise UploadRefused(refusal)
+
+def parse_upload(stream, fmt=None, content_length=None, cancel=None):
+    """
+    Parses an uploaded survey.xml while it is being received: every chunk
+    goes to the pre-scan and lxml's feed parser and is then dropped, so
+    only the tree is kept. Returns (Survey, scan).
+
+    The upload limit and the memory budget of the fmt export are checked
+    against the announced Content-Length before reading and against the
+    bytes received after every chunk, so an oversized upload is refused
+    without reading (or parsing) the rest of it.
+    """
+    if content_length:
+        refuse_upload(content_length, fmt)
+
+    scan = XmlScan()
+
+    def on_chunk(chunk):
+        scan.feed(chunk)
+        refuse_upload(scan.size, fmt)
+        if cancel is not None:
+            cancel.check()
+
+    survey = Survey.from_stream(stream, on_chunk=on_chunk)
+    return survey, scan.result()
@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+
+from config import Config
+
+# Statuses worth another attempt; any other 4xx is the caller's mistake
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest pause between two attempts (seconds)
+BACKOFF_CAP = 8.0
+
+
+class UpstreamError(Exception):
+    """
+    Raised when Decipher could not be reached, kept failing or the circuit
+    is open; retry_after is a hint in seconds
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamError):
+    """
+    Raised without calling Decipher while the circuit is open
+    """
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+class CircuitBreaker:
+    """
+    Opens after `failures` failed calls in a row; while open every call is
+    refused at once. After reset_seconds a single trial call is let through
+    (half-open): success closes the circuit again, failure re-opens it.
+
+    In memory, so each gunicorn worker trips on its own.
+    """
+
+    def __init__(self, name, failures=None, reset_seconds=None):
+        self.name = name
+        self.failures = failures or Config.BREAKER_FAILURES
+        self.reset_seconds = reset_seconds or Config.BREAKER_RESET_SECONDS
+        self.state = "closed"
+        self._failed = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(self.reset_seconds - (time.monotonic() - self._opened_at), 0)
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half-open"
+                return
+            raise CircuitOpen(
+                f"Decipher {self.name} circuit is open", retry_after=round(self.retry_after()) or 1
+            )
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"✅ Decipher {self.name} circuit closed")
+            self.state = "closed"
+            self._failed = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failed += 1
+            if self.state == "half-open" or self._failed >= self.failures:
+                if self.state != "open":
+                    print(f"⚠ Decipher {self.name} circuit open for {self.reset_seconds}s")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker(endpoint):
+    """
+    The circuit breaker of one upstream endpoint ("lookup", "files" ...)
+    """
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+# =========================
+# REQUESTS
+# =========================
+def backoff(attempt):
+    # Full jitter: a random pause up to the exponential step, so clients
+    # failing together do not retry together
+    return random.uniform(0, min(BACKOFF_CAP, Config.UPSTREAM_BACKOFF * 2 ** attempt))
+
+def upstream_get(endpoint, url, headers, budget=None, retries=None):
+    """
+    requests.get through the endpoint's circuit breaker, retrying
+    connection errors, timeouts and 5xx / 429 with jittered backoff.
+
+    budget caps the whole call, retries included (seconds, default
+    Config.UPSTREAM_TIMEOUT). Returns the response, including 4xx ones;
+    raises UpstreamError once the attempts or the budget run out.
+    """
+    import requests
+
+    circuit = breaker(endpoint)
+    budget = budget or Config.UPSTREAM_TIMEOUT
+    retries = Config.UPSTREAM_RETRIES if retries is None else retries
+    deadline = time.monotonic() + budget
+    error = None
+
+    for attempt in range(retries + 1):
+        circuit.allow()
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        try:
+            r = requests.get(url, headers=headers, timeout=remaining)
+        except requests.RequestException as e:
+            error = str(e)
+        else:
+            if r.status_code not in RETRY_STATUSES:
+                circuit.record_success()
+                return r
+            error = f"{r.status_code} {r.reason}"
+
+        circuit.record_failure()
+        print(f"⚠ Decipher {endpoint} attempt {attempt + 1} failed: {error}")
+
+        pause = backoff(attempt)
+        if attempt == retries or time.monotonic() + pause >= deadline:
+            break
+        time.sleep(pause)
+
+    raise UpstreamError(
+        f"Decipher {endpoint} unavailable: {error or 'latency budget exceeded'}",
+        retry_after=Config.BREAKER_RESET_SECONDS
+    )
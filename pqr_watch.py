@@ -0,0 +1,197 @@
+import argparse
+import hashlib
+import os
+import time
+
+from PQR import generate_word_from_survey
+from pqr_diff import SurveyDiff, SurveySnapshot
+from pqr_renderers import get_renderer
+from pqr_survey import Survey
+from pqr_template import warm_up
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds between directory scans
+POLL_INTERVAL = 0.2
+
+# A file is rendered once it has not changed for this long (editors often
+# write a file in several steps)
+DEBOUNCE = 0.3
+
+
+# =========================
+# WATCHER
+# =========================
+class SurveyWatcher:
+    """
+    Polls input_dir for *.xml changes (mtime / size, then content hash) and
+    re-renders the matching survey_<name>.<ext> files in output_dir.
+
+    Per file it keeps the content hash and the export snapshot of the last
+    render, so touched-but-unchanged files and edits that do not change the
+    export are skipped.
+    """
+
+    def __init__(self, input_dir, output_dir, formats=("docx",),
+                 interval=POLL_INTERVAL, debounce=DEBOUNCE):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.formats = list(formats)
+        self.interval = interval
+        self.debounce = debounce
+        self.files = {}
+
+        # Fails early on an unknown format
+        self.renderers = {fmt: get_renderer(fmt) for fmt in self.formats}
+
+    def output_path(self, xml_path, fmt):
+        name = os.path.splitext(os.path.basename(xml_path))[0]
+        renderer = self.renderers[fmt]
+        extension = renderer.extension if renderer else "docx"
+        return os.path.join(self.output_dir, f"survey_{name}.{extension}")
+
+    def is_up_to_date(self, xml_path, mtime):
+        for fmt in self.formats:
+            path = self.output_path(xml_path, fmt)
+            if not os.path.exists(path) or os.path.getmtime(path) < mtime:
+                return False
+        return True
+
+    def scan(self):
+        """
+        Returns the files whose last change is older than the debounce delay
+        """
+        now = time.monotonic()
+        seen = set()
+
+        for entry in os.scandir(self.input_dir):
+            # Dot files are editor locks / swap files and in-flight API exports
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            if not entry.name.lower().endswith(".xml"):
+                continue
+
+            st = entry.stat()
+            signature = (st.st_mtime_ns, st.st_size)
+            seen.add(entry.path)
+
+            state = self.files.get(entry.path)
+            if state is None:
+                # First sight: only render when the outputs are stale
+                stale = not self.is_up_to_date(entry.path, st.st_mtime)
+                self.files[entry.path] = {
+                    "signature": signature,
+                    "changed_at": now if stale else None,
+                    "hash": None,
+                    "snapshot": None,
+                }
+            elif signature != state["signature"]:
+                state["signature"] = signature
+                state["changed_at"] = now
+
+        for path in set(self.files) - seen:
+            del self.files[path]
+
+        return [
+            path for path, state in self.files.items()
+            if state["changed_at"] is not None and now - state["changed_at"] >= self.debounce
+        ]
+
+    def render(self, xml_path):
+        state = self.files[xml_path]
+        state["changed_at"] = None
+        name = os.path.basename(xml_path)
+
+        with open(xml_path, "rb") as f:
+            data = f.read()
+
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == state["hash"]:
+            return
+
+        start = time.time()
+        survey = Survey.from_string(data)
+        snapshot = SurveySnapshot(survey)
+        previous = state["snapshot"]
+
+        if previous is not None:
+            if previous.fingerprint == snapshot.fingerprint:
+                state["hash"] = digest
+                print(f"⏭ {name}: no export changes")
+                return
+            summary = SurveyDiff(previous, snapshot).summary()
+            print(f"✏️ {name}: {summary}")
+
+        for fmt, renderer in self.renderers.items():
+            path = self.output_path(xml_path, fmt)
+            tmp_path = path + ".tmp"
+
+            # Written next to the target and swapped in, so a document that
+            # is open for reading never sees a half written file
+            try:
+                if renderer is None:
+                    generate_word_from_survey(survey, tmp_path)
+                else:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        for chunk in renderer.stream(survey):
+                            f.write(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        # Only remembered once every output is written, a failed render is
+        # retried on the next save
+        state["hash"] = digest
+        state["snapshot"] = snapshot
+        print(f"✅ {name} rendered in {time.time() - start:.2f}s")
+
+    def run(self):
+        warm_up()
+        print(f"👀 Watching {self.input_dir} → {self.output_dir} ({', '.join(self.formats)})")
+
+        while True:
+            # A scan fails when input_dir is briefly unavailable (network
+            # share, file deleted mid-scan); the next poll tries again
+            try:
+                changed = self.scan()
+            except OSError as e:
+                print(f"⚠ Scan of {self.input_dir} failed: {e}")
+                changed = []
+
+            for xml_path in changed:
+                try:
+                    self.render(xml_path)
+                except Exception as e:
+                    print(f"❌ {os.path.basename(xml_path)}: {e}")
+            time.sleep(self.interval)
+
+
+# =========================
+# CLI
+# =========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-render surveys in input/ whenever they change")
+    parser.add_argument("--input", default=os.path.join(BASE_DIR, "input"))
+    parser.add_argument("--output", default=os.path.join(BASE_DIR, "output"))
+    parser.add_argument("--format", default="docx", help="comma separated: docx, json, md, html")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE)
+    args = parser.parse_args()
+
+    os.makedirs(args.input, exist_ok=True)
+    os.makedirs(args.output, exist_ok=True)
+
+    watcher = SurveyWatcher(
+        args.input,
+        args.output,
+        formats=[fmt.strip() for fmt in args.format.split(",") if fmt.strip()],
+        interval=args.interval,
+        debounce=args.debounce,
+    )
+
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Stopped watching")
@@ -32,8 +32,13 @@ async function lookup() {
 
         const exportButton = document.createElement("button");
         exportButton.textContent = "Export word document survey draft";
-        exportButton.onclick = () => exportSurvey(s.path.split("/")[2]);
+        exportButton.onclick = () => exportSurvey(s.path.split("/")[2], exportButton);
         actionCell.appendChild(exportButton);
+
+        const previewButton = document.createElement("button");
+        previewButton.textContent = "Preview";
+        previewButton.onclick = () => previewSurvey(s.path.split("/")[2]);
+        actionCell.appendChild(previewButton);
       });
     } else {
       const row = resultsTable.insertRow();
@@ -50,14 +55,123 @@ async function lookup() {
   }
 }
 
-async function exportSurvey(surveyId) {
-  const res = await fetch("/api/export", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ survey_id: surveyId })
-  });
+// =========================
+// EXPORT (with live progress)
+// =========================
+// Surveys with an export running; clicking Export again does nothing
+const exportsInFlight = new Set();
+const FINAL_PHASES = ["done", "failed", "cancelled"];
+
+function newExportId() {
+  if (window.crypto && crypto.randomUUID) {
+    return crypto.randomUUID();
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+function showProgress(p) {
+  const box = document.getElementById("progress");
+  box.style.display = "block";
+
+  const total = p.questions_total || 0;
+  let percent = total ? Math.floor(100 * p.questions_done / total) : 0;
+  if (p.phase === "done") {
+    percent = 100;
+  }
+  box.querySelector(".progress-bar").style.width = `${percent}%`;
+
+  let text = p.phase;
+  if (p.blocks_total) {
+    text += ` – blocks ${p.blocks_done}/${p.blocks_total}`;
+  }
+  if (total) {
+    text += `, questions ${p.questions_done}/${total}`;
+  }
+  if (p.bytes) {
+    text += `, ${Math.round(p.bytes / 1024)} KB`;
+  }
+  if (p.error) {
+    text += ` (${p.error})`;
+  }
+  box.querySelector(".progress-text").textContent = text;
+}
+
+function watchProgress(exportId) {
+  const source = new EventSource(`/api/export/${exportId}/progress`);
+  source.onmessage = (event) => {
+    const p = JSON.parse(event.data);
+    showProgress(p);
+    if (FINAL_PHASES.includes(p.phase)) {
+      source.close();
+    }
+  };
+  // Export never started (e.g. rejected before it was registered)
+  source.addEventListener("missing", () => source.close());
+  return source;
+}
+
+async function exportSurvey(surveyId, button) {
+  if (exportsInFlight.has(surveyId)) {
+    return;
+  }
+  exportsInFlight.add(surveyId);
+  if (button) {
+    button.disabled = true;
+  }
+
+  try {
+    await runExport(surveyId);
+  } finally {
+    exportsInFlight.delete(surveyId);
+    if (button) {
+      button.disabled = false;
+    }
+  }
+}
+
+async function runExport(surveyId) {
+  const exportId = newExportId();
+  const payload = { survey_id: surveyId, export_id: exportId };
+
+  // Only the listed blocks / questions, otherwise the te1 ... b3 range
+  const labels = document.getElementById("labels").value.trim();
+  if (labels) {
+    payload.labels = labels;
+  }
+  if (document.getElementById("expand-loops").checked) {
+    payload.expand_loops = true;
+  }
+  if (document.getElementById("sample").checked) {
+    payload.sample = true;
+  }
+  if (document.getElementById("toc").checked) {
+    payload.toc = true;
+  }
+  const profile = document.getElementById("profile").value;
+  if (profile !== "full") {
+    payload.profile = profile;
+  }
+
+  const progress = watchProgress(exportId);
+  let blob, staleAge;
+  try {
+    const res = await fetch("/api/export", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload)
+    });
 
-  const blob = await res.blob();
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({}));
+      alert(err.error || `Export failed (${res.status})`);
+      return;
+    }
+
+    blob = await res.blob();
+    staleAge = res.headers.get("X-Survey-Stale");
+  } finally {
+    progress.close();
+  }
   const url = window.URL.createObjectURL(blob);
 
   const a = document.createElement("a");
@@ -68,4 +182,82 @@ async function exportSurvey(surveyId) {
   a.remove();
 
   window.URL.revokeObjectURL(url);
-}
\ No newline at end of file
+
+  // Decipher was unavailable: exported from the last copy fetched
+  if (staleAge !== null) {
+    alert(`Decipher is unavailable, this export uses the survey as it was ${Math.ceil(staleAge / 60)} min ago.`);
+  }
+}
+
+// =========================
+// PREVIEW (outline first, blocks on demand)
+// =========================
+async function previewSurvey(surveyId) {
+  const container = document.getElementById("preview");
+  container.style.display = "block";
+  container.innerHTML = "<p class=\"loading\">Loading outline...</p>";
+
+  try {
+    const res = await fetch("/api/preview", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ survey_id: surveyId })
+    });
+    const data = await res.json();
+
+    container.innerHTML = "";
+    const title = document.createElement("h3");
+    title.textContent = data.name;
+    container.appendChild(title);
+    container.appendChild(renderOutline(data.outline, surveyId, data.version));
+  } catch (error) {
+    console.error("Error during preview:", error);
+    container.innerHTML = "<p class=\"error\">Could not load the preview.</p>";
+  }
+}
+
+function renderOutline(nodes, surveyId, version) {
+  const list = document.createElement("div");
+
+  nodes.forEach(node => {
+    if (node.kind === "question") {
+      const item = document.createElement("div");
+      item.className = node.hidden ? "outline-question hidden" : "outline-question";
+      item.textContent = `${node.label} (${node.type})`;
+      list.appendChild(item);
+      return;
+    }
+
+    const section = document.createElement("details");
+    const summary = document.createElement("summary");
+    summary.textContent = node.kind === "loop" ? `🔁 Loop: ${node.label}` : `📦 Block: ${node.label}`;
+    section.appendChild(summary);
+
+    const content = document.createElement("div");
+    content.className = "section-content";
+    content.appendChild(renderOutline(node.children, surveyId, version));
+    section.appendChild(content);
+
+    // Render the block HTML only the first time it is expanded
+    section.addEventListener("toggle", async () => {
+      if (!section.open || section.dataset.loaded) {
+        return;
+      }
+      section.dataset.loaded = "1";
+      content.innerHTML = "<p class=\"loading\">Rendering...</p>";
+
+      const res = await fetch(`/api/preview/${encodeURIComponent(surveyId)}/${node.id}?v=${version}`);
+      if (res.ok) {
+        content.innerHTML = await res.text();
+      } else {
+        const err = await res.json();
+        content.textContent = err.error || "Could not render this block.";
+        delete section.dataset.loaded;
+      }
+    });
+
+    list.appendChild(section);
+  });
+
+  return list;
+}
@@ -0,0 +1,21 @@
+import pytest
+
+from app import app, export_timeout
+from config import Config
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "0", "-5", "soon"])
+def test_invalid_timeouts_are_refused(value):
+    with pytest.raises(ValueError):
+        export_timeout({"timeout": value})
+
+
+def test_timeout_is_capped():
+    assert export_timeout({}) == Config.EXPORT_TIMEOUT_SECONDS
+    assert export_timeout({"timeout": "12.5"}) == 12.5
+    assert export_timeout({"timeout": Config.EXPORT_TIMEOUT_SECONDS * 10}) == Config.EXPORT_TIMEOUT_SECONDS
+
+
+def test_nan_timeout_is_a_bad_request():
+    response = app.test_client().post("/api/export/upload?timeout=nan", data=b"<survey/>")
+    assert response.status_code == 400
@@ -0,0 +1,64 @@
+import io
+import json
+import threading
+import time
+import zipfile
+
+import pytest
+
+from pqr_batch import export_surveys
+from pqr_jobs import CancelToken, ExportCancelled, render_pool
+
+SURVEY = """<survey alt="Survey {id}"><html label="te1" where="survey">start</html>
+<radio label="Q1"><title>Question of {id}</title><row label="r1">A</row></radio>
+<html label="b3" where="survey">end</html></survey>"""
+
+
+def fetch(survey_id):
+    if survey_id == "broken":
+        raise RuntimeError("Decipher is down")
+    # Later surveys arrive first
+    time.sleep(0.3 / int(survey_id))
+    return SURVEY.format(id=survey_id)
+
+
+def test_zip_of_every_survey_with_report():
+    out = io.BytesIO()
+    report = export_surveys(["1", "broken", "2"], out, fetch=fetch, workers=2)
+
+    assert {s: info["status"] for s, info in report.items()} == {"1": "done", "broken": "failed", "2": "done"}
+    with zipfile.ZipFile(out) as z:
+        assert sorted(z.namelist()) == ["survey_1.docx", "survey_2.docx", "surveys.json"]
+        assert json.loads(z.read("surveys.json"))["broken"]["error"] == "Decipher is down"
+
+
+def test_merged_document_keeps_the_requested_order():
+    out = io.BytesIO()
+    export_surveys(["1", "2", "3"], out, merge=True, fetch=fetch, workers=3)
+
+    with zipfile.ZipFile(out) as z:
+        document = z.read("word/document.xml").decode("utf-8")
+    positions = [document.index(f"Question of {i}") for i in ("1", "2", "3")]
+    assert positions == sorted(positions)
+    assert document.index("Export report") > positions[-1]
+
+
+def test_cancel_drains_the_shared_pool():
+    cancel = CancelToken()
+    events = []
+
+    def on_progress(event):
+        events.append(event["status"])
+        if event["status"] == "rendering":
+            # From another thread, like a closed response
+            threading.Thread(target=cancel.cancel, args=("closed",)).start()
+
+    with pytest.raises(ExportCancelled):
+        export_surveys(
+            ["1", "2", "3", "4"], io.BytesIO(), fetch=fetch, workers=1,
+            cancel=cancel, on_progress=on_progress
+        )
+
+    # Surveys that had not started were dropped, the running one waited for
+    assert events.count("rendering") < 4
+    assert not render_pool()._pending_work_items
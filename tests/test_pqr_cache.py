@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+import pqr_cache
+from config import Config
+from pqr_cache import ExportCache, Prefetcher, content_key
+
+SURVEY = """<survey alt="Cache"><html label="te1" where="survey">start</html>
+<radio label="Q1"><title>{title}</title><row label="r1">A</row></radio>
+<html label="b3" where="survey">end</html></survey>"""
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "SEARCH_INDEX_ON_FETCH", False)
+    return ExportCache(str(tmp_path))
+
+
+# =========================
+# EXPORT CACHE
+# =========================
+def test_xml_round_trip(cache):
+    cache.put_xml("240101", SURVEY)
+
+    xml_content, age = cache.cached_xml("240101")
+    assert xml_content == SURVEY
+    assert age < 5
+    assert cache.fresh_xml("240101", max_age=60) == SURVEY
+    assert cache.fresh_xml("240101", max_age=0) is None
+    assert cache.cached_xml("240102") is None
+
+
+def test_unsafe_survey_ids_are_ignored(cache, tmp_path):
+    cache.put_xml("../240101", SURVEY)
+    assert cache.cached_xml("../240101") is None
+    assert not (tmp_path / "240101.xml").exists()
+
+
+def test_render_is_keyed_by_content(cache, monkeypatch):
+    old = SURVEY.format(title="Old")
+    path = cache.render(old)
+    assert cache.get(old) == path
+    assert content_key(old) in path
+
+    # Cached: no second render
+    monkeypatch.setattr("PQR.generate_word_from_survey", None)
+    assert cache.render(old) == path
+    assert cache.get(SURVEY.format(title="New")) is None
+
+
+# =========================
+# PREFETCH
+# =========================
+@pytest.fixture
+def prefetchers(monkeypatch):
+    """
+    Makes Prefetchers (one worker, one queued) whose prefetches run until
+    release is set; started lists the surveys that began
+    """
+    release = threading.Event()
+    started = []
+    made = []
+
+    def prefetch(survey_id):
+        started.append(survey_id)
+        release.wait(10)
+
+    def make():
+        made.append(Prefetcher(workers=1, max_queued=1))
+        return made[-1]
+
+    monkeypatch.setattr(pqr_cache, "prefetch_survey", prefetch)
+    yield make, release, started
+
+    # Queued jobs finish before prefetch_survey is restored
+    release.set()
+    for prefetcher in made:
+        if prefetcher._executor is not None:
+            prefetcher._executor.shutdown(wait=True)
+
+
+def test_wait_is_bounded_for_a_running_prefetch(prefetchers):
+    make, release, started = prefetchers
+    prefetcher = make()
+    job = prefetcher.submit("240101")
+    while not started:
+        time.sleep(0.01)
+
+    start = time.monotonic()
+    assert prefetcher.wait("240101", timeout=0.2) is False
+    assert 0.2 <= time.monotonic() - start < 2
+
+    release.set()
+    job.result(5)
+    assert prefetcher.wait("240101", timeout=0.2) is True
+
+
+def test_queued_or_unknown_prefetch_is_not_waited_for(prefetchers):
+    prefetcher = prefetchers[0]()
+    prefetcher.submit("240101")
+    prefetcher.submit("240102")
+
+    start = time.monotonic()
+    assert prefetcher.wait("240102", timeout=5) is False
+    assert prefetcher.wait("240103", timeout=5) is False
+    assert time.monotonic() - start < 1
+
+
+def test_submit_deduplicates_and_bounds_the_queue(prefetchers):
+    prefetcher = prefetchers[0]()
+
+    first = prefetcher.submit("240101")
+    assert prefetcher.submit("240101") is first
+    assert prefetcher.submit("240102") is not None
+    assert prefetcher.submit("240103") is None
+    assert prefetcher.submit("../etc") is None
@@ -0,0 +1,51 @@
+from pqr_catalog import Catalog, build_catalog
+
+SURVEY = """<survey alt="Catalog" name="{name}">
+<define label="brands"><row label="r1">Coke</row><row label="r2">Pepsi</row><row label="r3" cond="0">Gone</row></define>
+<block label="B1">
+<radio label="Q1" cond="x"><title>Brand</title><row label="r1">Own</row><insert source="brands"/></radio>
+<checkbox label="Q2" uses="cardsort.1" where="execute"><title>Sort</title><row label="r1">A</row><col label="c1">B</col></checkbox>
+<loop label="L1" vars="v"><block label="LB1"><text label="Q3" cond="0"><title>In loop</title></text></block><looprow label="1"><loopvar name="v">x</loopvar></looprow></loop>
+</block>
+</survey>"""
+
+
+def build(tmp_path):
+    surveys = [("s1", SURVEY.format(name="One")), ("s2", SURVEY.format(name="Twö").encode("utf-8"))]
+    return build_catalog(surveys, str(tmp_path))
+
+
+def test_question_columns(tmp_path):
+    catalog = build(tmp_path)
+
+    assert catalog.survey_ids == ["s1", "s2"]
+    assert catalog.count_by("type") == {"radio": 2, "checkbox": 2, "text": 2}
+    assert catalog.count_by("uses") == {"": 4, "cardsort": 2}
+    assert catalog.count_by("loop_depth") == {0: 4, 1: 2}
+
+
+def test_summary(tmp_path):
+    summary = build(tmp_path).summary()
+
+    assert summary["surveys"] == 2
+    assert summary["questions"] == 6
+    # Q1: 1 own row + 2 inserted (the cond="0" row is left out); Q2: 1 row + 1 col
+    assert summary["options"]["total"] == 10
+    assert summary["options"]["inserted"] == 4
+    assert summary["hidden"] == 2
+    assert summary["disabled"] == 2
+    assert summary["with_cond"] == 4
+
+
+def test_round_trip_and_bytes(tmp_path):
+    build(tmp_path)
+    catalog = Catalog.load(str(tmp_path))
+
+    sizes = list(catalog.column("surveys", "bytes"))
+    # Sizes are in bytes whether the XML came as str or bytes
+    assert sizes[1] == sizes[0] + 1
+    assert set(catalog.survey_costs()) == {"s1", "s2"}
+
+
+def test_missing_catalog(tmp_path):
+    assert Catalog.load(str(tmp_path / "none")) is None
@@ -0,0 +1,98 @@
+import io
+import zipfile
+
+import pytest
+
+import pqr_diff
+from pqr_diff import SurveyDiff, diff_options, write_diff_docx
+from pqr_survey import ExportSelection, Survey
+
+SURVEY = """<survey alt="Diff" name="diff">
+<define label="brands"><row label="r1">Coke</row><row label="r3">{r3}</row></define>
+<html label="te1" where="survey">start</html>
+<radio label="Q1"><title>Brand</title><row label="r1">Own one</row><row label="r2">Own two</row><insert source="brands"/></radio>
+<checkbox label="Q2"><title>Grouped</title><group label="g1">{g1}</group><group label="g2">Second</group><row label="r1" groups="g1">A</row><row label="r2" groups="g2">{q2r2}</row></checkbox>
+<html label="b3" where="survey">end</html>
+</survey>"""
+
+
+def survey(r3="Pepsi", g1="First", q2r2="B"):
+    return Survey.from_string(SURVEY.format(r3=r3, g1=g1, q2r2=q2r2))
+
+
+def test_duplicate_labels_are_compared_by_occurrence():
+    old = [{"label": "r1", "text": "Own"}, {"label": "r1", "text": "Inserted"}]
+    new = [{"label": "r1", "text": "Own"}, {"label": "r1", "text": "Inserted"}, {"label": "r1", "text": "Extra"}]
+
+    change = diff_options(old, new)
+
+    assert change["modified"] == []
+    assert change["removed"] == []
+    assert change["added"] == [{"label": "r1", "text": "Extra"}]
+
+
+def test_only_the_changed_inserted_row_is_reported():
+    diff = SurveyDiff.from_surveys(survey(), survey(r3="Sprite"))
+
+    assert diff.summary() == {"added": 0, "removed": 0, "modified": 1}
+    rows = diff.modified[0]["changes"]["rows"]
+    assert rows["added"] == rows["removed"] == []
+    assert [(o["label"], o["old"]["text"], o["new"]["text"]) for o in rows["modified"]] == [
+        ("r3", "Pepsi", "Sprite"),
+    ]
+
+
+def test_groups_are_compared_row_by_row():
+    diff = SurveyDiff.from_surveys(survey(), survey(q2r2="Changed"))
+
+    assert [m["label"] for m in diff.modified] == ["Q2"]
+    groups = diff.modified[0]["changes"]["groups"]
+    assert [g["label"] for g in groups["modified"]] == ["g2"]
+    rows = groups["modified"][0]["rows"]["modified"]
+    assert [(o["label"], o["new"]["text"]) for o in rows] == [("r2", "Changed")]
+
+
+def test_unchanged_survey_has_no_changes():
+    assert not SurveyDiff.from_surveys(survey(), survey()).has_changes
+
+
+def test_changes_docx_lists_group_changes():
+    diff = SurveyDiff.from_surveys(survey(), survey(g1="Renamed", q2r2="Changed"))
+    out = io.BytesIO()
+    write_diff_docx(diff, out)
+
+    with zipfile.ZipFile(out) as z:
+        document = z.read("word/document.xml").decode("utf-8")
+
+    assert "Renamed" in document
+    assert "Changed" in document
+
+
+def test_surveys_without_export_markers_are_compared_whole():
+    old = Survey.from_string('<survey alt="Bare"><radio label="Q1"><title>Old</title><row label="r1">A</row></radio></survey>')
+    new = Survey.from_string('<survey alt="Bare"><radio label="Q1"><title>New</title><row label="r1">A</row></radio></survey>')
+
+    diff = SurveyDiff.from_surveys(old, new)
+    assert diff.summary() == {"added": 0, "removed": 0, "modified": 1}
+    assert diff.modified[0]["changes"]["text"] == {"old": "Old", "new": "New"}
+
+
+def test_selection_narrows_the_comparison():
+    changed = survey(r3="Sprite", q2r2="Changed")
+
+    assert [m["label"] for m in SurveyDiff.from_surveys(survey(), changed).modified] == ["Q1", "Q2"]
+    only_q2 = SurveyDiff.from_surveys(survey(), changed, ExportSelection(labels=["Q2"]))
+    assert [m["label"] for m in only_q2.modified] == ["Q2"]
+
+
+def test_failed_changes_docx_leaves_no_file(tmp_path, monkeypatch):
+    diff = SurveyDiff.from_surveys(survey(), survey(r3="Sprite"))
+
+    def broken(value):
+        raise RuntimeError("render failed")
+
+    monkeypatch.setattr(pqr_diff, "format_value", broken)
+    path = tmp_path / "changes.docx"
+    with pytest.raises(RuntimeError):
+        write_diff_docx(diff, str(path))
+    assert not path.exists()
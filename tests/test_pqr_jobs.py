@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import pqr_jobs
+from PQR import generate_word_from_survey
+from pqr_jobs import CancelToken, ExportCancelled, ExportJobs, ExportTimedOut
+from pqr_survey import Survey
+
+SURVEY = """<survey alt="Jobs"><html label="te1" where="survey">start</html>
+<block label="B1"><radio label="Q1"><title>Q</title><row label="r1">A</row></radio></block>
+<html label="b3" where="survey">end</html></survey>"""
+
+
+def test_cancel_from_another_thread():
+    token = CancelToken()
+    token.check()
+
+    thread = threading.Thread(target=token.cancel, args=("closed",))
+    thread.start()
+    thread.join()
+
+    with pytest.raises(ExportCancelled, match="closed"):
+        token.check()
+    # The first reason sticks
+    token.cancel("superseded")
+    assert token.reason == "closed"
+
+
+def test_deadline(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(pqr_jobs.time, "monotonic", lambda: now[0])
+    token = CancelToken(timeout=5)
+
+    now[0] += 5
+    token.check()
+    now[0] += 0.1
+    with pytest.raises(ExportTimedOut):
+        token.check()
+    assert token.cancelled
+    assert token.reason == "timed out"
+
+
+def test_newer_export_supersedes_the_running_one():
+    jobs = ExportJobs()
+    first, second, other = CancelToken(), CancelToken(), CancelToken()
+
+    jobs.start(("240101", "client"), first)
+    jobs.start(("240102", "client"), other)
+    jobs.start(("240101", "client"), second)
+
+    assert first.reason == "superseded"
+    assert not second.cancelled
+    assert not other.cancelled
+
+
+def test_finishing_a_superseded_export_keeps_the_newer_one():
+    jobs = ExportJobs()
+    first, second, third = CancelToken(), CancelToken(), CancelToken()
+    key = ("240101", "client")
+
+    jobs.start(key, first)
+    jobs.start(key, second)
+    jobs.finish(key, first)
+
+    # second is still the running export of key
+    jobs.start(key, third)
+    assert second.reason == "superseded"
+
+
+def test_cancelled_render_leaves_no_file(tmp_path):
+    token = CancelToken()
+    token.cancel()
+    path = tmp_path / "survey.docx"
+
+    with pytest.raises(ExportCancelled):
+        generate_word_from_survey(Survey.from_string(SURVEY), str(path), cancel=token)
+    assert not path.exists()
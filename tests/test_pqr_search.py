@@ -0,0 +1,45 @@
+from pqr_search import connect, fts_query, index_stats, index_survey, search
+
+SURVEY = """<survey alt="Search" name="search">
+<html label="te1" where="survey">start</html>
+<block label="B1">
+<radio label="Q12b" cond="Q1.r2"><title>Brand awareness</title><row label="r1">Coke</row><row label="r2">Pepsi</row></radio>
+<text label="Q13"><title>Anything else?</title></text>
+</block>
+<html label="b3" where="survey">end</html>
+</survey>"""
+
+
+def test_words_are_quoted():
+    assert fts_query("brand awareness") == '"brand" "awareness"'
+
+
+def test_labels_stay_literal():
+    assert fts_query("Q1.r2 OR NOT") == '"Q1.r2" "OR" "NOT"'
+
+
+def test_trailing_star_keeps_prefix_search():
+    assert fts_query("aware*") == '"aware"*'
+
+
+def test_quotes_are_escaped_and_empty_words_dropped():
+    assert fts_query('say "hi" * ') == '"say" """hi"""'
+    assert fts_query("   ") == ""
+
+
+def test_index_and_search(tmp_path):
+    conn = connect(str(tmp_path / "search.sqlite"))
+    try:
+        assert index_survey("240101", SURVEY, conn=conn) > 0
+        # Same XML again: nothing to do
+        assert index_survey("240101", SURVEY, conn=conn) == 0
+
+        results = search("brand aware*", conn=conn)
+        assert results[0]["label"] == "Q12b"
+        assert results[0]["survey"] == "Search"
+
+        assert [r["label"] for r in search("pepsi", kind="option", conn=conn)] == ["r2"]
+        assert search("Q1.r2", conn=conn)[0]["cond"] == "Q1.r2"
+        assert index_stats(conn=conn)["surveys"] == 1
+    finally:
+        conn.close()
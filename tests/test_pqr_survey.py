@@ -0,0 +1,129 @@
+import io
+import zipfile
+
+import pytest
+
+from PQR import generate_word_from_survey
+from pqr_survey import (
+    OmittedOptions, PROFILES, ExportSelection, Survey, options_in_order, sample_options, walk_survey
+)
+
+SURVEY = """<survey alt="Selection" name="selection">
+<html label="intro" where="survey">not exported</html>
+<html label="te1" where="survey">start</html>
+<block label="B1">
+<radio label="Q1"><title>First</title><row label="r1">A</row></radio>
+<radio label="Q2" where="execute"><title>Hidden</title><row label="r1">A</row></radio>
+</block>
+<block label="B2">
+<radio label="Q3"><title>Third</title><row label="r1">A</row></radio>
+</block>
+<html label="b3" where="survey">end</html>
+<radio label="Q4"><title>After the range</title><row label="r1">A</row></radio>
+</survey>"""
+
+
+def options(*texts):
+    return [{"label": f"r{i}", "text": t} for i, t in enumerate(texts, 1)]
+
+
+def question_labels(selection=None):
+    survey = Survey.from_string(SURVEY)
+    return [ev["label"] for ev in walk_survey(survey, selection) if ev["kind"] == "question"]
+
+
+# =========================
+# SELECTION
+# =========================
+def test_default_selection_is_the_te1_b3_range():
+    assert ExportSelection().is_default
+    assert question_labels() == ["Q1", "Q2", "Q3"]
+
+
+def test_labels_and_pattern():
+    assert question_labels(ExportSelection(labels=["B2"])) == ["Q3"]
+    assert question_labels(ExportSelection(pattern=r"Q[14]")) == ["Q1", "Q4"]
+    assert not ExportSelection(labels=["B2"]).is_default
+
+
+def test_profile_without_hidden_questions():
+    assert question_labels(ExportSelection(profile="respondent-view")) == ["Q1", "Q3"]
+    assert not ExportSelection(profile="respondent-view").is_default
+    assert ExportSelection(profile=PROFILES["full"]).is_default
+
+
+def test_invalid_profile():
+    with pytest.raises(ValueError):
+        ExportSelection(profile="everything")
+
+
+def test_invalid_sample():
+    with pytest.raises(ValueError):
+        ExportSelection(sample=(5, -1))
+    with pytest.raises(ValueError):
+        ExportSelection(sample=(5,))
+
+
+# =========================
+# SAMPLED OPTIONS
+# =========================
+def test_short_lists_come_back_whole():
+    items = options("A", "B", "C")
+    assert sample_options(items, 2, 1) == items
+
+
+def test_sample_keeps_both_ends_and_counts_the_rest():
+    items = options(*"ABCDEFGH")
+    sampled = sample_options(items, 2, 1)
+
+    assert [o["text"] for o in sampled if not isinstance(o, OmittedOptions)] == ["A", "B", "H"]
+    omitted = sampled[2]
+    assert omitted.as_dict() == {"more": 5, "total": 8}
+
+
+def test_sample_follows_sort_order():
+    items = options("Other", "A", "B", "C", "D") + [{"label": "na", "text": "None", "noanswer": "1"}]
+    sampled = sample_options(items, 2, 2)
+
+    # The anchored "Other" and the no-answer option sort to the end
+    assert [o["text"] for o in sampled if not isinstance(o, OmittedOptions)] == ["A", "B", "Other", "None"]
+    assert options_in_order(items) == options_in_order(items, None)
+
+
+# =========================
+# DEEP NESTING
+# =========================
+def nested(depth):
+    return (
+        '<survey alt="Deep"><html label="te1" where="survey">start</html>'
+        + "".join(f'<block label="B{i}">' for i in range(depth))
+        + '<radio label="Q1"><title>At the bottom</title><row label="r1">A</row></radio>'
+        + "</block>" * depth
+        + '<html label="b3" where="survey">end</html></survey>'
+    )
+
+
+@pytest.mark.parametrize("parse", [
+    Survey.from_string,
+    lambda xml: Survey.from_stream(io.BytesIO(xml.encode("utf-8"))),
+])
+def test_deep_survey_is_parsed_and_rendered_whole(parse):
+    survey = parse(nested(1500))
+
+    events = list(walk_survey(survey))
+    assert sum(ev["kind"] == "block_start" for ev in events) == 1500
+    assert [ev["label"] for ev in events if ev["kind"] == "question"] == ["Q1"]
+
+    out = io.BytesIO()
+    generate_word_from_survey(survey, out)
+    with zipfile.ZipFile(out) as z:
+        document = z.read("word/document.xml").decode("utf-8")
+    assert "At the bottom" in document
+    assert "B1499" in document
+
+
+def test_survey_past_the_parser_depth_limit_is_refused():
+    with pytest.raises(ValueError):
+        Survey.from_string(nested(2500))
+    with pytest.raises(ValueError):
+        Survey.from_stream(io.BytesIO(nested(2500).encode("utf-8")))
@@ -0,0 +1,61 @@
+import zipfile
+
+from lxml import etree
+
+from PQR import generate_word_from_survey
+from pqr_survey import Survey
+from pqr_toc import BOOKMARK_NAME_LENGTH, bookmark_name
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+SURVEY = """<survey alt="TOC" name="toc">
+<html label="te1" where="survey">start</html>
+<block label="B1">
+<radio label="Q1.a"><title>Dotted</title><row label="r1">A</row></radio>
+<radio label="Q1_a"><title>Underscored</title><row label="r1">A</row></radio>
+<radio label="{long}1"><title>Long one</title><row label="r1">A</row></radio>
+<radio label="{long}2"><title>Long two</title><row label="r1">A</row></radio>
+</block>
+<html label="b3" where="survey">end</html>
+</survey>""".format(long="Q_" + "x" * 40)
+
+
+def test_sanitized_labels_do_not_collide():
+    assert bookmark_name("question", "Q1.a", 1) != bookmark_name("question", "Q1_a", 1)
+
+
+def test_long_labels_with_the_same_start_do_not_collide():
+    long = "Q_" + "x" * 40
+    assert bookmark_name("question", long + "1", 1) != bookmark_name("question", long + "2", 1)
+
+
+def test_occurrence_and_kind_are_part_of_the_name():
+    names = {
+        bookmark_name("question", "B1", 1),
+        bookmark_name("question", "B1", 2),
+        bookmark_name("block", "B1", 1),
+        bookmark_name("loop", "B1", 1),
+    }
+    assert len(names) == 4
+
+
+def test_names_fit_in_word_limit():
+    for label in ("Q1", "Q" * 100, "ü" * 60):
+        for occurrence in (1, 12345):
+            name = bookmark_name("question", label, occurrence)
+            assert len(name) <= BOOKMARK_NAME_LENGTH
+            assert name.startswith("_Q_")
+
+
+def test_every_entry_links_to_its_own_bookmark(tmp_path):
+    path = tmp_path / "toc.docx"
+    generate_word_from_survey(Survey.from_string(SURVEY), str(path), toc=True)
+
+    with zipfile.ZipFile(path) as z:
+        body = etree.fromstring(z.read("word/document.xml"))
+
+    bookmarks = [b.get(W + "name") for b in body.iter(W + "bookmarkStart")]
+    links = [h.get(W + "anchor") for h in body.iter(W + "hyperlink")]
+
+    assert len(bookmarks) == len(set(bookmarks)) == 5
+    assert sorted(links) == sorted(bookmarks)
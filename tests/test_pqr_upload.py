@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+from config import Config
+from pqr_upload import UploadRefused, parse_upload
+
+ROW = b'<row label="r1">An option with some text</row>'
+SURVEY = b'<survey alt="Upload"><radio label="Q1"><title>Q</title>' + ROW * 50000 + b"</radio></survey>"
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+def test_upload_limit_states_the_limit(monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_MAX_MB", 1)
+    monkeypatch.setattr(Config, "EXPORT_MEMORY_BUDGET_MB", 0)
+
+    with pytest.raises(UploadRefused) as e:
+        parse_upload(io.BytesIO(SURVEY), "html", content_length=len(SURVEY))
+    assert e.value.refusal == {"error": "Upload too large: survey.xml may be at most 1 MB.", "limit_mb": 1}
+
+
+def test_memory_budget_stops_reading_early(monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_MAX_MB", 0)
+    # Room for about 200 KB of XML in a docx export
+    monkeypatch.setattr(Config, "EXPORT_MEMORY_BUDGET_MB", 20)
+    stream = CountingStream(SURVEY)
+
+    with pytest.raises(UploadRefused) as e:
+        parse_upload(stream, "docx")
+    assert e.value.refusal["budget_mb"] == 20
+    assert stream.read_bytes < len(SURVEY)
+
+
+def test_upload_within_limits(monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_MAX_MB", 100)
+    monkeypatch.setattr(Config, "EXPORT_MEMORY_BUDGET_MB", 0)
+
+    survey, scan = parse_upload(io.BytesIO(SURVEY), "docx", content_length=len(SURVEY))
+    assert scan["bytes"] == len(SURVEY)
+    assert survey.name == "Upload"
@@ -0,0 +1,74 @@
+import pytest
+
+import pqr_upstream
+from pqr_upstream import CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pqr_upstream.time, "monotonic", clock)
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    b = CircuitBreaker("files", failures=3, reset_seconds=30)
+    for _ in range(2):
+        b.allow()
+        b.record_failure()
+    assert b.state == "closed"
+
+    b.record_failure()
+    assert b.state == "open"
+    with pytest.raises(CircuitOpen) as e:
+        b.allow()
+    assert e.value.retry_after == 30
+
+
+def test_success_resets_the_failure_count(clock):
+    b = CircuitBreaker("files", failures=2, reset_seconds=30)
+    b.record_failure()
+    b.record_success()
+    b.record_failure()
+    assert b.state == "closed"
+
+
+def test_half_open_trial_closes_on_success(clock):
+    b = CircuitBreaker("files", failures=1, reset_seconds=30)
+    b.record_failure()
+
+    clock.now += 30
+    b.allow()
+    assert b.state == "half-open"
+
+    # Only the trial call goes through
+    with pytest.raises(CircuitOpen):
+        b.allow()
+
+    b.record_success()
+    assert b.state == "closed"
+    b.allow()
+
+
+def test_half_open_trial_reopens_on_failure(clock):
+    b = CircuitBreaker("files", failures=5, reset_seconds=30)
+    for _ in range(5):
+        b.record_failure()
+
+    clock.now += 31
+    b.allow()
+    b.record_failure()
+    assert b.state == "open"
+
+    clock.now += 10
+    with pytest.raises(CircuitOpen) as e:
+        b.allow()
+    assert e.value.retry_after == 20
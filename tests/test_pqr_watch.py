@@ -0,0 +1,62 @@
+import os
+
+from pqr_watch import SurveyWatcher
+
+SURVEY = """<survey alt="{name}" name="s">
+<html label="te1" where="survey">start</html>
+<radio label="Q1"><title>{title}</title><row label="r1">A</row></radio>
+<html label="b3" where="survey">end</html>
+</survey>"""
+
+
+def save(path, name="Old name", title="Question"):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(SURVEY.format(name=name, title=title))
+
+
+def rerender(watcher):
+    for path in watcher.scan():
+        watcher.render(path)
+
+
+def output(tmp_path):
+    with open(tmp_path / "out" / "survey_s.md", encoding="utf-8") as f:
+        return f.read()
+
+
+def make_watcher(tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "out").mkdir()
+    return SurveyWatcher(str(tmp_path / "in"), str(tmp_path / "out"), formats=["md"], debounce=0)
+
+
+def test_renamed_survey_is_rendered_again(tmp_path):
+    watcher = make_watcher(tmp_path)
+    xml_path = tmp_path / "in" / "s.xml"
+
+    save(xml_path)
+    rerender(watcher)
+    assert "Old name" in output(tmp_path)
+
+    save(xml_path, name="New name")
+    os.utime(xml_path, ns=(0, os.stat(xml_path).st_mtime_ns + 10**9))
+    rerender(watcher)
+    assert "New name" in output(tmp_path)
+
+
+def test_failed_render_leaves_no_tmp_file(tmp_path):
+    watcher = make_watcher(tmp_path)
+    save(tmp_path / "in" / "s.xml")
+
+    def broken(survey):
+        yield "partial"
+        raise RuntimeError("render failed")
+
+    watcher.renderers["md"].stream = broken
+    for path in watcher.scan():
+        try:
+            watcher.render(path)
+        except RuntimeError:
+            pass
+
+    assert os.listdir(tmp_path / "out") == []